@@ -0,0 +1,85 @@
+"""
+Trend chart render benchmark: one pyplot figure per metric vs the cached single-figure layer.
+
+    python -m benchmarks.bench_charts                 # 90 days and 10 years
+    python -m benchmarks.bench_charts --days 90 365 3650 --json charts.json
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import time
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from benchmarks.bench_ingest import synthetic_rows
+from src.cache import dataset_fingerprint, get_memo_cache
+from src.charts import TREND_COLUMNS, render_chart, trend_panels_figure
+from src.features import load_and_validate
+
+
+def _per_column_pyplot(df) -> None:
+    # What the Trends page did before: a new figure per metric, never closed
+    for c in TREND_COLUMNS:
+        fig = plt.figure()
+        plt.plot(df["date"], df[c])
+        plt.title(c)
+        plt.xticks(rotation=45, ha="right")
+        plt.tight_layout()
+        fig.savefig(io.BytesIO(), format="png")
+
+
+def run(days: list[int]) -> list[dict]:
+    results = []
+    for n in days:
+        df = load_and_validate(synthetic_rows(n))
+        key = dataset_fingerprint(df)
+        get_memo_cache().clear()
+
+        t0 = time.perf_counter()
+        _per_column_pyplot(df)
+        old_ms = (time.perf_counter() - t0) * 1000.0
+        open_figs = len(plt.get_fignums())
+        plt.close("all")
+
+        cold = render_chart("trends", key, False, lambda: trend_panels_figure(df))
+        t0 = time.perf_counter()
+        warm = render_chart("trends", key, False, lambda: trend_panels_figure(df))
+        warm_ms = (time.perf_counter() - t0) * 1000.0
+        assert warm["cached"]
+
+        results.append(
+            {
+                "days": n,
+                "per_column_pyplot_ms": round(old_ms, 1),
+                "leaked_figures": open_figs,
+                "single_figure_ms": round(cold["render_ms"], 1),
+                "cached_ms": round(warm_ms, 3),
+                "png_kb": round(len(cold["png"]) / 1024, 1),
+            }
+        )
+        r = results[-1]
+        print(
+            f"{n:>6} days  per-column {r['per_column_pyplot_ms']:8.1f} ms ({open_figs} figures left open)  "
+            f"single figure {r['single_figure_ms']:8.1f} ms  cached {r['cached_ms']:.3f} ms"
+        )
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--days", type=int, nargs="+", default=[90, 3650])
+    ap.add_argument("--json", type=Path, help="Write results as JSON")
+    args = ap.parse_args(argv)
+
+    results = run(args.days)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
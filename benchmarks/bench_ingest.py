@@ -0,0 +1,90 @@
+"""
+CSV vs Parquet vs Arrow IPC load benchmark (read + load_and_validate).
+
+    python -m benchmarks.bench_ingest                 # 1k, 100k, 10M rows
+    python -m benchmarks.bench_ingest --sizes 1000 100000 --compact
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.features import load_and_validate
+from src.ingest import read_table, write_table
+
+
+def synthetic_rows(n: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(8000, 1500, n).round()
+    sleep = rng.normal(7.2, 0.6, n).round(2)
+    sleep[rng.random(n) < 0.03] = np.nan
+    return pd.DataFrame(
+        {
+            "date": pd.Timestamp("2000-01-01") + pd.to_timedelta(np.arange(n), unit="D") % pd.Timedelta(days=36500),
+            "steps": steps.astype(np.int64),
+            "resting_hr": rng.normal(58, 3, n).round(1),
+            "sleep_hours": sleep,
+            "sleep_efficiency": rng.normal(0.88, 0.03, n).round(2),
+            "hrv_proxy": rng.normal(55, 6, n).round(1),
+            "wear_time_hours": rng.normal(18, 2, n).round(1),
+            "notes": np.where(rng.random(n) < 0.01, "travel", ""),
+        }
+    )
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(sizes: list[int], compact: bool = False, repeat: int = 3) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            df = synthetic_rows(n)
+            df_csv = df.assign(date=df["date"].dt.strftime("%Y-%m-%d"))
+            for fmt in ["csv", "parquet", "arrow"]:
+                path = Path(tmp) / f"rows_{n}.{fmt}"
+                write_table(df_csv if fmt == "csv" else df, path)
+                reps = repeat if n <= 1_000_000 else 1
+                read_s = _time(lambda: read_table(path), reps)
+                total_s = _time(lambda: load_and_validate(read_table(path), compact=compact), reps)
+                results.append(
+                    {
+                        "rows": n,
+                        "format": fmt,
+                        "file_mb": round(path.stat().st_size / 1e6, 2),
+                        "read_s": round(read_s, 4),
+                        "read_validate_s": round(total_s, 4),
+                        "compact": compact,
+                    }
+                )
+                print(f"{n:>10} {fmt:>8} {results[-1]['file_mb']:>9} MB  read {read_s:8.4f}s  read+validate {total_s:8.4f}s")
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 10_000_000])
+    ap.add_argument("--compact", action="store_true", help="Validate with compact dtypes")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", type=Path, help="Write results as JSON")
+    args = ap.parse_args(argv)
+
+    results = run(args.sizes, compact=args.compact, repeat=args.repeat)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
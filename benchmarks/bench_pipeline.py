@@ -0,0 +1,239 @@
+"""
+Deterministic pipeline benchmark on simulated data, with baseline comparison.
+
+    python -m benchmarks.bench_pipeline --json bench.json             # full run, save results
+    python -m benchmarks.bench_pipeline --quick --baseline bench.json  # compare, exit 1 on regression
+
+Single user (14/90/365/3650 days): generate_simulated_user, load_and_validate,
+compute_features, determine_escalation, the prompt builders and one
+generate_text round-trip against the local stub LLM server (never the network).
+Cohort (1k/10k/100k users): generate_simulated_cohort, load_and_validate,
+cohort_feature_table, escalation_from_table and per-user prompt building.
+Each case records median/p95 wall time and peak traced memory (tracemalloc,
+measured in a separate untimed run so tracing does not inflate the timings).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.features import load_and_validate, compute_features, cohort_feature_table, feature_table_to_dicts
+from src.prompts import (
+    SYSTEM_BASE,
+    build_user_summary_prompt,
+    build_clinician_note_prompt,
+    build_clarifying_question_prompt,
+)
+from src.rules import determine_escalation, escalation_from_table
+from src.simulate import SimConfig, generate_simulated_user, generate_simulated_cohort
+
+
+SINGLE_DAYS = [14, 90, 365, 3650]
+COHORT_USERS = [1_000, 10_000, 100_000]
+QUICK_DAYS = [14, 90]
+QUICK_USERS = [1_000]
+
+
+def _measure(fn, repeat: int, memory: bool = True) -> dict:
+    if repeat > 1:
+        fn()  # warm-up: imports, connection setup, allocator
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    out = {
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(float(np.percentile(times, 95)), 3),
+        "repeat": repeat,
+    }
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            out["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        finally:
+            tracemalloc.stop()
+    return out
+
+
+def _build_prompts(features: dict, escalation: dict) -> list[str]:
+    return [
+        build_user_summary_prompt(features, escalation, None),
+        build_clinician_note_prompt(features, escalation, None),
+        build_clarifying_question_prompt(features, escalation),
+    ]
+
+
+def single_user(days: list[int], repeat: int, use_stub: bool = True) -> list[dict]:
+    results = []
+    for n in days:
+        raw = generate_simulated_user(SimConfig(days=n, seed=7, profile="flu_like"))
+        df = load_and_validate(raw)
+        features = compute_features(df)
+        escalation = determine_escalation(features)
+        prompt = build_user_summary_prompt(features, escalation, None)
+
+        def end_to_end() -> None:
+            f = compute_features(load_and_validate(raw))
+            _build_prompts(f, determine_escalation(f))
+
+        reps = repeat if n <= 365 else max(1, repeat // 3)
+        cases = {
+            "generate_simulated_user": lambda: generate_simulated_user(SimConfig(days=n, seed=7, profile="flu_like")),
+            "load_and_validate": lambda: load_and_validate(raw),
+            "compute_features": lambda: compute_features(df),
+            "determine_escalation": lambda: determine_escalation(features),
+            "prompts": lambda: _build_prompts(features, escalation),
+            "end_to_end": end_to_end,
+        }
+        if use_stub:
+            from src.llm import generate_text
+
+            cases["generate_text_stub"] = lambda: generate_text(prompt, SYSTEM_BASE, use_cache=False)
+
+        for stage, fn in cases.items():
+            r = {"id": f"single/{stage}/days={n}", "suite": "single", "stage": stage, "days": n}
+            r.update(_measure(fn, reps))
+            results.append(r)
+            print(f"single  {stage:>24} {n:>6} days  median {r['median_ms']:10.3f} ms  p95 {r['p95_ms']:10.3f} ms  peak {r['peak_mb']:8.2f} MB")
+    return results
+
+
+def cohort(users: list[int], days: int, repeat: int) -> list[dict]:
+    results = []
+    for n in users:
+        raw = generate_simulated_cohort(n, days=days, profile_mix={"normal": 0.7, "flu_like": 0.1, "stressed": 0.1, "missing_wear": 0.1})
+        df = load_and_validate(raw)
+        table = cohort_feature_table(df)
+        esc = escalation_from_table(table)
+
+        def prompts() -> None:
+            features = feature_table_to_dicts(table)
+            for user, e in esc.to_dict("index").items():
+                build_user_summary_prompt(features[user], e, None)
+
+        reps = repeat if n <= 10_000 else 1
+        cases = {
+            "generate_simulated_cohort": lambda: generate_simulated_cohort(n, days=days),
+            "load_and_validate": lambda: load_and_validate(raw),
+            "cohort_feature_table": lambda: cohort_feature_table(df),
+            "escalation_from_table": lambda: escalation_from_table(table),
+            "prompts": prompts,
+        }
+        for stage, fn in cases.items():
+            r = {"id": f"cohort/{stage}/users={n}", "suite": "cohort", "stage": stage, "users": n, "days": days}
+            r.update(_measure(fn, reps))
+            r["users_per_s"] = round(n / (r["median_ms"] / 1000.0), 1) if r["median_ms"] else None
+            results.append(r)
+            print(f"cohort  {stage:>24} {n:>7} users  median {r['median_ms']:10.1f} ms  {r['users_per_s']:>12} users/s  peak {r['peak_mb']:8.2f} MB")
+    return results
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float, min_ms: float = 5.0) -> list[dict]:
+    """
+    Cases whose median time or peak memory grew by more than `threshold`
+    (a fraction, e.g. 0.25 = 25%) relative to the baseline with the same id.
+    Timings below `min_ms` are too noisy to compare and are skipped.
+    """
+    base = {r["id"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(r["id"])
+        if b is None:
+            continue
+        for metric in ["median_ms", "peak_mb"]:
+            if r.get(metric) is None or not b.get(metric):
+                continue
+            if metric == "median_ms" and r[metric] < min_ms:
+                continue
+            ratio = r[metric] / b[metric]
+            if ratio > 1.0 + threshold:
+                regressions.append({"id": r["id"], "metric": metric, "baseline": b[metric], "current": r[metric], "ratio": round(ratio, 3)})
+    return regressions
+
+
+def _environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+    }
+
+
+def run(days: list[int], users: list[int], cohort_days: int = 30, repeat: int = 5, use_stub: bool = True) -> dict:
+    results = []
+    if use_stub:
+        from src.llm import reset_client
+        from src.stub_llm import StubLLMServer
+
+        # Point the shared client at the local stub (memory-only response
+        # cache, so nothing is written to .cache/); env is restored afterwards
+        saved = {k: os.environ.get(k) for k in ["OPENAI_BASE_URL", "OPENAI_API_KEY", "LLM_CACHE_PATH"]}
+        with StubLLMServer() as stub:
+            os.environ["OPENAI_BASE_URL"] = stub.base_url
+            os.environ["OPENAI_API_KEY"] = "stub"
+            os.environ["LLM_CACHE_PATH"] = ""
+            reset_client()
+            try:
+                results += single_user(days, repeat, use_stub=True)
+            finally:
+                reset_client()
+                for k, v in saved.items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+    else:
+        results += single_user(days, repeat, use_stub=False)
+    results += cohort(users, cohort_days, max(1, repeat // 2))
+    return {"environment": _environment(), "results": results}
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--days", type=int, nargs="+", default=None, help=f"Single-user history lengths (default {SINGLE_DAYS})")
+    ap.add_argument("--users", type=int, nargs="+", default=None, help=f"Cohort sizes (default {COHORT_USERS})")
+    ap.add_argument("--cohort-days", type=int, default=30)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--quick", action="store_true", help=f"Small sizes only ({QUICK_DAYS} days, {QUICK_USERS} users)")
+    ap.add_argument("--no-llm", action="store_true", help="Skip the stub generate_text round-trip")
+    ap.add_argument("--json", type=Path, help="Write results as JSON")
+    ap.add_argument("--baseline", type=Path, help="Compare against a previously saved --json file")
+    ap.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown / memory growth vs baseline (fraction)")
+    ap.add_argument("--min-ms", type=float, default=5.0, help="Ignore timing changes of cases faster than this")
+    args = ap.parse_args(argv)
+
+    days = args.days or (QUICK_DAYS if args.quick else SINGLE_DAYS)
+    users = args.users or (QUICK_USERS if args.quick else COHORT_USERS)
+    report = run(days, users, cohort_days=args.cohort_days, repeat=args.repeat, use_stub=not args.no_llm)
+
+    status = 0
+    if args.baseline:
+        regressions = compare(report["results"], json.loads(args.baseline.read_text())["results"], args.threshold, args.min_ms)
+        report["baseline"] = {"path": str(args.baseline), "threshold": args.threshold, "regressions": regressions}
+        for reg in regressions:
+            print(f"REGRESSION {reg['id']} {reg['metric']}: {reg['baseline']} -> {reg['current']} (x{reg['ratio']})")
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%} vs {args.baseline}")
+        status = 1 if regressions else 0
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Equivalence check for the batched cohort features.
+
+    python -m benchmarks.check_cohort
+
+compute_features_cohort must return, for every user, exactly the dict
+compute_features returns for that user alone: same keys (delta_pct present
+or absent alike), same values, NaN where compute_features has NaN. Users
+cover every profile and lengths, plus NaN-heavy variants: random gaps, a
+metric missing for the whole last 7 days, a zero baseline and a history
+too short to be included. Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from src.features import NUM_COLS, compute_features, compute_features_cohort, load_and_validate
+from src.simulate import SimConfig, generate_simulated_user
+
+
+PROFILES = ["normal", "flu_like", "stressed", "missing_wear"]
+
+
+def _same(a, b) -> bool:
+    # Dict equality where NaN equals NaN
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+
+def _nan_heavy(df: pd.DataFrame, i: int) -> pd.DataFrame:
+    rng = np.random.default_rng(1000 + i)
+    df = df.copy()
+    for c in NUM_COLS:
+        df[c] = df[c].astype(float).mask(rng.random(len(df)) < 0.4)
+    variant = i % 4
+    if variant == 0:
+        df.loc[df.index[-7:], "sleep_hours"] = np.nan
+    elif variant == 1:
+        df.loc[df.index[:-7], "steps"] = 0.0
+    elif variant == 2:
+        df.loc[df.index[-7:], ["steps", "resting_hr", "hrv_proxy"]] = np.nan
+    else:
+        df.loc[df.index[:-7], "resting_hr"] = np.nan
+    return df
+
+
+def main(n_users: int = 120) -> int:
+    failures = []
+    frames, expected = [], {}
+    for i in range(n_users):
+        raw = generate_simulated_user(SimConfig(days=8 + i % 50, seed=i, profile=PROFILES[i % len(PROFILES)]))
+        for user, df in [(f"u{i}", raw), (f"u{i}_nan", _nan_heavy(raw, i))]:
+            df = load_and_validate(df)
+            if len(df) >= 10:
+                expected[user] = compute_features(df)
+            frames.append(df.assign(user_id=user))
+
+    got = compute_features_cohort(pd.concat(frames, ignore_index=True))
+    if got.keys() != expected.keys():
+        failures.append(f"users differ: {sorted(got.keys() ^ expected.keys())[:5]}")
+    for user in expected.keys() & got.keys():
+        if not _same(got[user], expected[user]):
+            diff = [k for k in expected[user] if not _same(got[user].get(k), expected[user][k])]
+            failures.append(f"{user}: {diff} differ")
+
+    for f in failures[:20]:
+        print("FAIL", f)
+    print(f"{len(expected)} users: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
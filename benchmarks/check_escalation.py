@@ -0,0 +1,102 @@
+"""
+Equivalence check: table-driven escalation vs determine_escalation.
+
+    python -m benchmarks.check_escalation
+
+Enumerates coverage values on both sides of every CONFIDENCE_RULES threshold
+and every combination of flag severities (none / moderate / high) over the
+flag types, then requires determine_escalation_many and escalation_from_table
+to return exactly what determine_escalation does. Also requires every
+CONFIDENCE_RULES and ESCALATION_RULES row to be hit at least once.
+Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import itertools
+import sys
+
+import pandas as pd
+
+from src.features import FLAG_TYPES
+from src.rules import (
+    CONFIDENCE_RULES,
+    ESCALATION_RULES,
+    determine_escalation,
+    determine_escalation_many,
+    escalation_from_table,
+)
+
+
+DAYS_PRESENT = [5, 6, 7]
+WEAR_OK_DAYS = [3, 4, 7]
+MISSING_SLEEP_DAYS = [0, 1, 2]
+SEVERITIES = [None, "moderate", "high"]
+# Flag types that matter by name (the rest only count towards n_high / n_moderate)
+NAMED = ["RHR_ELEVATED", "SLEEP_REDUCED"]
+OTHER = [t for t in FLAG_TYPES if t not in NAMED][:2]
+
+
+def feature_cases() -> list[dict]:
+    cases = []
+    for days, wear, missing in itertools.product(DAYS_PRESENT, WEAR_OK_DAYS, MISSING_SLEEP_DAYS):
+        for sevs in itertools.product(SEVERITIES, repeat=len(NAMED) + len(OTHER)):
+            flags = [
+                {"type": t, "severity": s, "rationale": f"{t} {s}"}
+                for t, s in zip(NAMED + OTHER, sevs) if s is not None
+            ]
+            cases.append({
+                "coverage": {
+                    "days_present": days,
+                    "wear_ok_days": min(wear, days),
+                    "missing_sleep_days": missing,
+                    "missing_any_core_days": 0,
+                },
+                "flags": flags,
+            })
+    return cases
+
+
+def _table(cases: list[dict]) -> pd.DataFrame:
+    rows = []
+    for f in cases:
+        row = {k: f["coverage"][k] for k in ["days_present", "wear_ok_days", "missing_sleep_days"]}
+        row.update({f"flag_{t}": "" for t in FLAG_TYPES})
+        row.update({f"flag_{fl['type']}": fl["severity"] for fl in f["flags"]})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main() -> int:
+    cases = feature_cases()
+    expected = [determine_escalation(f) for f in cases]
+    many = determine_escalation_many(cases)
+    table = escalation_from_table(_table(cases))
+
+    failures = []
+    for i, (f, want, got) in enumerate(zip(cases, expected, many)):
+        if got != want:
+            failures.append(f"determine_escalation_many case {i}: {f} -> {got}, expected {want}")
+        row = table.iloc[i]
+        if (row["level"], row["confidence"], [row["rationale"]]) != (want["level"], want["confidence"], want["rationale"]):
+            failures.append(f"escalation_from_table case {i}: {f} -> {dict(row)}, expected {want}")
+
+    seen_conf = {e["confidence"] for e in expected}
+    for value, _ in CONFIDENCE_RULES:
+        if value not in seen_conf:
+            failures.append(f"CONFIDENCE_RULES row {value!r} never hit")
+    seen_rationale = {e["rationale"][0] for e in expected}
+    for level, rationale, _ in ESCALATION_RULES:
+        if rationale not in seen_rationale:
+            failures.append(f"ESCALATION_RULES row ({level}) {rationale!r} never hit")
+
+    if not escalation_from_table(_table([]).reindex(columns=_table(cases[:1]).columns)).empty:
+        failures.append("escalation_from_table on an empty table is not empty")
+
+    for f in failures[:20]:
+        print("FAIL", f)
+    print(f"{len(cases)} cases: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Equivalence check for the declarative flag rules.
+
+    python -m benchmarks.check_flags
+
+DEFAULT_FLAG_RULES must flag exactly like the original hard-coded checks
+(reference_flags below):
+  - on a grid of edge cases: NaN and zero MAD scale, NaN values and
+    baselines, values exactly on each threshold and band edge (including
+    ACTIVITY_DOWN's 0.7 / 0.55 ratios) and just either side of them;
+  - on simulated users of every profile, through compute_features, with
+    the same rationale text.
+Batched threshold variants (compile_flag_rules([...]).evaluate) must also
+give the same flags as compute_features(rules=variant) for each variant.
+Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import sys
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from src.features import (
+    DEFAULT_FLAG_RULES,
+    SEVERITIES,
+    cohort_feature_table,
+    compile_flag_rules,
+    compute_features,
+    load_and_validate,
+)
+from src.simulate import SimConfig, generate_simulated_user
+
+
+PROFILES = ["normal", "flu_like", "stressed", "missing_wear"]
+
+
+def reference_flags(row: dict) -> list[tuple[str, str, str]]:
+    """
+    The flag logic as it was written before FlagRule, over a feature row.
+    """
+    flags = []
+    rhr_base, rhr_last7 = row["resting_hr_baseline_median"], row["resting_hr_last7_avg"]
+    rhr_scale = row["resting_hr_mad_scale"]
+    if not np.isnan(rhr_scale) and rhr_last7 > rhr_base + max(3.0, 1.0 * rhr_scale):
+        sev = "moderate" if rhr_last7 < rhr_base + 7 else "high"
+        flags.append(("RHR_ELEVATED", sev, f"Last-7 avg {rhr_last7} vs baseline {rhr_base} bpm."))
+    sl_base, sl_last7 = row["sleep_hours_baseline_median"], row["sleep_hours_last7_avg"]
+    if not np.isnan(sl_last7) and sl_last7 < sl_base - 0.8:
+        sev = "moderate" if sl_last7 > sl_base - 1.3 else "high"
+        flags.append(("SLEEP_REDUCED", sev, f"Last-7 avg {sl_last7}h vs baseline {sl_base}h."))
+    st_base, st_last7 = row["steps_baseline_median"], row["steps_last7_avg"]
+    if not np.isnan(st_last7) and st_last7 < st_base * 0.7:
+        sev = "moderate" if st_last7 > st_base * 0.55 else "high"
+        flags.append(("ACTIVITY_DOWN", sev, f"Last-7 avg {int(st_last7)} vs baseline {int(st_base)} steps."))
+    if row["wear_ok_days"] < 4:
+        flags.append(("LOW_WEAR_TIME", "moderate", f"Wear-time ≥12h on {row['wear_ok_days']}/7 days."))
+    if row["missing_sleep_days"] >= 2:
+        flags.append(("MISSING_SLEEP", "moderate", f"Missing sleep values on {row['missing_sleep_days']}/7 days."))
+    if row["missing_any_core_days"] >= 2:
+        flags.append(("MISSING_CORE_SIGNALS", "moderate", f"Missing core signals on {row['missing_any_core_days']}/7 days."))
+    return flags
+
+
+def _neutral_row() -> dict:
+    return {
+        "resting_hr_baseline_median": 60.0, "resting_hr_last7_avg": 60.0, "resting_hr_mad_scale": 2.0,
+        "sleep_hours_baseline_median": 7.0, "sleep_hours_last7_avg": 7.0,
+        "steps_baseline_median": 8000.0, "steps_last7_avg": 8000.0,
+        "wear_ok_days": 7, "missing_sleep_days": 0, "missing_any_core_days": 0,
+    }
+
+
+def edge_rows() -> list[dict]:
+    nan = float("nan")
+    rows = []
+    for base, scale in itertools.product([60.0, 57.5, nan], [nan, 0.0, 2.0, 3.0, 5.0, 8.5]):
+        refs = [3.0, scale, 7.0, max(3.0, scale) if not math.isnan(scale) else 3.0]
+        for ref, eps in itertools.product(refs, [-0.01, 0.0, 0.01]):
+            rows.append({"resting_hr_baseline_median": base, "resting_hr_last7_avg": base + ref + eps,
+                         "resting_hr_mad_scale": scale})
+        rows.append({"resting_hr_baseline_median": base, "resting_hr_last7_avg": nan, "resting_hr_mad_scale": scale})
+    for base, ref, eps in itertools.product([7.0, 7.25, 6.55, nan], [0.8, 1.3], [-0.01, 0.0, 0.01]):
+        rows.append({"sleep_hours_baseline_median": base, "sleep_hours_last7_avg": base - ref + eps})
+    for base in [7.0, nan]:
+        rows.append({"sleep_hours_baseline_median": base, "sleep_hours_last7_avg": nan})
+    for base, ratio, eps in itertools.product([8000.0, 7333.33, 12345.67, 0.0, nan], [0.7, 0.55], [-0.01, 0.0, 0.01]):
+        rows.append({"steps_baseline_median": base, "steps_last7_avg": base * ratio + eps})
+    for base in [8000.0, 0.0]:
+        rows.append({"steps_baseline_median": base, "steps_last7_avg": nan})
+    for k in range(8):
+        rows += [{"wear_ok_days": k}, {"missing_sleep_days": k}, {"missing_any_core_days": k}]
+    return [{**_neutral_row(), **r} for r in rows]
+
+
+def _mad_scale(x: pd.Series) -> float:
+    x = x.dropna()
+    if len(x) < 5:
+        return float("nan")
+    med = float(x.median())
+    return float(np.median(np.abs(x - med))) * 1.4826
+
+
+def _feature_row(df: pd.DataFrame, features: dict) -> dict:
+    prev = df.iloc[:-7] if len(df) - 7 >= 5 else df.iloc[:-3]
+    row = {f"{m}_{k}": v for m, t in features["trends"].items() for k, v in t.items()}
+    row.update(features["coverage"], resting_hr_mad_scale=_mad_scale(prev["resting_hr"]))
+    return row
+
+
+def _variants() -> list[tuple]:
+    # Same structure, different thresholds
+    out = []
+    for rhr_off, sleep_off, steps_ratio, wear in [(3.0, -0.8, 0.7, 4), (2.0, -0.5, 0.8, 5), (5.0, -1.0, 0.6, 3), (0.0, 0.0, 1.0, 7)]:
+        rules = {r.type: r for r in DEFAULT_FLAG_RULES}
+        rules["RHR_ELEVATED"] = replace(rules["RHR_ELEVATED"], offset=rhr_off, mad=rhr_off / 3.0)
+        rules["SLEEP_REDUCED"] = replace(rules["SLEEP_REDUCED"], offset=sleep_off)
+        rules["ACTIVITY_DOWN"] = replace(rules["ACTIVITY_DOWN"], ratio=steps_ratio)
+        rules["LOW_WEAR_TIME"] = replace(rules["LOW_WEAR_TIME"], offset=wear)
+        out.append(tuple(rules[r.type] for r in DEFAULT_FLAG_RULES))
+    return out
+
+
+def main(n_users: int = 200) -> int:
+    failures = []
+
+    # Edge grid through the compiled (vectorized) rules
+    rows = edge_rows()
+    cols = {k: np.array([r[k] for r in rows]) for k in rows[0]}
+    got = compile_flag_rules().flag_columns(cols)
+    for i, row in enumerate(rows):
+        want = {t: sev for t, sev, _ in reference_flags(row)}
+        have = {r.type: got[f"flag_{r.type}"][i] for r in DEFAULT_FLAG_RULES if got[f"flag_{r.type}"][i]}
+        if have != want:
+            failures.append(f"edge row {i} {row}: {have} != {want}")
+
+    # Simulated users through compute_features, rationale included
+    frames, per_user = [], {}
+    for i in range(n_users):
+        raw = generate_simulated_user(SimConfig(days=10 + i % 60, seed=i, profile=PROFILES[i % len(PROFILES)]))
+        df = load_and_validate(raw)
+        features = compute_features(df)
+        have = [(f["type"], f["severity"], f["rationale"]) for f in features["flags"]]
+        if have != reference_flags(_feature_row(df, features)):
+            failures.append(f"user {i}: {have} != {reference_flags(_feature_row(df, features))}")
+        frames.append(df.assign(user_id=i))
+        per_user[i] = df
+
+    # Batched threshold variants vs one compute_features call per variant
+    variants = _variants()
+    table = cohort_feature_table(pd.concat(frames, ignore_index=True))
+    codes = compile_flag_rules(variants).evaluate(table)
+    for v, rules in enumerate(variants):
+        for n, user in enumerate(table.index.tolist()):
+            batched = {r.type: SEVERITIES[c] for r, c in zip(rules, codes[v, :, n].tolist()) if c}
+            single = {f["type"]: f["severity"] for f in compute_features(per_user[user], rules=rules)["flags"]}
+            if batched != single:
+                failures.append(f"variant {v} user {user}: {batched} != {single}")
+
+    for f in failures[:20]:
+        print("FAIL", f)
+    print(f"{len(rows)} edge rows, {n_users} users, {len(variants)} variants: "
+          + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Equivalence check for IncrementalFeatures.
+
+    python -m benchmarks.check_incremental
+
+For simulated users of every profile, with random NaN gaps and whole days
+missing a metric, the state is fed one row at a time with append() (from
+empty, or after from_history on a prefix). After every append from the
+10th day on, features() must equal compute_features on the same prefix,
+for both counted=False and counted=True. Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.check_cohort import _same
+from src.features import NUM_COLS, IncrementalFeatures, compute_features, load_and_validate
+from src.simulate import SimConfig, generate_simulated_user
+
+
+PROFILES = ["normal", "flu_like", "stressed", "missing_wear"]
+
+
+def _with_gaps(df: pd.DataFrame, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    for c in NUM_COLS:
+        df[c] = df[c].astype(float).mask(rng.random(len(df)) < 0.2)
+    # A stretch of days with no data for one metric
+    start = int(rng.integers(0, len(df) - 5))
+    df.loc[df.index[start:start + 5], NUM_COLS[seed % len(NUM_COLS)]] = np.nan
+    return df
+
+
+def main(n_users: int = 40) -> int:
+    failures = []
+    checked = 0
+    for i in range(n_users):
+        raw = generate_simulated_user(SimConfig(days=12 + i % 40, seed=i, profile=PROFILES[i % len(PROFILES)]))
+        df = load_and_validate(_with_gaps(raw, i) if i % 2 else raw)
+        rows = df.to_dict("records")
+        expected = {n: compute_features(df.iloc[:n]) for n in range(10, len(df) + 1)}
+        for counted in [False, True]:
+            # Half the users start from empty, half from a history prefix
+            k = 0 if i % 4 < 2 else 5 + i % 10
+            state = IncrementalFeatures.from_history(df.iloc[:k], counted=counted) if k else IncrementalFeatures(counted)
+            for n, row in enumerate(rows[k:], start=k + 1):
+                state.append(row)
+                if n >= 10:
+                    checked += 1
+                    if not _same(state.features(), expected[n]):
+                        failures.append(f"user {i} counted={counted} day {n}: features differ")
+    for f in failures[:20]:
+        print("FAIL", f)
+    print(f"{checked} appends: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
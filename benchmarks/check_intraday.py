@@ -0,0 +1,66 @@
+"""
+Sanity check for aggregate_intraday on a synthetic steady user.
+
+    python -m benchmarks.check_intraday
+
+A user who sleeps 23:00-07:00 every night and walks the same amount every
+day must come out as whole days with 8 h of sleep and no flags: edge days
+holding part of a night (the first day, or a phantom day after the last)
+must not reach compute_features. Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from src.features import compute_features, load_and_validate
+from src.ingest import aggregate_intraday
+
+
+def steady_user(days: int = 14, start: str = "2024-01-01") -> pd.DataFrame:
+    ts = pd.date_range(start, periods=days * 24 * 60, freq="min")
+    hour = ts.hour.to_numpy()
+    asleep = ((hour >= 23) | (hour < 7)).astype(int)
+    return pd.DataFrame({
+        "timestamp": ts,
+        "heart_rate": np.where(asleep == 1, 55.0, 72.0),
+        "steps": np.where((asleep == 0) & (ts.minute.to_numpy() % 2 == 0), 20, 0),
+        "worn": 1,
+        "asleep": asleep,
+        "hrv_ms": np.where(asleep == 1, 50.0, np.nan),
+    })
+
+
+def main() -> int:
+    failures = []
+    raw = steady_user()
+    for chunksize in [10_000_000, 7_777]:
+        daily = aggregate_intraday([raw.iloc[i:i + chunksize] for i in range(0, len(raw), chunksize)])
+        label = f"chunksize={chunksize}"
+        if len(daily) != 13 or daily.attrs["dropped_days"] != 2:
+            failures.append(f"{label}: expected 13 days (2 edge days dropped), got {len(daily)} / {daily.attrs['dropped_days']}")
+        for col, value in [("sleep_hours", 8.0), ("wear_time_hours", 24.0), ("steps", 16 * 30 * 20)]:
+            if not np.allclose(daily[col].to_numpy(dtype=float), value):
+                failures.append(f"{label}: {col} not constant {value}: {sorted(set(daily[col]))}")
+        features = compute_features(load_and_validate(daily))
+        if features["flags"]:
+            failures.append(f"{label}: unexpected flags {features['flags']}")
+        cov = features["coverage"]
+        if cov["wear_ok_days"] != cov["days_present"] or cov["missing_any_core_days"]:
+            failures.append(f"{label}: incomplete coverage {cov}")
+
+    # Without sleep columns only the calendar days need full coverage
+    awake = aggregate_intraday(raw.drop(columns=["asleep", "hrv_ms"]))
+    if len(awake) != 14:
+        failures.append(f"no sleep columns: expected 14 days, got {len(awake)}")
+
+    for f in failures:
+        print("FAIL", f)
+    print("ok" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
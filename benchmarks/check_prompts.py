@@ -0,0 +1,109 @@
+"""
+Information-equivalence check for the prompt context encoding.
+
+    python -m benchmarks.check_prompts
+
+On simulated users of every profile:
+  - decode_context(encode_context(...)) returns the original features and
+    escalation exactly, for both encodings;
+  - each BUDGET_STEPS drop removes only the detail named by its steps: the
+    decoded features equal the original minus exactly those keys;
+  - every prompt builder fits PROMPT_TOKEN_BUDGET even with a very long
+    user context or clarifying answer, which is cut rather than raising;
+  - chat prompts start with the same context block as the summary prompts.
+Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import copy
+import sys
+
+from src.chat import CHAT_TOKEN_BUDGET
+from src.features import compute_features, load_and_validate
+from src.prompts import (
+    BUDGET_STEPS,
+    PROMPT_ENCODINGS,
+    PROMPT_TOKEN_BUDGET,
+    TRUNCATED_MARK,
+    build_chat_prompt,
+    build_clinician_note_prompt,
+    build_update_summary_prompt,
+    build_user_summary_prompt,
+    context_block,
+    decode_context,
+    encode_context,
+    estimate_tokens,
+)
+from src.rules import determine_escalation
+from src.simulate import SimConfig, generate_simulated_user
+
+
+PROFILES = ["normal", "flu_like", "stressed", "missing_wear"]
+
+
+def _without(features: dict, steps: list[str]) -> dict:
+    # What each budget step is documented to remove, applied by hand
+    out = copy.deepcopy(features)
+    if "horizons" in steps:
+        out.pop("horizons", None)
+    if "delta_pct" in steps:
+        for t in out["trends"].values():
+            t.pop("delta_pct", None)
+    if "flag_rationale" in steps:
+        for f in out["flags"]:
+            f.pop("rationale", None)
+    if "last7_notes" in steps:
+        out.pop("last7_notes", None)
+    return out
+
+
+def main(n_users: int = 200) -> int:
+    failures = []
+    for i in range(n_users):
+        raw = generate_simulated_user(SimConfig(days=14 + i % 60, seed=i, profile=PROFILES[i % len(PROFILES)]))
+        features = compute_features(load_and_validate(raw))
+        escalation = determine_escalation(features)
+        for encoding in PROMPT_ENCODINGS:
+            f2, e2 = decode_context(*encode_context(features, escalation, encoding))
+            if (f2, e2) != (features, escalation):
+                failures.append(f"user {i} {encoding}: round trip changed the context")
+            for drop in range(1, len(BUDGET_STEPS) + 1):
+                f3, e3 = decode_context(*encode_context(features, escalation, encoding, drop))
+                want = _without(features, BUDGET_STEPS[:drop])
+                if f3 != want:
+                    failures.append(f"user {i} {encoding} drop={drop}: features differ beyond {BUDGET_STEPS[:drop]}")
+                if e3["level"] != escalation["level"] or e3["confidence"] != escalation["confidence"]:
+                    failures.append(f"user {i} {encoding} drop={drop}: escalation changed")
+
+    # Oversized user text is truncated to fit instead of raising
+    raw = generate_simulated_user(SimConfig(days=30, seed=1, profile="flu_like"))
+    features = compute_features(load_and_validate(raw))
+    escalation = determine_escalation(features)
+    long_text = " ".join(f"word{k}" for k in range(5000))
+    prompts = {
+        "user_summary": build_user_summary_prompt(features, escalation, long_text),
+        "clinician_note": build_clinician_note_prompt(features, escalation, long_text),
+        "update_summary": build_update_summary_prompt(features, escalation, "How do you feel?", long_text),
+    }
+    for name, prompt in prompts.items():
+        if estimate_tokens(prompt) > PROMPT_TOKEN_BUDGET or TRUNCATED_MARK not in prompt:
+            failures.append(f"{name}: long user text not truncated to the budget")
+    if TRUNCATED_MARK in build_user_summary_prompt(features, escalation, "short context"):
+        failures.append("user_summary: short context was truncated")
+
+    # The chat page's block is the summary prompts' prefix, even when detail has to be dropped
+    for budget in [PROMPT_TOKEN_BUDGET, 1000]:
+        block = context_block(features, escalation, token_budget=budget)
+        summary = build_user_summary_prompt(features, escalation, "", token_budget=budget)
+        chat = build_chat_prompt(block, "", [], "How did I sleep?", max(CHAT_TOKEN_BUDGET, budget))
+        if not (summary.startswith(block) and chat.startswith(block)):
+            failures.append(f"budget={budget}: chat and summary prompts do not share the context block")
+
+    for f in failures[:20]:
+        print("FAIL", f)
+    print(f"{n_users} users: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Check the chat intent router against its example phrasings.
+
+    python -m benchmarks.check_router
+
+Every phrasing in src.chat.ROUTE_EXAMPLES must route to its intent (None:
+to the LLM), routed answers must not contain "nan", including for a user
+whose last 7 days of sleep are missing. Coverage answers must report the
+days with adequate wear time, not just the days in the window. Routing
+must stay well under a millisecond. Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import re
+import sys
+import time
+
+import numpy as np
+
+from src.chat import ROUTE_EXAMPLES, route_question
+from src.features import compute_features, load_and_validate
+from src.rules import determine_escalation
+from src.simulate import SimConfig, generate_simulated_user
+
+
+MAX_ROUTE_MS = 0.2
+
+
+def _context(drop_recent_sleep: bool = False, low_wear_days: int = 0) -> tuple[dict, dict]:
+    df = load_and_validate(generate_simulated_user(SimConfig(days=30, seed=3, profile="flu_like")))
+    if drop_recent_sleep:
+        df.loc[df.index[-7:], ["sleep_hours", "sleep_efficiency"]] = np.nan
+    if low_wear_days:
+        df.loc[df.index[-low_wear_days:], "wear_time_hours"] = 5.0
+    features = compute_features(df)
+    return features, determine_escalation(features)
+
+
+def main() -> int:
+    failures = []
+    for missing in [False, True]:
+        features, escalation = _context(drop_recent_sleep=missing)
+        for intent, questions in ROUTE_EXAMPLES.items():
+            for q in questions:
+                r = route_question(q, features, escalation)
+                routed = r["intent"] if r["answer"] is not None else None
+                if routed != intent:
+                    failures.append(f"{q!r}: routed to {routed}, expected {intent}")
+                if r["answer"] is not None and re.search(r"\bnan\b", r["answer"], re.IGNORECASE):
+                    failures.append(f"{q!r} (missing recent sleep={missing}): answer contains nan: {r['answer']!r}")
+
+    # Poor wear must show in the coverage answer
+    features, escalation = _context(drop_recent_sleep=True, low_wear_days=5)
+    for q in ROUTE_EXAMPLES["coverage"]:
+        answer = route_question(q, features, escalation)["answer"] or ""
+        if "on 2 of the last 7 days" not in answer or "Sleep was recorded on 0/7" not in answer:
+            failures.append(f"{q!r} with 2/7 days worn, no sleep: {answer!r}")
+
+    features, escalation = _context()
+    questions = [q for qs in ROUTE_EXAMPLES.values() for q in qs]
+    n = 2000
+    t0 = time.perf_counter()
+    for i in range(n):
+        route_question(questions[i % len(questions)], features, escalation)
+    mean_ms = (time.perf_counter() - t0) * 1000.0 / n
+    if mean_ms > MAX_ROUTE_MS:
+        failures.append(f"routing takes {mean_ms:.3f} ms per question (limit {MAX_ROUTE_MS} ms)")
+
+    for f in failures:
+        print("FAIL", f)
+    print(f"{len(questions)} phrasings, {mean_ms * 1000:.1f} us per route: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Reproducibility check for the batched simulator.
+
+    python -m benchmarks.check_simulate
+
+generate_simulated_cohort(n_users=1, days, profile, seed) must return
+exactly generate_simulated_user(SimConfig(days, seed, profile)) plus the
+user_id column, for every profile and a range of lengths and seeds.
+Exits with status 1 on failure.
+"""
+from __future__ import annotations
+
+import itertools
+import sys
+
+import pandas as pd
+
+from src.simulate import PROFILES, SimConfig, generate_simulated_cohort, generate_simulated_user
+
+
+def main() -> int:
+    failures = []
+    cases = list(itertools.product(PROFILES, [1, 10, 30, 365], [0, 7, 12345]))
+    for profile, days, seed in cases:
+        cohort = generate_simulated_cohort(1, days=days, profile_mix=profile, seed=seed)
+        user = generate_simulated_user(SimConfig(days=days, seed=seed, profile=profile))
+        try:
+            pd.testing.assert_frame_equal(cohort.drop(columns="user_id"), user)
+        except AssertionError as e:
+            failures.append(f"{profile} days={days} seed={seed}: {str(e).splitlines()[0]}")
+
+    for f in failures[:20]:
+        print("FAIL", f)
+    print(f"{len(cases)} cases: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,7 @@ from pathlib import Path
 from src.storage import init_state, set_df
 from src.simulate import SimConfig, generate_simulated_user
 from src.features import load_and_validate
+from src.ingest import TABLE_SUFFIXES, read_table
 
 
 init_state()
@@ -17,21 +18,22 @@ demo_mode = st.session_state.get("demo_mode", False)
 if "data_rerun_done" not in st.session_state:
     st.session_state.data_rerun_done = False
 
-st.write("Upload a CSV, choose a bundled sample dataset, or generate simulated wearable-style data.")
+st.write("Upload a CSV/Parquet/Arrow file, choose a bundled sample dataset, or generate simulated wearable-style data.")
 
 
 def _reset_downstream_states():
-    # Reset things that depend on df so outputs don't become stale
-    for k in ["features", "escalation", "agent_outputs", "clarifying_q", "clarifying_a", "chat_messages"]:
+    # Reset session-only state that depends on df; features, escalation and
+    # agent outputs are handled by set_df (restored from the store when valid)
+    for k in ["chat_messages", "chat_memory"]:
         if k in st.session_state:
             st.session_state.pop(k, None)
     # allow rerun on next data load
     st.session_state.data_rerun_done = False
 
 
-def _load_df(df: pd.DataFrame, success_msg: str):
+def _load_df(df: pd.DataFrame, success_msg: str, compact: bool = False):
     try:
-        df2 = load_and_validate(df)
+        df2 = load_and_validate(df, compact=compact)
         set_df(df2)
         _reset_downstream_states()
         st.success(f"{success_msg} ({len(df2)} rows).")
@@ -50,28 +52,39 @@ def _load_df(df: pd.DataFrame, success_msg: str):
         st.error(str(e))
 
 
-tabs = st.tabs(["Upload CSV", "Sample data", "Simulate"])
+tabs = st.tabs(["Upload file", "Sample data", "Simulate"])
 
 with tabs[0]:
-    st.subheader("Upload CSV")
-    uploaded = st.file_uploader("Choose a CSV", type=["csv"])
+    st.subheader("Upload file")
+    uploaded = st.file_uploader(
+        "Choose a CSV, Parquet or Arrow (IPC/Feather) file",
+        type=[s.lstrip(".") for s in TABLE_SUFFIXES],
+    )
+    compact = st.checkbox(
+        "Compact dtypes (int32 counts, categorical notes; less memory for large files)",
+        value=False,
+    )
     if uploaded is not None:
-        df = pd.read_csv(uploaded)
-        if st.button("Load uploaded CSV", use_container_width=True):
-            _load_df(df, "Loaded uploaded dataset")
+        try:
+            df = read_table(uploaded)
+        except Exception as e:
+            st.error(str(e))
+            df = None
+        if df is not None and st.button("Load uploaded file", use_container_width=True):
+            _load_df(df, "Loaded uploaded dataset", compact=compact)
 
 with tabs[1]:
     st.subheader("Use bundled sample data")
 
     data_dir = Path("data")
-    sample_files = sorted([p.name for p in data_dir.glob("*.csv")]) if data_dir.exists() else []
+    sample_files = sorted([p.name for p in data_dir.iterdir() if p.suffix in TABLE_SUFFIXES]) if data_dir.exists() else []
 
     if not sample_files:
-        st.info("No sample CSVs found in `data/`. Add `sample_user.csv` and `sample_user_missing.csv` to enable this tab.")
+        st.info("No sample files found in `data/`. Add `sample_user.csv` and `sample_user_missing.csv` to enable this tab.")
     else:
         sample_name = st.selectbox("Select a sample dataset", sample_files)
         if st.button("Load sample dataset", use_container_width=True):
-            df = pd.read_csv(data_dir / sample_name)
+            df = read_table(data_dir / sample_name)
             _load_df(df, f"Loaded sample dataset: {sample_name}")
 
 with tabs[2]:
@@ -1,10 +1,19 @@
 from src.ui import render_header
 
 import streamlit as st
-import matplotlib.pyplot as plt
 
-from src.storage import init_state
-from src.features import compute_features
+from src.storage import init_state, current_dataset_key, ensure_features, ensure_escalation_ts
+from src.charts import (
+    PLOT_LEVELS,
+    chart_width_px,
+    escalation_figure,
+    plot_level,
+    plot_series,
+    quality_figure,
+    render_caption,
+    render_chart,
+    trend_panels_figure,
+)
 
 
 init_state()
@@ -20,14 +29,10 @@ if df is None:
     st.warning("Load data first in the Data page.")
     st.stop()
 
-# Ensure date is usable for plotting
-# (Assumes df already has a 'date' column in the correct format)
-date = df["date"]
-
-# Compute features once (cache in session_state)
+# Compute features once (session state, store, then process-wide memo)
 if st.session_state.get("features") is None:
     try:
-        st.session_state.features = compute_features(df)
+        ensure_features()
 
         # one-time rerun so the header chips update from pending → green
         if not st.session_state.tq_rerun_done:
@@ -40,6 +45,15 @@ if st.session_state.get("features") is None:
 
 
 features = st.session_state.features
+# Charts are rendered once per dataset + demo mode and cached for the server process
+data_key = current_dataset_key()
+
+
+def _show_chart(chart: dict) -> None:
+    st.image(chart["png"])
+    if not demo_mode:
+        st.caption(render_caption(chart))
+
 
 tabs = st.tabs(["Trends", "Quality", "Features"])
 
@@ -49,18 +63,38 @@ tabs = st.tabs(["Trends", "Quality", "Features"])
 with tabs[0]:
     st.subheader("Quick trends")
 
-    cols = ["steps", "resting_hr", "sleep_hours", "sleep_efficiency", "hrv_proxy", "wear_time_hours"]
+    # Long histories are reduced before plotting (min/max buckets or weekly/monthly means)
+    width_px = chart_width_px(demo_mode)
+    auto_level = plot_level(len(df), width_px)
+    choice = st.selectbox(
+        "Resolution",
+        ["auto"] + PLOT_LEVELS,
+        format_func=lambda v: f"auto ({auto_level})" if v == "auto" else v,
+        help="minmax keeps each bucket's lowest and highest day, so spikes stay visible.",
+    )
+    level = auto_level if choice == "auto" else choice
+    series = plot_series(df, data_key, level, width_px)
+    _show_chart(render_chart(
+        f"trends:{level}", data_key, demo_mode, lambda: trend_panels_figure(df, demo_mode, level=level, series=series)
+    ))
+    if not demo_mode:
+        n_points = max((len(x) for x, _ in series.values()), default=0)
+        st.caption(f"{level}: up to {n_points} points per metric from {len(df)} days.")
+
+    st.subheader("Escalation over time")
+    st.caption("Rule-based escalation as it would have been computed on each day (backtest).")
+    esc_ts = ensure_escalation_ts()
 
-    for c in cols:
-        if c not in df.columns:
-            continue
+    if esc_ts.empty:
+        st.info("Need at least 10 days of data for an escalation history.")
+    else:
+        _show_chart(render_chart("escalation", data_key, demo_mode, lambda: escalation_figure(esc_ts, demo_mode)))
 
-        fig = plt.figure()
-        plt.plot(date, df[c])
-        plt.title(c)
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        st.pyplot(fig)
+        escalated = esc_ts[esc_ts["level"] != "low"]
+        st.write(f"Escalated on **{len(escalated)}** of {len(esc_ts)} days.")
+        if not demo_mode and not escalated.empty:
+            with st.expander("Escalated days"):
+                st.dataframe(escalated[["level", "confidence", "rationale"]])
 
 # =========================================================
 # Quality
@@ -86,29 +120,9 @@ with tabs[1]:
 
     st.divider()
 
-    # Wear time plot (if present)
-    if "wear_time_hours" in df.columns:
-        st.write("**Wear time (hours/day)**")
-        fig = plt.figure()
-        plt.plot(date, df["wear_time_hours"])
-        plt.title("wear_time_hours")
-        plt.xticks(rotation=45, ha="right")
-        plt.tight_layout()
-        st.pyplot(fig)
-
-    # Missingness by column (bar)
-    st.write("**Missingness by variable**")
-    cols = [c for c in ["steps", "resting_hr", "sleep_hours", "sleep_efficiency", "hrv_proxy", "wear_time_hours"] if c in df.columns]
-    if cols:
-        miss = df[cols].isna().mean()
-        fig = plt.figure()
-        plt.bar(miss.index, miss.values)
-        plt.xticks(rotation=45, ha="right")
-        plt.title("Missingness rate")
-        plt.tight_layout()
-        st.pyplot(fig)
-    else:
-        st.info("No expected wearable columns found for missingness summary.")
+    # Wear time and missingness by variable
+    st.write("**Wear time (hours/day) and missingness by variable**")
+    _show_chart(render_chart("quality", data_key, demo_mode, lambda: quality_figure(df, demo_mode)))
 
     if not demo_mode:
         with st.expander("Raw data preview (debug)"):
@@ -2,17 +2,24 @@ import os
 from datetime import datetime
 import streamlit as st
 
-from src.storage import init_state
-from src.features import compute_features
-from src.rules import determine_escalation
+from src.storage import (
+    init_state,
+    save_artifact,
+    load_artifact,
+    agent_outputs_variant,
+    ensure_features,
+    ensure_escalation,
+)
 from src.prompts import (
     SYSTEM_BASE,
+    PROMPT_ENCODING,
+    estimate_tokens,
     build_user_summary_prompt,
     build_clinician_note_prompt,
     build_clarifying_question_prompt,
     build_update_summary_prompt,
 )
-from src.llm import generate_text
+from src.llm import generate_text, stream_text, stream_many, prompt_cache_stats
 from src.ui import render_header
 
 
@@ -68,6 +75,23 @@ def _build_concise_clinician_prompt(features: dict, escalation: dict, user_conte
     )
 
 
+def _save_outputs(outputs: dict, model: str, user_context: str) -> None:
+    # Keyed by every user input the texts depend on (see agent_outputs_variant)
+    q = a = None
+    if outputs.get("user_summary_updated"):
+        q, a = st.session_state.get("clarifying_q"), st.session_state.get("clarifying_a")
+    save_artifact("agent_outputs", outputs, variant=agent_outputs_variant(model, user_context, q, a))
+
+
+def _stream_into(slot, chunks) -> str:
+    # Render streamed text progressively into a placeholder; return the full text
+    text = ""
+    for delta in chunks:
+        text += delta
+        slot.markdown(text)
+    return text
+
+
 # =========================================================
 # Page logic
 # =========================================================
@@ -77,6 +101,7 @@ render_header("3) Agent Summary")
 
 demo_mode = st.session_state.get("demo_mode", False)
 model = st.session_state.get("selected_model", "gpt-4.1-mini")
+use_cache = st.session_state.get("use_llm_cache", True)
 
 df = st.session_state.get("df")
 if df is None:
@@ -86,7 +111,7 @@ if df is None:
 # ---- Compute features (deterministic) ----
 if st.session_state.get("features") is None:
     try:
-        st.session_state.features = compute_features(df)
+        ensure_features()
     except Exception as e:
         st.error(str(e))
         st.stop()
@@ -95,7 +120,7 @@ features = st.session_state.features
 
 # ---- Escalation (rule-based, non-LLM) ----
 if st.session_state.get("escalation") is None:
-    st.session_state.escalation = determine_escalation(features)
+    ensure_escalation()
 
 escalation = st.session_state.escalation
 
@@ -136,35 +161,29 @@ with right:
         "",
         help="This is appended as context; it does not change rule-based escalation."
     )
+    if st.session_state.get("agent_outputs") is None:
+        # Outputs stored earlier for this dataset, model and context
+        st.session_state.agent_outputs = load_artifact("agent_outputs", variant=agent_outputs_variant(model, user_context))
+    if not demo_mode:
+        prompt_tokens = estimate_tokens(build_user_summary_prompt(features, escalation, user_context))
+        st.caption(f"User summary prompt: ~{prompt_tokens} tokens ({PROMPT_ENCODING} encoding)")
+        cache_stats = prompt_cache_stats()
+        if cache_stats["calls"]:
+            st.caption(
+                f"Provider prompt cache (last {cache_stats['calls']} calls): "
+                f"{cache_stats['cached_tokens']} of {cache_stats['input_tokens']} input tokens cached"
+            )
 
     action_col1, action_col2 = st.columns([1, 1])
 
     with action_col1:
-        if st.button("Generate summaries", use_container_width=True):
-            user_prompt = build_user_summary_prompt(features, escalation, user_context)
-            clinician_prompt = build_clinician_note_prompt(features, escalation, user_context)
-
-            with st.spinner("Generating user summary..."):
-                user_summary = generate_text(user_prompt, SYSTEM_BASE, model=model)
-
-            with st.spinner("Generating clinician note..."):
-                clinician_note = generate_text(clinician_prompt, SYSTEM_BASE, model=model)
-
-            st.session_state.agent_outputs = {
-                "user_summary": user_summary,
-                "clinician_note": clinician_note,
-                "version": "full",
-                "meta": {
-                    "model": model,
-                    "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
-                },
-            }
+        generate_clicked = st.button("Generate summaries", use_container_width=True)
 
     with action_col2:
         if st.button("Ask clarifying question", use_container_width=True):
             q_prompt = build_clarifying_question_prompt(features, escalation)
             with st.spinner("Generating clarifying question..."):
-                st.session_state.clarifying_q = generate_text(q_prompt, SYSTEM_BASE, model=model).strip()
+                st.session_state.clarifying_q = generate_text(q_prompt, SYSTEM_BASE, model=model, use_cache=use_cache).strip()
             st.session_state.clarifying_a = None
 
     # Tabs for outputs
@@ -174,29 +193,32 @@ with right:
     # Tab 1: User summary
     # -------------------------
     with tabs[0]:
+        user_summary_slot = st.empty()
         if st.session_state.get("agent_outputs"):
-            st.write(st.session_state.agent_outputs.get("user_summary", ""))
+            user_summary_slot.write(st.session_state.agent_outputs.get("user_summary", ""))
             if st.session_state.agent_outputs.get("user_summary_updated"):
                 st.markdown("---")
                 st.write("**Updated user summary**")
                 st.write(st.session_state.agent_outputs["user_summary_updated"])
         else:
-            st.info("Generate summaries to view outputs.")
+            user_summary_slot.info("Generate summaries to view outputs.")
 
     # -------------------------
     # Tab 2: Clinician note
     # -------------------------
     with tabs[1]:
+        clinician_note_slot = st.empty()
         if st.session_state.get("agent_outputs"):
             st.caption(f"Version: {st.session_state.agent_outputs.get('version', 'full')}")
-            clinician_note = st.session_state.agent_outputs.get("clinician_note", "")
-            st.write(clinician_note)
+            clinician_note_slot.write(st.session_state.agent_outputs.get("clinician_note", ""))
 
             # concise regeneration
             if st.button("♻️ Re-generate clinician note (concise)"):
                 concise_prompt = _build_concise_clinician_prompt(features, escalation, user_context)
-                with st.spinner("Re-generating concise clinician note..."):
-                    concise_note = generate_text(concise_prompt, SYSTEM_BASE, model=model)
+                concise_note = _stream_into(
+                    clinician_note_slot,
+                    stream_text(concise_prompt, SYSTEM_BASE, model=model, use_cache=use_cache),
+                )
 
                 st.session_state.agent_outputs["clinician_note"] = concise_note
                 st.session_state.agent_outputs["version"] = "concise"
@@ -204,9 +226,53 @@ with right:
                     "model": model,
                     "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
                 }
+                _save_outputs(st.session_state.agent_outputs, model, user_context)
                 st.success("Clinician note updated (concise).")
         else:
-            st.info("Generate summaries to view outputs.")
+            clinician_note_slot.info("Generate summaries to view outputs.")
+
+    # Stream both outputs concurrently into their tabs
+    if generate_clicked:
+        user_prompt = build_user_summary_prompt(features, escalation, user_context)
+        clinician_prompt = build_clinician_note_prompt(features, escalation, user_context)
+
+        slots = [user_summary_slot, clinician_note_slot]
+        texts = ["", ""]
+        errors = [None, None]
+        with st.spinner("Generating user summary and clinician note..."):
+            for i, delta, err in stream_many(
+                [
+                    {"prompt": user_prompt, "system": SYSTEM_BASE, "model": model},
+                    {"prompt": clinician_prompt, "system": SYSTEM_BASE, "model": model},
+                ],
+                use_cache=use_cache,
+            ):
+                if err:
+                    errors[i] = err
+                    continue
+                texts[i] += delta
+                slots[i].markdown(texts[i])
+
+        if errors[0]:
+            st.error(f"User summary failed: {errors[0]}")
+        if errors[1]:
+            st.error(f"Clinician note failed: {errors[1]}")
+
+        outputs = {
+            "version": "full",
+            "meta": {
+                "model": model,
+                "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            },
+        }
+        for name, text, err in zip(["user_summary", "clinician_note"], texts, errors):
+            if not err:
+                outputs[name] = text
+        if any(errors):
+            # Keep what succeeded for this session; only complete results are stored
+            st.session_state.agent_outputs = outputs
+        else:
+            _save_outputs(outputs, model, user_context)
 
     # -------------------------
     # Tab 3: Export
@@ -265,12 +331,16 @@ with right:
                     answer,
                 )
 
-                with st.spinner("Updating summary..."):
-                    updated = generate_text(upd_prompt, SYSTEM_BASE, model=model)
+                updated = _stream_into(
+                    st.empty(),
+                    stream_text(upd_prompt, SYSTEM_BASE, model=model, use_cache=use_cache),
+                )
 
                 if not st.session_state.get("agent_outputs"):
                     st.session_state.agent_outputs = {}
                 st.session_state.agent_outputs["user_summary_updated"] = updated
+                if updated.strip():
+                    _save_outputs(st.session_state.agent_outputs, model, user_context)
                 st.success("User summary updated.")
         else:
             st.info("Click “Ask clarifying question” to run the agentic step.")
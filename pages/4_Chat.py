@@ -1,10 +1,12 @@
 import os
+import time
 import streamlit as st
 
 from src.storage import init_state
 from src.ui import render_header
-from src.prompts import SYSTEM_BASE
-from src.llm import generate_text  
+from src.prompts import SYSTEM_BASE, context_block, estimate_tokens
+from src.llm import stream_text
+from src.chat import MAX_DISPLAY_MESSAGES, ChatMemory, route_question
 
 
 init_state()
@@ -12,6 +14,7 @@ render_header("4) Chat")
 
 demo_mode = st.session_state.get("demo_mode", False)
 model = st.session_state.get("selected_model", "gpt-4.1-mini")
+use_cache = st.session_state.get("use_llm_cache", True)
 
 # Basic checks
 if os.environ.get("OPENAI_API_KEY") is None:
@@ -26,16 +29,28 @@ with st.sidebar:
     st.markdown("### Chat Tools")
     if st.button("🧹 Clear chat", use_container_width=True):
         st.session_state.chat_messages = []
+        st.session_state.pop("chat_memory", None)
         st.rerun()
 
-    if not demo_mode:
-        with st.expander("Context (debug)"):
-            st.write("Features loaded:", features is not None)
-            st.write("Escalation loaded:", escalation is not None)
-
 # Initialize chat state
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = []
+if "chat_memory" not in st.session_state:
+    st.session_state.chat_memory = ChatMemory()
+memory = st.session_state.chat_memory
+memory.collect()
+
+if not demo_mode:
+    with st.sidebar.expander("Context (debug)"):
+        st.write("Features loaded:", features is not None)
+        st.write("Escalation loaded:", escalation is not None)
+        st.write("Summarized history:", memory.summary or "(none)")
+        st.write("Recent messages kept verbatim:", len(memory.recent))
+        if memory.turn_stats:
+            st.write("Last turn:", memory.turn_stats[-1])
+            routed = [t for t in memory.turn_stats if t["route"] != "llm"]
+            saved = sum(t["saved_ms"] or 0.0 for t in routed)
+            st.write(f"Answered from features: {len(routed)}/{len(memory.turn_stats)} turns, ~{saved:.0f} ms saved")
 
 st.subheader("Agent chat")
 
@@ -59,26 +74,56 @@ if user_msg:
     with st.chat_message("user"):
         st.markdown(user_msg)
 
-    # Build a bounded context prompt (keep it short & safe)
-    context_bits = []
-    if features is not None:
-        context_bits.append(f"FEATURES_SUMMARY:\n{features}")
-    if escalation is not None:
-        context_bits.append(f"ESCALATION:\n{escalation}")
-
-    context_text = "\n\n".join(context_bits) if context_bits else "No wearable context available."
-
-    prompt = (
-        "You are a helpful assistant for a wearable-data prototype. "
-        "Do not provide diagnosis or treatment. "
-        "Explain patterns, uncertainty, and next steps that involve human review.\n\n"
-        f"{context_text}\n\n"
-        f"USER QUESTION:\n{user_msg}\n"
-    )
-
-    with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            assistant_msg = generate_text(prompt, SYSTEM_BASE, model=model)
+    # Simple factual questions are answered from the features without the LLM
+    route = route_question(user_msg, features, escalation)
+    if route["answer"] is not None:
+        assistant_msg = route["answer"]
+        with st.chat_message("assistant"):
             st.markdown(assistant_msg)
+        saved_ms = memory.expected_llm_ms()
+        stats = {
+            "route": route["intent"],
+            "route_ms": round(route["route_ms"], 4),
+            "prompt_tokens": 0,
+            "latency_ms": round(route["route_ms"], 4),
+            "saved_ms": round(saved_ms, 1) if saved_ms is not None else None,
+        }
+    else:
+        # Features/escalation once, byte-identical to the summary prompts' block, then summary + recent turns
+        block = None
+        if features is not None and escalation is not None:
+            block = context_block(features, escalation)
+        try:
+            prompt = memory.prompt(block, user_msg)
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+
+        t0 = time.perf_counter()
+        first = []
+
+        def _timed(chunks):
+            for chunk in chunks:
+                if not first:
+                    first.append(time.perf_counter())
+                yield chunk
+
+        with st.chat_message("assistant"):
+            assistant_msg = st.write_stream(_timed(stream_text(prompt, SYSTEM_BASE, model=model, use_cache=use_cache)))
+        t1 = time.perf_counter()
+        stats = {
+            "route": "llm",
+            "route_ms": round(route["route_ms"], 4),
+            "route_confidence": route["confidence"],
+            "prompt_tokens": estimate_tokens(prompt),
+            "latency_ms": round((t1 - t0) * 1000.0, 1),
+            "first_token_ms": round((first[0] - t0) * 1000.0, 1) if first else None,
+        }
 
     st.session_state.chat_messages.append({"role": "assistant", "content": assistant_msg})
+    del st.session_state.chat_messages[:-MAX_DISPLAY_MESSAGES]
+
+    memory.add("user", user_msg)
+    memory.add("assistant", assistant_msg)
+    memory.record_turn(**stats)
+    memory.maybe_summarize(model, use_cache=use_cache)
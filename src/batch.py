@@ -0,0 +1,285 @@
+"""
+Headless batch report pipeline for many users.
+
+    python -m src.batch data/cohort.csv --out reports/
+    python -m src.batch exports/ --out reports/ --workers 8 --rpm 120
+
+Input is either a single long-format file with a `user_id` column, or a
+directory of per-user files (file stem = user id); CSV, Parquet and Arrow
+IPC are accepted; with --intraday the file holds minute-level records that
+are first aggregated to daily rows (src.ingest.aggregate_intraday). For every user:
+load_and_validate -> compute_features -> determine_escalation -> prompts
+-> LLM summaries. Feature computation runs in a process pool, LLM calls
+run concurrently under a requests-per-minute limit.
+
+Results are appended to <out>/results.jsonl as each user completes (LLM
+results as soon as their calls finish), so an interrupted run resumes by
+skipping users already written with status "ok" and every requested output.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from src.features import load_and_validate, compute_features
+from src.ingest import TABLE_SUFFIXES, aggregate_intraday, read_table, stream_csv_features
+from src.rules import determine_escalation
+from src.prompts import SYSTEM_BASE, build_user_summary_prompt, build_clinician_note_prompt
+
+
+OUTPUT_BUILDERS = {
+    "user_summary": build_user_summary_prompt,
+    "clinician_note": build_clinician_note_prompt,
+}
+RESULTS_FILE = "results.jsonl"
+
+
+def read_source(path: Path, user_col: str = "user_id"):
+    """
+    Yield (user_id, raw DataFrame) pairs from a long-format file or a directory.
+    """
+    files = sorted(p for p in path.iterdir() if p.suffix in TABLE_SUFFIXES) if path.is_dir() else [path]
+    for f in files:
+        df = read_table(f)
+        if user_col in df.columns:
+            for user, g in df.groupby(user_col, sort=False):
+                yield str(user), g.drop(columns=[user_col])
+        else:
+            yield f.stem, df
+
+
+def read_intraday(path: Path, user_col: str = "user_id"):
+    """
+    Yield (user_id, daily DataFrame) pairs aggregated from a minute-level file.
+    """
+    daily = aggregate_intraday(path, user_col=user_col)
+    if user_col in daily.columns:
+        for user, g in daily.groupby(user_col, sort=False):
+            yield str(user), g.drop(columns=[user_col])
+    else:
+        yield path.stem, daily
+
+
+def completed_users(out_dir: Path, outputs: list[str] | None = None) -> set[str]:
+    """
+    Users whose latest record in results.jsonl has status "ok" and holds
+    every output in `outputs` (a --no-llm record does not satisfy a run that
+    asks for summaries). A truncated last line (interrupted write) is ignored.
+    """
+    path = out_dir / RESULTS_FILE
+    latest = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                latest[rec["user_id"]] = rec
+    required = outputs or []
+    return {
+        u for u, rec in latest.items()
+        if rec.get("status") == "ok" and all(rec.get(name) for name in required)
+    }
+
+
+def process_user(user_id: str, df: pd.DataFrame) -> dict:
+    """
+    Deterministic part of the pipeline for one user (runs in a worker process).
+    """
+    try:
+        features = compute_features(load_and_validate(df))
+        return {"user_id": user_id, "status": "ok", "features": features, "escalation": determine_escalation(features)}
+    except Exception as e:
+        return {"user_id": user_id, "status": "error", "error": str(e)}
+
+
+def _streamed_record(user_id: str, state) -> dict:
+    try:
+        features = state.features()
+        return {"user_id": user_id, "status": "ok", "features": features, "escalation": determine_escalation(features)}
+    except Exception as e:
+        return {"user_id": user_id, "status": "error", "error": str(e)}
+
+
+def _generate_outputs(rec: dict, outputs: list[str], model: str, limiter, use_cache: bool) -> dict:
+    from src.llm import generate_text
+
+    try:
+        for name in outputs:
+            prompt = OUTPUT_BUILDERS[name](rec["features"], rec["escalation"], None)
+            if limiter is not None:
+                limiter.acquire()
+            rec[name] = generate_text(prompt, SYSTEM_BASE, model=model, use_cache=use_cache)
+        rec["meta"] = {"model": model, "generated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z"}
+    except Exception as e:
+        rec["status"] = "error"
+        rec["error"] = f"LLM generation failed: {e}"
+    return rec
+
+
+def run_batch(
+    source: Path,
+    out_dir: Path,
+    outputs: list[str] | None = None,
+    model: str = "gpt-4.1-mini",
+    workers: int | None = None,
+    concurrency: int = 4,
+    rpm: float = 60.0,
+    use_llm: bool = True,
+    use_cache: bool = True,
+    write_parquet: bool = False,
+    stream: bool = False,
+    intraday: bool = False,
+) -> dict:
+    """
+    Run the pipeline over every user in `source`; returns run counters.
+    stream=True reads a single long-format CSV in chunks (bounded memory)
+    instead of loading each user's frame; row-level errors go to row_errors.jsonl.
+    intraday=True aggregates a minute-level file to daily rows first.
+    """
+    outputs = list(OUTPUT_BUILDERS) if outputs is None else outputs
+    out_dir.mkdir(parents=True, exist_ok=True)
+    done = completed_users(out_dir, outputs if use_llm else None)
+    counts = {"skipped": 0, "ok": 0, "error": 0}
+
+    todo = []
+    streamed = None
+    if stream:
+        # Single pass over the CSV in chunks; only bounded per-user state is kept
+        streamed = stream_csv_features(source)
+        if streamed.errors:
+            with open(out_dir / "row_errors.jsonl", "w", encoding="utf-8") as fh:
+                for err in streamed.errors:
+                    fh.write(json.dumps(err, ensure_ascii=False) + "\n")
+        counts["row_errors"] = streamed.error_count
+        for key, state in streamed.states.items():
+            user_id = key or source.stem  # file without a user_id column
+            if user_id in done:
+                counts["skipped"] += 1
+            else:
+                todo.append((user_id, state))
+    else:
+        for user_id, df in (read_intraday(source) if intraday else read_source(source)):
+            if user_id in done:
+                counts["skipped"] += 1
+            else:
+                todo.append((user_id, df))
+
+    limiter = None
+    if use_llm:
+        from src.llm import RateLimiter
+        limiter = RateLimiter(per_minute=rpm, burst=concurrency)
+
+    lock = threading.Lock()
+    # No worker processes in stream mode: features come from the streamed states
+    procs_ctx = nullcontext() if streamed is not None else ProcessPoolExecutor(max_workers=workers)
+    with open(out_dir / RESULTS_FILE, "a", encoding="utf-8") as sink, \
+            procs_ctx as procs, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as threads:
+
+        def write(rec: dict) -> None:
+            with lock:
+                sink.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                sink.flush()
+                counts[rec["status"]] += 1
+
+        if streamed is not None:
+            feature_results = (_streamed_record(u, state) for u, state in todo)
+        else:
+            feature_results = (f.result() for f in as_completed([procs.submit(process_user, u, df) for u, df in todo]))
+
+        # LLM results are written from the worker thread as soon as they finish,
+        # so an interrupt during the feature stage keeps completed summaries
+        for rec in feature_results:
+            if rec["status"] == "ok" and use_llm:
+                fut = threads.submit(_generate_outputs, rec, outputs, model, limiter, use_cache)
+                fut.add_done_callback(lambda f: write(f.result()))
+            else:
+                write(rec)
+
+    if write_parquet:
+        export_parquet(out_dir)
+    return counts
+
+
+def export_parquet(out_dir: Path) -> Path:
+    """
+    Convert results.jsonl to results.parquet (latest record per user).
+    Nested features/escalation are stored as JSON strings.
+    """
+    rows = {}
+    with open(out_dir / RESULTS_FILE, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            rows[rec["user_id"]] = rec
+    df = pd.DataFrame(list(rows.values()))
+    for c in ["features", "escalation", "meta"]:
+        if c in df.columns:
+            df[c] = df[c].map(lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, dict) else None)
+    path = out_dir / "results.parquet"
+    df.to_parquet(path, index=False)
+    return path
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Batch feature/escalation/summary reports for many users.")
+    ap.add_argument("source", type=Path, help="Long-format file with user_id, or a directory of per-user files")
+    ap.add_argument("--out", type=Path, required=True, help="Output directory (results.jsonl, resumable)")
+    ap.add_argument("--outputs", default=",".join(OUTPUT_BUILDERS), help="Comma-separated: user_summary,clinician_note")
+    ap.add_argument("--model", default="gpt-4.1-mini")
+    ap.add_argument("--workers", type=int, default=None, help="Feature worker processes (default: CPU count)")
+    ap.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM requests")
+    ap.add_argument("--rpm", type=float, default=60.0, help="LLM requests per minute")
+    ap.add_argument("--no-llm", action="store_true", help="Only compute features and escalation")
+    ap.add_argument("--no-cache", action="store_true", help="Force fresh LLM generations")
+    ap.add_argument("--parquet", action="store_true", help="Also write results.parquet (needs pyarrow)")
+    ap.add_argument("--stream", action="store_true", help="Chunked CSV reading with bounded memory (single CSV source)")
+    ap.add_argument("--intraday", action="store_true", help="Source is minute-level records (single file), aggregated to days first")
+    args = ap.parse_args(argv)
+
+    outputs = [o for o in args.outputs.split(",") if o]
+    unknown = [o for o in outputs if o not in OUTPUT_BUILDERS]
+    if unknown:
+        ap.error(f"Unknown outputs: {unknown}")
+    if args.stream and (args.source.is_dir() or args.source.suffix != ".csv"):
+        ap.error("--stream needs a single long-format CSV file.")
+    if args.intraday and (args.stream or args.source.is_dir()):
+        ap.error("--intraday needs a single file and cannot be combined with --stream.")
+    if not args.no_llm and os.environ.get("OPENAI_API_KEY") is None:
+        ap.error("OPENAI_API_KEY not set (use --no-llm for deterministic outputs only).")
+
+    counts = run_batch(
+        args.source,
+        args.out,
+        outputs=outputs,
+        model=args.model,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        use_llm=not args.no_llm,
+        use_cache=not args.no_cache,
+        write_parquet=args.parquet,
+        stream=args.stream,
+        intraday=args.intraday,
+    )
+    print(f"done: {counts['ok']} ok, {counts['error']} errors, {counts['skipped']} skipped (already complete)")
+    if counts.get("row_errors"):
+        print(f"{counts['row_errors']} row-level validation errors (see row_errors.jsonl)")
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
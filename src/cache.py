@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src import tracing
+
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite")
+
+
+def response_key(model: str, system: str, prompt: str) -> str:
+    """
+    Content address for an LLM request: sha256 over (model, system, prompt).
+    """
+    payload = json.dumps([model, system, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: in-memory LRU in front of a local SQLite file.
+
+    Entries expire after `ttl_seconds`; both tiers are bounded by entry count
+    and evict least-recently-used entries. Pass path=None for memory only.
+    """
+
+    def __init__(
+        self,
+        path: str | None = DEFAULT_CACHE_PATH,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 2000,
+        memory_entries: int = 128,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._mem: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        self._mem[key] = (value, created_at)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_entries:
+            self._mem.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if not self._expired(hit[1], now):
+                    self._mem.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return hit[0]
+                del self._mem[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1], now):
+                        self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.stats["disk_hits"] += 1
+                        return row[0]
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.stats["writes"] += 1
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.stats["evictions"] += excess
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+_CACHE: ResponseCache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Process-wide cache instance. LLM_CACHE_PATH overrides the file location
+    (set it to an empty string for a memory-only cache).
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            path = os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+            ttl = float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+            _CACHE = ResponseCache(path=path or None, ttl_seconds=ttl)
+        return _CACHE
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Fast content fingerprint of a frame: sha256 over the raw column buffers
+    (plus shape, column names and dtypes). Fixed-width columns are hashed
+    in place; categoricals via their codes and categories; string/object
+    columns via pandas' vectorized hash_array.
+    """
+    h = hashlib.sha256()  # hardware-accelerated on most CPUs, faster than blake2b here
+    h.update(json.dumps([len(df), [[str(c), str(t)] for c, t in df.dtypes.items()]]).encode("utf-8"))
+    for c in df.columns:
+        _hash_values(h, df[c].array)
+    return h.hexdigest()
+
+
+def _hash_values(h, values) -> None:
+    if isinstance(values, pd.Categorical):
+        _hash_values(h, values.codes)
+        _hash_values(h, values.categories.array)
+        return
+    arr = np.asarray(values)
+    if arr.dtype.kind in "biufcmM":
+        h.update(np.ascontiguousarray(arr).view(np.uint8))
+    else:
+        h.update(pd.util.hash_array(arr.astype(object)).view(np.uint8))
+
+
+class MemoCache:
+    """
+    Bounded in-process LRU for deterministic results (features, escalation, ...).
+    Values are deep-copied on the way in and out, so callers may mutate them.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                tracing.count("memo_hits", kind=_memo_kind(key))
+                return copy.deepcopy(self._data[key])
+            self.stats["misses"] += 1
+        tracing.count("memo_misses", kind=_memo_kind(key))
+        # Computed outside the lock; concurrent misses for one key just compute twice
+        value = compute()
+        with self._lock:
+            self._data[key] = copy.deepcopy(value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _memo_kind(key) -> str:
+    return str(key[0]) if isinstance(key, tuple) and key else "other"
+
+
+_MEMO: MemoCache | None = None
+
+
+def get_memo_cache() -> MemoCache:
+    """
+    Process-wide memo cache, shared by all Streamlit sessions on this server.
+    """
+    global _MEMO
+    with _CACHE_LOCK:
+        if _MEMO is None:
+            _MEMO = MemoCache(max_entries=int(os.environ.get("MEMO_MAX_ENTRIES", 64)))
+        return _MEMO
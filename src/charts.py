@@ -0,0 +1,180 @@
+from __future__ import annotations
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from src.cache import get_memo_cache
+from src.rules import LEVEL_ORDER
+
+
+TREND_COLUMNS = ["steps", "resting_hr", "sleep_hours", "sleep_efficiency", "hrv_proxy", "wear_time_hours"]
+FIG_WIDTH_IN = 9
+PLOT_LEVELS = ["daily", "minmax", "weekly", "monthly"]
+_RESAMPLE_RULES = {"weekly": "W", "monthly": "MS"}
+
+
+def chart_width_px(demo_mode: bool = False) -> int:
+    return FIG_WIDTH_IN * (150 if demo_mode else 100)
+
+
+def plot_level(n_points: int, width_px: int) -> str:
+    """
+    Resolution for n daily points on a chart `width_px` wide: raw days while
+    they fit (about 2 points per pixel column), min/max buckets up to 4x that,
+    then weekly means, then monthly means.
+    """
+    budget = 2 * width_px
+    if n_points <= budget:
+        return "daily"
+    if n_points <= 4 * budget:
+        return "minmax"
+    if n_points / 7 <= budget:
+        return "weekly"
+    return "monthly"
+
+
+def minmax_indices(values: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Sorted row indices of the min and max of each of `n_buckets` equal-width
+    buckets (NaNs ignored). Keeps spikes that averaging would hide.
+    """
+    n = len(values)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    bucket = np.arange(n) * n_buckets // n
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    nan = np.isnan(values)
+    lo = np.where(nan, np.inf, values)
+    hi = np.where(nan, -np.inf, values)
+    # Stable sort within buckets: the first row of each bucket is its (first) min / max
+    arg_min = np.lexsort((lo, bucket))[starts]
+    arg_max = np.lexsort((-hi, bucket))[starts]
+    valid = ~nan[arg_min]  # all-NaN buckets are dropped
+    return np.unique(np.concatenate((arg_min[valid], arg_max[valid])))
+
+
+def reduce_for_plot(df: pd.DataFrame, level: str, width_px: int, columns=None) -> dict:
+    """
+    {column: (dates, values)} at the requested level: raw daily rows, min/max
+    buckets (one bucket per pixel column), or weekly/monthly means.
+    """
+    if level not in PLOT_LEVELS:
+        raise ValueError(f"Unknown plot level {level!r}; expected one of {PLOT_LEVELS}.")
+    cols = [c for c in (columns or TREND_COLUMNS) if c in df.columns]
+    dates = df["date"].to_numpy()
+    if level == "daily":
+        return {c: (dates, df[c].to_numpy(dtype=float)) for c in cols}
+    if level == "minmax":
+        out = {}
+        for c in cols:
+            y = df[c].to_numpy(dtype=float)
+            idx = minmax_indices(y, width_px)
+            out[c] = (dates[idx], y[idx])
+        return out
+    agg = df.set_index("date")[cols].astype(float).resample(_RESAMPLE_RULES[level]).mean()
+    return {c: (agg.index.to_numpy(), agg[c].to_numpy()) for c in cols}
+
+
+def plot_series(df: pd.DataFrame, key: str, level: str, width_px: int) -> dict:
+    """
+    reduce_for_plot cached in the process-wide memo per dataset key.
+    """
+    return get_memo_cache().get_or_compute(
+        ("plot_series", key, level, width_px), lambda: reduce_for_plot(df, level, width_px)
+    )
+
+
+def _new_figure(n_rows: int, n_cols: int, height: float, demo_mode: bool, sharex: bool = False, bottom: float = 0.85):
+    # Figure objects are not registered with pyplot, so nothing accumulates
+    # across reruns; they are released as soon as the PNG is written.
+    fig = Figure(figsize=(FIG_WIDTH_IN, height))
+    axes = fig.subplots(n_rows, n_cols, sharex=sharex, squeeze=False).ravel()
+    # Fixed margins: constrained/tight layout costs more than drawing the data
+    fig.subplots_adjust(left=0.09, right=0.98, top=1 - 0.35 / height, bottom=bottom / height, hspace=0.4, wspace=0.25)
+    for ax in axes:
+        if not demo_mode:
+            ax.grid(alpha=0.3)
+        ax.tick_params(axis="x", labelrotation=45)
+        if sharex:
+            ax.label_outer()  # date labels only on the bottom panel
+    return fig, axes
+
+
+def _title(ax, text: str) -> None:
+    # An explicit y skips matplotlib's per-draw title auto-positioning
+    ax.set_title(text, fontsize=10, loc="left", y=1.0, pad=3)
+
+
+def trend_panels_figure(df: pd.DataFrame, demo_mode: bool = False, level: str = "daily", series: dict | None = None) -> Figure:
+    """
+    All metric panels in one figure with a shared date axis. `series` is a
+    precomputed reduce_for_plot result; otherwise `df` is reduced to `level`.
+    """
+    if series is None:
+        series = reduce_for_plot(df, level, chart_width_px(demo_mode))
+    fig, axes = _new_figure(len(series), 1, 1.6 * len(series) + 0.6, demo_mode, sharex=True)
+    suffix = "" if level in ("daily", "minmax") else f" ({level} mean)"
+    for ax, (c, (x, y)) in zip(axes, series.items()):
+        ax.plot(x, y, linewidth=1.2)
+        _title(ax, c + suffix)
+    return fig
+
+
+def escalation_figure(esc_ts: pd.DataFrame, demo_mode: bool = False) -> Figure:
+    """
+    Step plot of the escalation level per day (see rules.escalation_timeseries).
+    """
+    fig, (ax,) = _new_figure(1, 1, 2.6, demo_mode)
+    ax.step(esc_ts.index, esc_ts["level"].map(LEVEL_ORDER).to_numpy(), where="post")
+    ax.set_yticks(list(LEVEL_ORDER.values()), list(LEVEL_ORDER))
+    ax.set_ylim(-0.3, 2.3)
+    _title(ax, "escalation level")
+    return fig
+
+
+def quality_figure(df: pd.DataFrame, demo_mode: bool = False) -> Figure:
+    """
+    Wear time per day and missingness rate per variable, side by side.
+    """
+    cols = [c for c in TREND_COLUMNS if c in df.columns]
+    fig, (ax_wear, ax_miss) = _new_figure(1, 2, 4.0, demo_mode, bottom=1.3)
+    if "wear_time_hours" in df.columns:
+        ax_wear.plot(df["date"].to_numpy(), df["wear_time_hours"].to_numpy(dtype=float), linewidth=1.2)
+    _title(ax_wear, "wear_time_hours")
+    miss = df[cols].isna().mean()
+    ax_miss.bar(np.arange(len(cols)), miss.to_numpy(), tick_label=cols)
+    ax_miss.set_ylim(0, max(0.05, float(miss.max()) * 1.1))
+    for label in ax_miss.get_xticklabels():
+        label.set_horizontalalignment("right")
+    _title(ax_miss, "Missingness rate")
+    return fig
+
+
+def render_chart(name: str, key: str, demo_mode: bool, build) -> dict:
+    """
+    Render `build()` (returning a Figure) to PNG, cached in the process-wide
+    memo per (name, dataset key, demo mode). Returns {"png", "render_ms", "cached"};
+    on a cache hit, render_ms is the time of the original render.
+    """
+    fresh = []
+
+    def compute() -> dict:
+        fresh.append(True)
+        t0 = time.perf_counter()
+        fig = build()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=150 if demo_mode else 100)
+        fig.clear()
+        return {"png": buf.getvalue(), "render_ms": (time.perf_counter() - t0) * 1000.0}
+
+    out = get_memo_cache().get_or_compute(("chart", name, key, demo_mode), compute)
+    return {**out, "cached": not fresh}
+
+
+def render_caption(chart: dict) -> str:
+    if chart["cached"]:
+        return f"Chart served from cache (first render {chart['render_ms']:.0f} ms)."
+    return f"Chart rendered in {chart['render_ms']:.0f} ms."
@@ -0,0 +1,323 @@
+"""
+Conversation memory for the chat page.
+
+Recent messages are kept verbatim; once there are more than
+`keep_recent + summarize_every`, the oldest ones are folded into a running
+summary by an LLM call on a background thread, so the user never waits for
+it. Until that summary arrives the messages stay in `recent`, and
+build_chat_prompt drops the oldest verbatim turns if the prompt would exceed
+its token budget.
+
+route_question answers simple factual questions (a metric's recent average,
+the escalation level, flags, coverage, the date window) from the precomputed
+features with templated text, skipping the LLM call.
+"""
+from __future__ import annotations
+import os
+import re
+import statistics
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from src import tracing
+from src.llm import generate_text, recent_call_metrics
+from src.prompts import PROMPT_TOKEN_BUDGET, SYSTEM_BASE, build_chat_prompt, build_chat_summary_prompt, estimate_tokens
+
+
+# The context block is built with PROMPT_TOKEN_BUDGET (shared with the summary
+# prompts), so a smaller chat budget could not always fit it
+CHAT_TOKEN_BUDGET = int(os.environ.get("CHAT_TOKEN_BUDGET", PROMPT_TOKEN_BUDGET))
+KEEP_RECENT_MESSAGES = 6
+SUMMARIZE_EVERY = 4
+MAX_DISPLAY_MESSAGES = 200
+SUMMARY_MAX_CHARS = 1500
+
+CHAT_ROUTER_ENABLED = os.environ.get("CHAT_ROUTER", "1").lower() not in ("0", "false", "no")
+ROUTE_MIN_CONFIDENCE = 0.9
+ROUTE_MAX_CHARS = 120
+
+_SUMMARIZER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+def _fallback_summary(summary: str, turns: list[dict]) -> str:
+    # Used when the summary call fails: keep the user's own words, truncated
+    asked = "; ".join(m["content"][:160] for m in turns if m["role"] == "user")
+    text = f"{summary} User also asked: {asked}".strip() if asked else summary
+    return text[-SUMMARY_MAX_CHARS:]
+
+
+@dataclass
+class ChatMemory:
+    """
+    Running summary + recent verbatim messages + per-turn prompt stats.
+    """
+
+    keep_recent: int = KEEP_RECENT_MESSAGES
+    summarize_every: int = SUMMARIZE_EVERY
+    summary: str = ""
+    recent: list[dict] = field(default_factory=list)
+    turn_stats: deque = field(default_factory=lambda: deque(maxlen=50))
+    _pending: Future | None = None
+    _pending_count: int = 0
+
+    def add(self, role: str, content: str) -> None:
+        self.recent.append({"role": role, "content": content})
+
+    def collect(self) -> bool:
+        """
+        Apply a finished background summary; True if the memory changed.
+        """
+        if self._pending is None or not self._pending.done():
+            return False
+        folded = self.recent[: self._pending_count]
+        try:
+            self.summary = self._pending.result().strip()[:SUMMARY_MAX_CHARS]
+        except Exception:
+            self.summary = _fallback_summary(self.summary, folded)
+        del self.recent[: self._pending_count]
+        self._pending, self._pending_count = None, 0
+        return True
+
+    def maybe_summarize(self, model: str, use_cache: bool = True) -> bool:
+        """
+        Start folding the oldest messages into the summary in the background
+        if enough have accumulated and no summary is in flight.
+        """
+        self.collect()
+        if self._pending is not None or len(self.recent) < self.keep_recent + self.summarize_every:
+            return False
+        n = len(self.recent) - self.keep_recent
+        prompt = build_chat_summary_prompt(self.summary, self.recent[:n])
+        self._pending = _SUMMARIZER.submit(generate_text, prompt, SYSTEM_BASE, model, use_cache)
+        self._pending_count = n
+        tracing.count("chat_summaries")
+        return True
+
+    def prompt(self, block: str | None, question: str, token_budget: int | None = None) -> str:
+        self.collect()
+        budget = CHAT_TOKEN_BUDGET if token_budget is None else token_budget
+        return build_chat_prompt(block, self.summary, self.recent, question, budget)
+
+    def record_turn(self, **stats) -> None:
+        stats["summary_tokens"] = estimate_tokens(self.summary) if self.summary else 0
+        stats["recent_messages"] = len(self.recent)
+        self.turn_stats.append(stats)
+        tracing.record("chat_turn", stats.get("latency_ms", 0.0), **stats)
+        if stats.get("saved_ms"):
+            tracing.count("chat_route_saved_ms", stats["saved_ms"], route=stats.get("route"))
+
+    def expected_llm_ms(self) -> float | None:
+        """
+        Median latency of recent LLM-answered turns (what a routed answer saves);
+        before the first one, of recent uncached LLM calls in this process.
+        """
+        times = [t["latency_ms"] for t in self.turn_stats if t.get("route") == "llm" and t.get("latency_ms")]
+        if not times:
+            times = [r["total_ms"] for r in recent_call_metrics() if not r["cached"]]
+        return statistics.median(times) if times else None
+
+    def clear(self) -> None:
+        if self._pending is not None:
+            self._pending.cancel()
+        self.summary = ""
+        self.recent.clear()
+        self._pending, self._pending_count = None, 0
+
+
+# (label, unit, format) per trend metric, and the words users call it by
+METRICS = {
+    "steps": ("daily steps", "", "{:,.0f}"),
+    "resting_hr": ("resting heart rate", " bpm", "{:.1f}"),
+    "sleep_hours": ("sleep", " h per night", "{:.1f}"),
+    "sleep_efficiency": ("sleep efficiency", "", "{:.0%}"),
+    "hrv_proxy": ("HRV", "", "{:.1f}"),
+}
+_METRIC_WORDS = {
+    "steps": r"steps|step count|activity",
+    "resting_hr": r"resting heart rate|resting hr|rhr|heart rate|pulse",
+    "sleep_hours": r"sleep|sleep hours|sleep duration",
+    "sleep_efficiency": r"sleep efficiency",
+    "hrv_proxy": r"hrv|heart rate variability",
+}
+_METRIC_BY_WORD = {w: m for m, words in _METRIC_WORDS.items() for w in words.split("|")}
+_METRIC = "(?P<metric>" + "|".join(sorted(_METRIC_BY_WORD, key=len, reverse=True)) + ")"
+_WHEN = r"(?: (?:like|lately|recently|this week|last week|(?:over|in|for) the (?:last|past) (?:7|seven) days))?"
+
+# Each intent is a set of whole-question templates (matched after normalizing
+# case, punctuation and whitespace). A full match is a confident route; a
+# keyword hit in a short question is only logged as a near miss.
+_INTENTS = {
+    "metric": [
+        rf"(?:what|how) (?:is|was|were|are|has been|have been) (?:my|the) (?:(?:average|avg|recent|current|daily|mean) )*{_METRIC}{_WHEN}",
+        rf"(?:show|give|tell) me (?:my|the) (?:(?:average|avg|recent|daily) )*{_METRIC}{_WHEN}",
+        rf"how (?:did|have) i (?P<sleep>slept|sleep|been sleeping){_WHEN}",
+        rf"how many (?P<steps>steps) (?:did|have) i (?:take|taken|walk|walked|do|done)(?: a day| per day| each day)?{_WHEN}",
+    ],
+    "escalation": [
+        r"(?:what(?: is|s)|whats) (?:my|the) (?:current )?(?:escalation|risk|alert) (?:level|status)",
+        r"(?:escalation|risk) level",
+        r"(?:what|which) (?:escalation|risk) level (?:am i|is it|did i get)",
+    ],
+    "flags": [
+        r"(?:what|which) (?:flags|anomalies|alerts|changes) (?:were|are|have been|did you) (?:raised|detected|found|flagged)",
+        r"(?:were|are) there any (?:flags|anomalies|alerts)(?: (?:raised|detected|found))?",
+        r"(?:list|show)(?: me)? (?:the|my|all)? ?(?:flags|anomalies|alerts)",
+    ],
+    "coverage": [
+        r"how (?:much|many) (?:data|days)(?: of data)? (?:do you have|is there|are there|were recorded"
+        r"|did i wear (?:it|my (?:device|watch|ring|tracker)|the (?:device|watch|ring|tracker)))",
+        r"(?:what(?: is|s)|whats|how is|how good is) (?:my|the) data (?:quality|coverage)",
+        r"(?:were|are) there any missing days",
+    ],
+    "window": [
+        r"what (?:dates|period|time range|date range|window) (?:does this|do you|is this|are you) (?:cover|covering|looking at|using|based on)",
+        r"(?:what|which) (?:dates|days) (?:are|were) (?:included|analyzed|analysed|used)",
+    ],
+}
+# Phrasings each intent must answer (None: must go to the LLM); checked by
+# benchmarks/check_router.py
+ROUTE_EXAMPLES = {
+    "metric": [
+        "What was my average resting heart rate?",
+        "How did I sleep this week?",
+        "How many steps did I take?",
+        "Show me my HRV",
+        "What is my sleep efficiency lately?",
+        "What has been my step count over the last 7 days?",
+    ],
+    "escalation": ["What's my escalation level?", "What is the current risk level?", "Escalation level?"],
+    "flags": ["Were there any flags?", "What flags were detected?", "List all anomalies"],
+    "coverage": [
+        "How many days did I wear the device?",
+        "How many days did I wear it?",
+        "How much data do you have?",
+        "What is my data quality?",
+        "Are there any missing days?",
+    ],
+    "window": ["What dates does this cover?", "Which days were analyzed?"],
+    None: [
+        "Why is my heart rate up?",
+        "Should I worry about my sleep?",
+        "Is my resting heart rate normal?",
+        "Explain my flags",
+        "steps?",
+        "What does SLEEP_REDUCED mean?",
+    ],
+}
+
+_ROUTES = [(intent, re.compile(p)) for intent, patterns in _INTENTS.items() for p in patterns]
+_KEYWORDS = re.compile(r"\b(?:escalation|risk level|flags?|anomal\w*|coverage|missing|dates|" + "|".join(_METRIC_BY_WORD) + r")\b")
+# Questions asking for interpretation or advice always go to the LLM
+_NEEDS_LLM = re.compile(r"\b(?:why|should|explain|mean|means|worr\w*|normal|bad|good for|symptom\w*|feel\w*|compare|what if|cause\w*|help)\b")
+_PUNCT = re.compile(r"[^\w\s%]+")
+_SPACE = re.compile(r"\s+")
+
+
+def _normalize(question: str) -> str:
+    return _SPACE.sub(" ", _PUNCT.sub("", question.lower())).strip()
+
+
+def _classify(text: str) -> tuple[str | None, float, re.Match | None]:
+    if len(text) > ROUTE_MAX_CHARS or _NEEDS_LLM.search(text):
+        return None, 0.0, None
+    for intent, pattern in _ROUTES:
+        m = pattern.fullmatch(text)
+        if m:
+            return intent, 1.0, m
+    if len(text.split()) <= 8 and _KEYWORDS.search(text):
+        return None, 0.5, None
+    return None, 0.0, None
+
+
+def _confidence_note(features: dict) -> str:
+    cov = features["coverage"]
+    return (
+        f"Data confidence: device worn at least 12 hours on {cov['wear_ok_days']} of the last 7 days, "
+        f"sleep recorded on {7 - cov['missing_sleep_days']}/7."
+    )
+
+
+def _metric_answer(features: dict, metric: str) -> str | None:
+    t = features.get("trends", {}).get(metric)
+    if not t:
+        return None
+    label, unit, fmt = METRICS[metric]
+    if pd.isna(t.get("last7_avg")):
+        return f"There are no {label} values in the last 7 days, so there is no recent average to report."
+    text = f"Your average {label} over the last 7 days was {fmt.format(t['last7_avg'])}{unit}"
+    if not pd.isna(t.get("baseline_median")):
+        text += f", compared with a baseline median of {fmt.format(t['baseline_median'])}{unit}"
+        if not pd.isna(t.get("delta_pct")):
+            text += f" ({t['delta_pct']:+.1f}%)"
+    return text + "."
+
+
+def _flags_answer(features: dict) -> str:
+    flags = features["flags"]
+    if not flags:
+        return "No flags were raised for the last 7 days."
+    lines = [f"- **{f['type']}** ({f['severity']}): {f['rationale']}" for f in flags]
+    return f"{len(flags)} flag(s) were raised for the last 7 days:\n" + "\n".join(lines)
+
+
+def _escalation_answer(escalation: dict) -> str:
+    text = (
+        f"The rule-based escalation level is **{escalation['level']}** "
+        f"(confidence: {escalation['confidence']}). " + " ".join(escalation["rationale"])
+    )
+    if escalation["level"] == "high":
+        text += " Consider contacting a clinician or local health service, especially if you have symptoms."
+    return text
+
+
+def _answer(intent: str, m: re.Match, features: dict, escalation: dict) -> str | None:
+    if intent == "metric":
+        groups = m.groupdict()
+        if groups.get("sleep"):
+            metric = "sleep_hours"
+        elif groups.get("steps"):
+            metric = "steps"
+        else:
+            metric = _METRIC_BY_WORD[groups["metric"]]
+        return _metric_answer(features, metric)
+    if intent == "escalation":
+        return _escalation_answer(escalation)
+    if intent == "flags":
+        return _flags_answer(features)
+    if intent == "coverage":
+        # days_present only counts calendar dates; wear time and missing values tell how much was recorded
+        cov = features["coverage"]
+        return (
+            f"You wore the device for at least 12 hours on {cov['wear_ok_days']} of the last 7 days. "
+            f"Sleep was recorded on {7 - cov['missing_sleep_days']}/7 days, and steps, resting heart rate and "
+            f"wear time on {7 - cov['missing_any_core_days']}/7. Escalation confidence from this coverage is "
+            f"{escalation['confidence']}."
+        )
+    if intent == "window":
+        w = features["window"]
+        return f"The analysis covers {w['start']} to {w['end']}; trends compare the last 7 days with the earlier baseline."
+    return None
+
+
+def route_question(question: str, features: dict | None, escalation: dict | None) -> dict:
+    """
+    Routing decision for a chat question: {"intent", "confidence", "answer",
+    "route_ms"}. `answer` is a templated reply built from the features when a
+    whole-question template matches (confidence 1.0), else None and the
+    caller asks the LLM. Takes a few microseconds.
+    """
+    t0 = time.perf_counter()
+    intent, confidence, answer = None, 0.0, None
+    if CHAT_ROUTER_ENABLED and features is not None and escalation is not None:
+        intent, confidence, m = _classify(_normalize(question))
+        if intent is not None and confidence >= ROUTE_MIN_CONFIDENCE:
+            answer = _answer(intent, m, features, escalation)
+            if answer is not None and intent != "coverage":
+                answer += "\n\n" + _confidence_note(features)
+    route_ms = (time.perf_counter() - t0) * 1000.0
+    tracing.count("chat_routes", route=intent if answer is not None else "llm")
+    return {"intent": intent, "confidence": confidence, "answer": answer, "route_ms": route_ms}
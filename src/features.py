@@ -1,14 +1,36 @@
 from __future__ import annotations
+import bisect
+import itertools
+import math
+from collections import deque
+from dataclasses import dataclass
 import pandas as pd
 import numpy as np
 
+from src.tracing import traced
+
 
 NUM_COLS = ["steps", "resting_hr", "sleep_hours", "sleep_efficiency", "hrv_proxy", "wear_time_hours"]
+TREND_KINDS = {
+    "steps": "count",
+    "resting_hr": "ratio",
+    "sleep_hours": "ratio",
+    "sleep_efficiency": "ratio",
+    "hrv_proxy": "ratio",
+}
+TREND_METRICS = list(TREND_KINDS)
+FLAG_TYPES = ["RHR_ELEVATED", "SLEEP_REDUCED", "ACTIVITY_DOWN", "LOW_WEAR_TIME", "MISSING_SLEEP", "MISSING_CORE_SIGNALS"]
 
 
-def load_and_validate(df: pd.DataFrame) -> pd.DataFrame:
+@traced(attrs=lambda out, df, *a, **k: {"rows": len(df)})
+def load_and_validate(df: pd.DataFrame, compact: bool = False) -> pd.DataFrame:
     """
     Ensure expected columns exist and coerce types.
+    Columns that already have the right dtype (e.g. read from Parquet/Arrow)
+    are not re-parsed. compact=True stores integer metrics as int32 and notes
+    as a category to reduce memory for large datasets; both are lossless, so
+    compute_features gives the same results either way. Float metrics stay
+    float64 (float32 rounding can move a value across a flag threshold).
     """
     required = ["date"] + NUM_COLS
     missing = [c for c in required if c not in df.columns]
@@ -16,25 +38,262 @@ def load_and_validate(df: pd.DataFrame) -> pd.DataFrame:
         raise ValueError(f"Missing columns: {missing}")
 
     out = df.copy()
-    out["date"] = pd.to_datetime(out["date"], errors="coerce")
+    if not pd.api.types.is_datetime64_any_dtype(out["date"]):
+        out["date"] = pd.to_datetime(out["date"], errors="coerce")
     if out["date"].isna().any():
         raise ValueError("Some 'date' values could not be parsed.")
 
     for c in NUM_COLS:
-        out[c] = pd.to_numeric(out[c], errors="coerce")
+        if not _is_plain_numeric(out[c]):
+            out[c] = pd.to_numeric(out[c], errors="coerce")
 
     if "notes" not in out.columns:
         out["notes"] = ""
 
+    if compact:
+        out = _compact_dtypes(out)
+
     out = out.sort_values("date").reset_index(drop=True)
     return out
 
 
+def _is_plain_numeric(s: pd.Series) -> bool:
+    # NumPy int/float only; nullable extension dtypes still go through to_numeric
+    return isinstance(s.dtype, np.dtype) and s.dtype.kind in "iuf"
+
+
+def _compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for c in NUM_COLS:
+        s = df[c]
+        if s.dtype.kind in "iu" and s.between(np.iinfo(np.int32).min, np.iinfo(np.int32).max).all():
+            df[c] = s.astype(np.int32)
+    # "" must be a category so compute_features' fillna("") still works
+    df["notes"] = df["notes"].fillna("").astype(str).astype("category")
+    return df
+
+
 def _rolling_median(s: pd.Series, window: int) -> pd.Series:
     return s.rolling(window=window, min_periods=max(3, window // 3)).median()
 
 
-def compute_features(df: pd.DataFrame) -> dict:
+def _summarize_metric(base: float, last7_avg: float, kind: str) -> dict:
+    delta = last7_avg - base
+    out = {"baseline_median": round(base, 2), "last7_avg": round(last7_avg, 2), "delta": round(delta, 2)}
+    if kind in ("ratio", "count"):
+        if abs(base) > 1e-9:
+            out["delta_pct"] = round((delta / base) * 100.0, 1)
+    return out
+
+
+def _mad_scale(x: pd.Series) -> float:
+    # Robust scale from baseline using MAD
+    x = x.dropna()
+    if len(x) < 5:
+        return float("nan")
+    med = float(x.median())
+    mad = float(np.median(np.abs(x - med)))
+    return mad * 1.4826  # approx std
+
+
+# ---------------------------------------------------------------------------
+# Flag rules (declarative thresholds)
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class FlagRule:
+    """
+    One anomaly flag, declared against feature-table columns.
+
+    The flag fires when `value` <op> reference, where
+        reference = baseline * ratio + offset            (offset alone if baseline is None)
+    and, if `mad` is set, offset becomes max(offset, mad * scale). NaN never fires.
+    `bands` upgrade the severity: (severity, ratio, offset) tuples using the same
+    reference form, matched inclusively in the rule's direction (later bands win).
+    `rationale` is a str.format template over the feature row; built-in flag
+    types fall back to their usual wording.
+    """
+    type: str
+    value: str
+    op: str
+    baseline: str | None = None
+    ratio: float = 1.0
+    offset: float = 0.0
+    mad: float | None = None
+    scale: str | None = None
+    severity: str = "moderate"
+    bands: tuple = ()
+    rationale: str | None = None
+
+
+DEFAULT_FLAG_RULES = (
+    FlagRule(
+        "RHR_ELEVATED", "resting_hr_last7_avg", ">", baseline="resting_hr_baseline_median",
+        offset=3.0, mad=1.0, scale="resting_hr_mad_scale", bands=(("high", 1.0, 7.0),),
+    ),
+    FlagRule(
+        "SLEEP_REDUCED", "sleep_hours_last7_avg", "<", baseline="sleep_hours_baseline_median",
+        offset=-0.8, bands=(("high", 1.0, -1.3),),
+    ),
+    FlagRule(
+        "ACTIVITY_DOWN", "steps_last7_avg", "<", baseline="steps_baseline_median",
+        ratio=0.7, bands=(("high", 0.55, 0.0),),
+    ),
+    FlagRule("LOW_WEAR_TIME", "wear_ok_days", "<", offset=4),
+    FlagRule("MISSING_SLEEP", "missing_sleep_days", ">=", offset=2),
+    FlagRule("MISSING_CORE_SIGNALS", "missing_any_core_days", ">=", offset=2),
+)
+
+SEVERITIES = ("", "moderate", "high")
+_OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+
+
+def _rule_shape(rule: FlagRule) -> tuple:
+    # Everything except the numeric thresholds
+    return (rule.type, rule.value, rule.op, rule.baseline, rule.scale, rule.mad is None,
+            rule.severity, tuple(b[0] for b in rule.bands), rule.rationale)
+
+
+class CompiledFlagRules:
+    """
+    One or more rule sets compiled into broadcastable threshold arrays.
+
+    All variants must have the same structure (types, columns, operators) and
+    differ only in ratio/offset/mad values, so every variant is evaluated in a
+    single pass: thresholds have shape (V, 1) and feature columns shape (N,).
+    """
+
+    def __init__(self, variants: list):
+        variants = [tuple(v) for v in variants]
+        if not variants:
+            raise ValueError("Need at least one rule set.")
+        shape = [_rule_shape(r) for r in variants[0]]
+        if any([_rule_shape(r) for r in v] != shape for v in variants[1:]):
+            raise ValueError("Rule variants may only differ in numeric thresholds.")
+        types = [r.type for r in variants[0]]
+        if len(set(types)) != len(types):
+            raise ValueError(f"Duplicate flag types in rule set: {types}")
+        for r in variants[0]:
+            if r.op not in _OPS:
+                raise ValueError(f"Unknown operator {r.op!r} in rule {r.type}.")
+            if r.mad is not None and r.scale is None:
+                raise ValueError(f"Rule {r.type} sets mad without a scale column.")
+            unknown = [s for s in [r.severity] + [b[0] for b in r.bands] if s not in SEVERITIES[1:]]
+            if unknown:
+                raise ValueError(f"Unknown severities {unknown} in rule {r.type}.")
+
+        self.rules = variants[0]
+        self.n_variants = len(variants)
+        self._params = []
+        for j, rule in enumerate(self.rules):
+            def col(get):
+                return np.array([get(v[j]) for v in variants], dtype=float)[:, None]
+
+            bands = [
+                (SEVERITIES.index(sev), col(lambda r, k=k: r.bands[k][1]), col(lambda r, k=k: r.bands[k][2]))
+                for k, (sev, _, _) in enumerate(rule.bands)
+            ]
+            mad = col(lambda r: r.mad) if rule.mad is not None else None
+            self._params.append((col(lambda r: r.ratio), col(lambda r: r.offset), mad, bands))
+
+    def evaluate(self, cols) -> np.ndarray:
+        """
+        Severity codes (index into SEVERITIES) with shape (variants, rules, rows)
+        for a mapping of feature columns (a cohort_feature_table or dict of arrays).
+        """
+        n = len(np.atleast_1d(cols[self.rules[0].value]))
+        codes = np.zeros((self.n_variants, len(self.rules), n), dtype=np.uint8)
+        with np.errstate(invalid="ignore"):
+            for j, (rule, (ratio, offset, mad, bands)) in enumerate(zip(self.rules, self._params)):
+                value = np.atleast_1d(np.asarray(cols[rule.value], dtype=float))
+                base = None if rule.baseline is None else np.atleast_1d(np.asarray(cols[rule.baseline], dtype=float))
+                if mad is not None:
+                    offset = np.maximum(offset, mad * np.atleast_1d(np.asarray(cols[rule.scale], dtype=float)))
+
+                hit = _OPS[rule.op](value, offset if base is None else base * ratio + offset)
+                code = np.where(hit, SEVERITIES.index(rule.severity), 0)
+                band_op = np.greater_equal if rule.op.startswith(">") else np.less_equal
+                for sev, b_ratio, b_offset in bands:
+                    ref = b_offset if base is None else base * b_ratio + b_offset
+                    code = np.where(hit & band_op(value, ref), sev, code)
+                codes[:, j] = code
+        return codes
+
+    def flag_columns(self, cols, variant: int = 0) -> dict:
+        """
+        {"flag_<TYPE>": severity strings ("" = not flagged)} for one variant.
+        """
+        codes = self.evaluate(cols)[variant]
+        labels = np.array(SEVERITIES)
+        return {f"flag_{r.type}": labels[codes[j]] for j, r in enumerate(self.rules)}
+
+
+def compile_flag_rules(rules=None) -> CompiledFlagRules:
+    """
+    Compile a rule set (default: DEFAULT_FLAG_RULES), or a list of rule-set
+    variants for batched threshold evaluation. Already compiled rules pass through.
+    """
+    if rules is None:
+        return _DEFAULT_COMPILED
+    if isinstance(rules, CompiledFlagRules):
+        return rules
+    rules = list(rules)
+    if rules and isinstance(rules[0], FlagRule):
+        return CompiledFlagRules([rules])
+    return CompiledFlagRules(rules)
+
+
+_DEFAULT_COMPILED = CompiledFlagRules([DEFAULT_FLAG_RULES])
+
+
+def _flag_rationale(rule: FlagRule, row: dict) -> str:
+    if rule.rationale is not None:
+        return rule.rationale.format(**row)
+    if rule.type == "RHR_ELEVATED":
+        return f"Last-7 avg {row['resting_hr_last7_avg']} vs baseline {row['resting_hr_baseline_median']} bpm."
+    if rule.type == "SLEEP_REDUCED":
+        return f"Last-7 avg {row['sleep_hours_last7_avg']}h vs baseline {row['sleep_hours_baseline_median']}h."
+    if rule.type == "ACTIVITY_DOWN":
+        return f"Last-7 avg {int(row['steps_last7_avg'])} vs baseline {int(row['steps_baseline_median'])} steps."
+    if rule.type == "LOW_WEAR_TIME":
+        return f"Wear-time ≥12h on {row['wear_ok_days']}/7 days."
+    if rule.type == "MISSING_SLEEP":
+        return f"Missing sleep values on {row['missing_sleep_days']}/7 days."
+    if rule.type == "MISSING_CORE_SIGNALS":
+        return f"Missing core signals on {row['missing_any_core_days']}/7 days."
+    ref = f" vs {row[rule.baseline]}" if rule.baseline else ""
+    return f"{rule.value} {row[rule.value]}{ref}."
+
+
+def _build_flags(
+    trends: dict,
+    wear_ok_days: int,
+    missing_sleep_days: int,
+    missing_any: int,
+    rhr_scale: float,
+    rules=None,
+) -> list:
+    """
+    Anomaly markers for one user from last7 vs baseline median and MAD scale,
+    evaluated with the compiled flag rules (default thresholds unless given).
+    """
+    compiled = compile_flag_rules(rules)
+    row = {f"{m}_{k}": v for m, t in trends.items() for k, v in t.items()}
+    row.update({
+        "resting_hr_mad_scale": rhr_scale,
+        "wear_ok_days": wear_ok_days,
+        "missing_sleep_days": missing_sleep_days,
+        "missing_any_core_days": missing_any,
+    })
+    codes = compiled.evaluate(row)[0, :, 0]
+    return [
+        {"type": rule.type, "severity": SEVERITIES[code], "rationale": _flag_rationale(rule, row)}
+        for rule, code in zip(compiled.rules, codes.tolist())
+        if code
+    ]
+
+
+@traced(attrs=lambda out, df, *a, **k: {"rows": len(df), "flags": len(out["flags"])})
+def compute_features(df: pd.DataFrame, rules=None, horizons=None) -> dict:
     """
     Compute compact, LLM-friendly feature summary.
     Uses:
@@ -42,6 +301,8 @@ def compute_features(df: pd.DataFrame) -> dict:
       - last7: average over last 7 days
       - change: delta and percent where relevant
       - data coverage: missingness + wear time adequacy
+    `rules` overrides DEFAULT_FLAG_RULES (see FlagRule). `horizons` (e.g.
+    HORIZONS) adds per-window mean/median/MAD under "horizons".
     """
     df = df.copy()
     df["date_str"] = df["date"].dt.date.astype(str)
@@ -61,67 +322,11 @@ def compute_features(df: pd.DataFrame) -> dict:
     missing_sleep_days = int(last7["sleep_hours"].isna().sum())
     missing_any = int(last7[["steps", "resting_hr", "wear_time_hours"]].isna().any(axis=1).sum())
 
-    def summarize_metric(col: str, kind: str) -> dict:
-        base = float(prev[col].median(skipna=True))
-        last7_avg = float(last7[col].mean(skipna=True))
-        delta = last7_avg - base
-        out = {"baseline_median": round(base, 2), "last7_avg": round(last7_avg, 2), "delta": round(delta, 2)}
-        if kind in ("ratio", "count"):
-            if abs(base) > 1e-9:
-                out["delta_pct"] = round((delta / base) * 100.0, 1)
-        return out
-
     trends = {
-        "steps": summarize_metric("steps", "count"),
-        "resting_hr": summarize_metric("resting_hr", "ratio"),
-        "sleep_hours": summarize_metric("sleep_hours", "ratio"),
-        "sleep_efficiency": summarize_metric("sleep_efficiency", "ratio"),
-        "hrv_proxy": summarize_metric("hrv_proxy", "ratio"),
+        c: _summarize_metric(float(prev[c].median(skipna=True)), float(last7[c].mean(skipna=True)), kind)
+        for c, kind in TREND_KINDS.items()
     }
-
-    # Simple anomaly markers using last7 vs prev median and MAD scale
-    flags = []
-    def add_flag(flag_type: str, severity: str, rationale: str):
-        flags.append({"type": flag_type, "severity": severity, "rationale": rationale})
-
-    # Compute robust scale from prev using MAD
-    def mad_scale(x: pd.Series) -> float:
-        x = x.dropna()
-        if len(x) < 5:
-            return float("nan")
-        med = float(x.median())
-        mad = float(np.median(np.abs(x - med)))
-        return mad * 1.4826  # approx std
-
-    # RHR elevated
-    rhr_base = trends["resting_hr"]["baseline_median"]
-    rhr_last7 = trends["resting_hr"]["last7_avg"]
-    rhr_scale = mad_scale(prev["resting_hr"])
-    if not np.isnan(rhr_scale) and rhr_last7 > rhr_base + max(3.0, 1.0 * rhr_scale):
-        sev = "moderate" if rhr_last7 < rhr_base + 7 else "high"
-        add_flag("RHR_ELEVATED", sev, f"Last-7 avg {rhr_last7} vs baseline {rhr_base} bpm.")
-
-    # Sleep reduced
-    sl_base = trends["sleep_hours"]["baseline_median"]
-    sl_last7 = trends["sleep_hours"]["last7_avg"]
-    if not np.isnan(sl_last7) and sl_last7 < sl_base - 0.8:
-        sev = "moderate" if sl_last7 > sl_base - 1.3 else "high"
-        add_flag("SLEEP_REDUCED", sev, f"Last-7 avg {sl_last7}h vs baseline {sl_base}h.")
-
-    # Steps down
-    st_base = trends["steps"]["baseline_median"]
-    st_last7 = trends["steps"]["last7_avg"]
-    if not np.isnan(st_last7) and st_last7 < st_base * 0.7:
-        sev = "moderate" if st_last7 > st_base * 0.55 else "high"
-        add_flag("ACTIVITY_DOWN", sev, f"Last-7 avg {int(st_last7)} vs baseline {int(st_base)} steps.")
-
-    # Low wear / missingness
-    if wear_ok_days < 4:
-        add_flag("LOW_WEAR_TIME", "moderate", f"Wear-time ≥12h on {wear_ok_days}/7 days.")
-    if missing_sleep_days >= 2:
-        add_flag("MISSING_SLEEP", "moderate", f"Missing sleep values on {missing_sleep_days}/7 days.")
-    if missing_any >= 2:
-        add_flag("MISSING_CORE_SIGNALS", "moderate", f"Missing core signals on {missing_any}/7 days.")
+    flags = _build_flags(trends, wear_ok_days, missing_sleep_days, missing_any, _mad_scale(prev["resting_hr"]), rules)
 
     # Pull notes from last7
     last7_notes = [n for n in last7.get("notes", "").fillna("").tolist() if str(n).strip()]
@@ -141,4 +346,545 @@ def compute_features(df: pd.DataFrame) -> dict:
         "flags": flags,
         "last7_notes": last7_notes[:5],
     }
+    if horizons:
+        feature_summary["horizons"] = multi_window_summary(df, horizons)
     return feature_summary
+
+
+# ---------------------------------------------------------------------------
+# Cohort-scale (vectorized) feature computation
+# ---------------------------------------------------------------------------
+
+def _round_exact(values: np.ndarray, ndigits: int) -> np.ndarray:
+    # Python's round() is correctly rounded; np.round is not always bit-identical to it.
+    return np.array([round(v, ndigits) for v in values.tolist()], dtype=float)
+
+
+def _group_median(values: np.ndarray, codes: np.ndarray, n_groups: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    NaN-skipping median per group code. Returns (medians, non-NaN counts).
+    Matches pandas Series.median(): midpoint of the two middle order statistics.
+    """
+    order = np.lexsort((values, codes))  # NaN sorts last within each group
+    v = values[order]
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    counts = np.bincount(codes, weights=~np.isnan(values), minlength=n_groups).astype(int)
+
+    med = np.full(n_groups, np.nan)
+    ok = counts > 0
+    lo = starts[ok] + (counts[ok] - 1) // 2
+    hi = starts[ok] + counts[ok] // 2
+    med[ok] = (v[lo] + v[hi]) / 2.0
+    return med, counts
+
+
+def cohort_feature_table(long_df: pd.DataFrame, user_col: str = "user_id", rules=None) -> pd.DataFrame:
+    """
+    Columnar version of compute_features for many users at once.
+    Expects validated rows (see load_and_validate) plus a user column.
+    One row per user with >= 10 days; shorter histories are skipped.
+    Values are rounded exactly as in the compute_features dicts.
+    """
+    required = [user_col, "date"] + NUM_COLS
+    missing = [c for c in required if c not in long_df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+    df = long_df.sort_values([user_col, "date"], kind="mergesort")
+    codes, users = pd.factorize(df[user_col], sort=False)
+    sizes = np.bincount(codes, minlength=len(users))
+    keep = sizes >= 10
+
+    # Restrict to users with enough history and re-number groups densely
+    row_keep = keep[codes]
+    codes = np.cumsum(keep)[codes[row_keep]] - 1
+    users = users[keep]
+    sizes = sizes[keep]
+    n_users = len(users)
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+
+    pos = np.arange(len(codes)) - starts[codes]
+    prev_len = np.where(sizes - 7 >= 5, sizes - 7, sizes - 3)
+    in_prev = pos < prev_len[codes]
+    prev_codes = codes[in_prev]
+
+    # (n_users, 7) row indices of each user's last-7 window
+    last7_idx = ends[:, None] - 7 + np.arange(7)[None, :]
+
+    cols = {c: df[c].to_numpy(dtype=float)[row_keep] for c in NUM_COLS}
+    dates = df["date"].to_numpy()[row_keep]
+    out = {}
+
+    for c in TREND_METRICS:
+        base, _ = _group_median(cols[c][in_prev], prev_codes, n_users)
+        w = cols[c][last7_idx]
+        nan = np.isnan(w)
+        n_obs = (~nan).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            last7_avg = np.where(nan, 0.0, w).sum(axis=1) / n_obs
+            delta = last7_avg - base
+            # has_delta_pct mirrors _summarize_metric: a NaN last7 still yields a (NaN) percent
+            has_pct = np.abs(base) > 1e-9
+            pct = np.where(has_pct, (delta / base) * 100.0, np.nan)
+        out[f"{c}_baseline_median"] = _round_exact(base, 2)
+        out[f"{c}_last7_avg"] = _round_exact(last7_avg, 2)
+        out[f"{c}_delta"] = _round_exact(delta, 2)
+        out[f"{c}_delta_pct"] = _round_exact(pct, 1)
+        out[f"{c}_has_delta_pct"] = has_pct
+
+    # Robust scale (MAD) of resting HR over the baseline slice
+    rhr_prev = cols["resting_hr"][in_prev]
+    rhr_med, rhr_n = _group_median(rhr_prev, prev_codes, n_users)
+    abs_dev, _ = _group_median(np.abs(rhr_prev - rhr_med[prev_codes]), prev_codes, n_users)
+    out["resting_hr_mad_scale"] = np.where(rhr_n >= 5, abs_dev * 1.4826, np.nan)
+
+    # Coverage / quality over last 7 rows
+    d7 = np.sort(dates[last7_idx], axis=1)
+    out["days_present"] = 1 + (d7[:, 1:] != d7[:, :-1]).sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        out["wear_ok_days"] = (cols["wear_time_hours"][last7_idx] >= 12).sum(axis=1)
+    out["missing_sleep_days"] = np.isnan(cols["sleep_hours"][last7_idx]).sum(axis=1)
+    core_nan = np.isnan(cols["steps"]) | np.isnan(cols["resting_hr"]) | np.isnan(cols["wear_time_hours"])
+    out["missing_any_core_days"] = core_nan[last7_idx].sum(axis=1)
+
+    window = pd.DatetimeIndex(dates[last7_idx[:, [0, -1]]].ravel()).date.astype(str).reshape(-1, 2)
+    out["window_start"] = window[:, 0]
+    out["window_end"] = window[:, 1]
+
+    # Flags (same rules as compute_features, on rounded trend values)
+    out.update(compile_flag_rules(rules).flag_columns(out))
+
+    # Notes from last7 (first 5 non-empty)
+    notes = df["notes"].fillna("").to_numpy(dtype=object)[row_keep][last7_idx]
+    out["last7_notes"] = [[n for n in row if str(n).strip()][:5] for row in notes.tolist()]
+
+    table = pd.DataFrame(out, index=pd.Index(users, name=user_col))
+    for c in ["days_present", "wear_ok_days", "missing_sleep_days", "missing_any_core_days"]:
+        table[c] = table[c].astype(int)
+    return table
+
+
+def feature_table_to_dicts(table: pd.DataFrame, rules=None) -> dict:
+    """
+    Convert a cohort_feature_table into {user_id: compute_features-style dict}.
+    Pass the same `rules` the table was built with (for flag order and wording).
+    """
+    flag_rules = compile_flag_rules(rules).rules
+    result = {}
+    for user, row in zip(table.index.tolist(), table.to_dict("records")):
+        trends = {}
+        for c in TREND_METRICS:
+            t = {
+                "baseline_median": row[f"{c}_baseline_median"],
+                "last7_avg": row[f"{c}_last7_avg"],
+                "delta": row[f"{c}_delta"],
+            }
+            if row[f"{c}_has_delta_pct"]:
+                t["delta_pct"] = row[f"{c}_delta_pct"]
+            trends[c] = t
+
+        flags = [
+            {"type": r.type, "severity": row[f"flag_{r.type}"], "rationale": _flag_rationale(r, row)}
+            for r in flag_rules
+            if row[f"flag_{r.type}"]
+        ]
+
+        result[user] = {
+            "window": {"start": row["window_start"], "end": row["window_end"]},
+            "coverage": {
+                "days_present": int(row["days_present"]),
+                "wear_ok_days": int(row["wear_ok_days"]),
+                "missing_sleep_days": int(row["missing_sleep_days"]),
+                "missing_any_core_days": int(row["missing_any_core_days"]),
+            },
+            "trends": trends,
+            "flags": flags,
+            "last7_notes": list(row["last7_notes"]),
+        }
+    return result
+
+
+def compute_features_cohort(long_df: pd.DataFrame, user_col: str = "user_id", rules=None) -> dict:
+    """
+    Batched compute_features over a long-format frame keyed by `user_col`.
+    Returns {user_id: feature dict}; users with < 10 days are omitted.
+    """
+    return feature_table_to_dicts(cohort_feature_table(long_df, user_col=user_col, rules=rules), rules=rules)
+
+
+# ---------------------------------------------------------------------------
+# Incremental (append-one-day) feature state
+# ---------------------------------------------------------------------------
+
+class _SortedValues:
+    """
+    Blocked sorted list: O(sqrt n) insertion and O(n / block) k-th lookup.
+    """
+
+    def __init__(self, values, block: int = 256):
+        vals = sorted(values)
+        self._block = block
+        self._blocks = [vals[i:i + block] for i in range(0, len(vals), block)]
+        self._maxes = [b[-1] for b in self._blocks]
+        self._len = len(vals)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, x: float) -> None:
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([x])
+            self._maxes.append(x)
+            return
+        i = min(bisect.bisect_left(self._maxes, x), len(self._blocks) - 1)
+        blk = self._blocks[i]
+        bisect.insort(blk, x)
+        self._maxes[i] = blk[-1]
+        if len(blk) > 2 * self._block:
+            self._blocks[i:i + 1] = [blk[:self._block], blk[self._block:]]
+            self._maxes[i:i + 1] = [blk[self._block - 1], blk[-1]]
+
+    def bisect_left(self, x: float) -> int:
+        i = bisect.bisect_left(self._maxes, x)
+        if i == len(self._blocks):
+            return self._len
+        return sum(len(b) for b in self._blocks[:i]) + bisect.bisect_left(self._blocks[i], x)
+
+    def __getitem__(self, k: int) -> float:
+        for blk in self._blocks:
+            if k < len(blk):
+                return blk[k]
+            k -= len(blk)
+        raise IndexError(k)
+
+    def __iter__(self):
+        for blk in self._blocks:
+            yield from blk
+
+    def median(self) -> float:
+        return _median_sorted(self)
+
+    def mad_scale(self) -> float:
+        return _mad_scale_sorted(self)
+
+
+class _CountedValues:
+    """
+    Multiset stored as value -> count. Daily aggregates have fixed precision,
+    so memory is bounded by the number of distinct values, not history length.
+    Order statistics are computed on demand in O(d log d).
+    """
+
+    def __init__(self, values=()):
+        self._counts: dict[float, int] = {}
+        self._len = 0
+        for v in values:
+            self.add(v)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, x: float) -> None:
+        self._counts[x] = self._counts.get(x, 0) + 1
+        self._len += 1
+
+    def __iter__(self):
+        for v in sorted(self._counts):
+            yield from [v] * self._counts[v]
+
+    @staticmethod
+    def _kth(keys: list, cum: list, k: int) -> float:
+        return keys[bisect.bisect_right(cum, k)]
+
+    def _median_of(self, counts: dict) -> float:
+        keys = sorted(counts)
+        cum = list(itertools.accumulate(counts[k] for k in keys))
+        n = cum[-1] if cum else 0
+        if n == 0:
+            return float("nan")
+        return (self._kth(keys, cum, (n - 1) // 2) + self._kth(keys, cum, n // 2)) / 2.0
+
+    def median(self) -> float:
+        return self._median_of(self._counts)
+
+    def mad_scale(self) -> float:
+        if self._len < 5:
+            return float("nan")
+        med = self.median()
+        dev: dict[float, int] = {}
+        for v, c in self._counts.items():
+            d = abs(v - med)
+            dev[d] = dev.get(d, 0) + c
+        return self._median_of(dev) * 1.4826
+
+
+def _median_sorted(s) -> float:
+    n = len(s)
+    if n == 0:
+        return float("nan")
+    return (s[(n - 1) // 2] + s[n // 2]) / 2.0
+
+
+def _mad_scale_sorted(s) -> float:
+    """
+    Same result as _mad_scale, using order-statistic selection on sorted values
+    instead of materializing |x - median|.
+    """
+    n = len(s)
+    if n < 5:
+        return float("nan")
+    med = _median_sorted(s)
+    p = s.bisect_left(med) if isinstance(s, _SortedValues) else bisect.bisect_left(s, med)
+    n_left, n_right = p, n - p
+
+    def left(j: int) -> float:   # j-th smallest deviation below the median
+        return med - s[p - 1 - j]
+
+    def right(j: int) -> float:  # j-th smallest deviation at/above the median
+        return s[p + j] - med
+
+    def kth(k: int) -> float:
+        lo, hi = max(0, k + 1 - n_right), min(k + 1, n_left)
+        while lo < hi:
+            i = (lo + hi) // 2
+            if left(i) < right(k - i):
+                lo = i + 1
+            else:
+                hi = i
+        i, j = lo, k + 1 - lo
+        cands = ([left(i - 1)] if i > 0 else []) + ([right(j - 1)] if j > 0 else [])
+        return max(cands)
+
+    mad = (kth((n - 1) // 2) + kth(n // 2)) / 2.0
+    return mad * 1.4826
+
+
+def _window_mean(values: list) -> float:
+    # Same summation as pandas Series.mean(skipna=True) on the 7-row window
+    w = np.asarray(values, dtype=float)
+    nan = np.isnan(w)
+    n_obs = int((~nan).sum())
+    if n_obs == 0:
+        return float("nan")
+    return float(np.where(nan, 0.0, w).sum() / n_obs)
+
+
+# ---------------------------------------------------------------------------
+# Multi-horizon statistics
+# ---------------------------------------------------------------------------
+
+HORIZONS = (7, 14, 28, 90)
+
+
+def _horizon_min_periods(window: int) -> int:
+    # Same rule as _rolling_median
+    return max(3, window // 3)
+
+
+def _check_windows(windows) -> list:
+    windows = sorted({int(w) for w in windows})
+    if not windows or windows[0] < 1:
+        raise ValueError(f"Windows must be positive day counts, got {windows}.")
+    return windows
+
+
+def multi_window_summary(df: pd.DataFrame, windows=HORIZONS) -> dict:
+    """
+    Mean / median / MAD scale of each trend metric over the last w days,
+    for every window: {"7d": {"steps": {...}, ...}, "14d": ...}.
+    """
+    windows = _check_windows(windows)
+    arrays = {m: df[m].to_numpy(dtype=float) for m in TREND_METRICS}
+    summary = {}
+    for w in windows:
+        per_metric = {}
+        for m, x in arrays.items():
+            tail = np.sort(x[-w:][~np.isnan(x[-w:])]).tolist()
+            ok = len(tail) >= _horizon_min_periods(w)
+            per_metric[m] = {
+                "mean": round(math.fsum(tail) / len(tail), 2) if ok else None,
+                "median": round(_median_sorted(tail), 2) if ok else None,
+                "mad_scale": round(_mad_scale_sorted(tail), 2) if ok and len(tail) >= 5 else None,
+                "days": len(tail),
+            }
+        summary[f"{w}d"] = per_metric
+    return summary
+
+
+class IncrementalFeatures:
+    """
+    Feature state that is updated one appended day at a time.
+
+    Keeps the last-7 window and a sorted baseline per metric, so append()
+    costs O(sqrt n) and features() is identical to compute_features on the
+    full history. With counted=True the baseline is kept as value counts
+    instead: O(1) append and memory bounded by distinct values, at the cost
+    of sorting those values in features().
+    """
+
+    def __init__(self, counted: bool = False):
+        self._values_cls = _CountedValues if counted else _SortedValues
+        self._window = deque(maxlen=7)
+        self._baseline = {c: self._values_cls([]) for c in TREND_METRICS}
+        self._n = 0
+
+    @classmethod
+    def from_history(cls, df: pd.DataFrame, counted: bool = False) -> "IncrementalFeatures":
+        """
+        Build the state from a validated history (see load_and_validate).
+        """
+        state = cls(counted=counted)
+        rows = df[["date"] + NUM_COLS + ["notes"]].to_dict("records")
+        head, tail = rows[:-7], rows[-7:]
+        for c in TREND_METRICS:
+            vals = [float(r[c]) for r in head]
+            state._baseline[c] = state._values_cls([v for v in vals if not np.isnan(v)])
+        state._window.extend(_coerce_row(r) for r in tail)
+        state._n = len(rows)
+        return state
+
+    @property
+    def last_date(self) -> pd.Timestamp | None:
+        return self._window[-1]["date"] if self._window else None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def append(self, row: dict) -> None:
+        """
+        Append one day (a mapping with `date` + NUM_COLS, optional `notes`).
+        """
+        self._append_record(_coerce_row(row))
+
+    def _append_record(self, rec: dict) -> None:
+        # rec is already coerced: Timestamp date, float metrics, str notes
+        if self._window and rec["date"] <= self._window[-1]["date"]:
+            raise ValueError("Appended day must be later than the last recorded date.")
+        if len(self._window) == 7:
+            leaving = self._window[0]
+            for c in TREND_METRICS:
+                if not math.isnan(leaving[c]):  # math.isnan: this runs per row when streaming
+                    self._baseline[c].add(leaving[c])
+        self._window.append(rec)
+        self._n += 1
+
+    def _stats(self) -> dict:
+        # Unrounded numbers behind features(): baselines, last-7 means, MAD, coverage
+        if self._n < 10:
+            raise ValueError("Need at least ~10 days of data for meaningful baseline vs last7 comparison.")
+
+        last7 = list(self._window)
+        if self._n - 7 >= 5:
+            base = {c: self._baseline[c].median() for c in TREND_METRICS}
+            rhr_scale = self._baseline["resting_hr"].mad_scale()
+        else:
+            # short history: compute_features falls back to all but the last 3 days
+            prev = {}
+            for c in TREND_METRICS:
+                extra = [r[c] for r in last7[:4] if not np.isnan(r[c])]
+                prev[c] = sorted(list(self._baseline[c]) + extra)
+            base = {c: _median_sorted(prev[c]) for c in TREND_METRICS}
+            rhr_scale = _mad_scale_sorted(prev["resting_hr"])
+
+        return {
+            "last7": last7,
+            "base": base,
+            "last7_avg": {c: _window_mean([r[c] for r in last7]) for c in TREND_METRICS},
+            "rhr_scale": rhr_scale,
+            "days_present": len({r["date"] for r in last7}),
+            "wear_ok_days": sum(1 for r in last7 if r["wear_time_hours"] >= 12),
+            "missing_sleep_days": sum(1 for r in last7 if np.isnan(r["sleep_hours"])),
+            "missing_any_core_days": sum(
+                1 for r in last7 if any(np.isnan(r[c]) for c in ["steps", "resting_hr", "wear_time_hours"])
+            ),
+        }
+
+    def features(self, rules=None) -> dict:
+        """
+        Feature summary for the current history (same schema as compute_features).
+        """
+        st = self._stats()
+        last7 = st["last7"]
+        trends = {
+            c: _summarize_metric(st["base"][c], st["last7_avg"][c], kind)
+            for c, kind in TREND_KINDS.items()
+        }
+        flags = _build_flags(
+            trends, st["wear_ok_days"], st["missing_sleep_days"], st["missing_any_core_days"], st["rhr_scale"], rules
+        )
+        last7_notes = [r["notes"] for r in last7 if r["notes"].strip()]
+
+        return {
+            "window": {
+                "start": str(last7[0]["date"].date()),
+                "end": str(last7[-1]["date"].date()),
+            },
+            "coverage": {
+                "days_present": st["days_present"],
+                "wear_ok_days": st["wear_ok_days"],
+                "missing_sleep_days": st["missing_sleep_days"],
+                "missing_any_core_days": st["missing_any_core_days"],
+            },
+            "trends": trends,
+            "flags": flags,
+            "last7_notes": last7_notes[:5],
+        }
+
+
+def feature_timeseries(df: pd.DataFrame, rules=None) -> pd.DataFrame:
+    """
+    compute_features for every prefix of a validated history, in one forward pass.
+    One row per date from the 10th day on (indexed by date), with the
+    cohort_feature_table columns except notes: rounded trend values, MAD scale,
+    coverage counts, window bounds and flag_<TYPE> severities.
+    """
+    state = IncrementalFeatures()
+    dates = df["date"].tolist()
+    values = {c: df[c].to_numpy(dtype=float).tolist() for c in NUM_COLS}
+    rows = []
+    for i, date in enumerate(dates):
+        rec = {"date": date, "notes": ""}
+        for c in NUM_COLS:
+            rec[c] = values[c][i]
+        state._append_record(rec)
+        if state._n < 10:
+            continue
+        st = state._stats()
+        row = {"date": date, "window_start": str(st["last7"][0]["date"].date()), "window_end": str(date.date())}
+        for c, kind in TREND_KINDS.items():
+            t = _summarize_metric(st["base"][c], st["last7_avg"][c], kind)
+            row[f"{c}_baseline_median"] = t["baseline_median"]
+            row[f"{c}_last7_avg"] = t["last7_avg"]
+            row[f"{c}_delta"] = t["delta"]
+            row[f"{c}_delta_pct"] = t.get("delta_pct", float("nan"))
+            row[f"{c}_has_delta_pct"] = "delta_pct" in t
+        row["resting_hr_mad_scale"] = st["rhr_scale"]
+        for k in ["days_present", "wear_ok_days", "missing_sleep_days", "missing_any_core_days"]:
+            row[k] = st[k]
+        rows.append(row)
+
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+    table = table.set_index("date")
+    flags = compile_flag_rules(rules).flag_columns({c: table[c].to_numpy() for c in table.columns})
+    return table.assign(**flags)
+
+
+def _coerce_row(row: dict) -> dict:
+    missing = [c for c in ["date"] + NUM_COLS if c not in row]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    date = pd.to_datetime(row["date"], errors="coerce")
+    if pd.isna(date):
+        raise ValueError("Some 'date' values could not be parsed.")
+    rec = {"date": date}
+    for c in NUM_COLS:
+        v = pd.to_numeric(pd.Series([row[c]]), errors="coerce").iloc[0]
+        rec[c] = float(v)
+    notes = row.get("notes", "")
+    rec["notes"] = "" if notes is None or (isinstance(notes, float) and np.isnan(notes)) else str(notes)
+    return rec
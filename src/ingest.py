@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.features import NUM_COLS, IncrementalFeatures
+
+
+TABLE_SUFFIXES = (".csv", ".parquet", ".arrow", ".feather", ".ipc")
+
+
+def _suffix(name: str) -> str:
+    suffix = Path(name).suffix.lower()
+    if suffix not in TABLE_SUFFIXES:
+        raise ValueError(f"Unsupported file type '{suffix}'. Expected one of: {', '.join(TABLE_SUFFIXES)}")
+    return suffix
+
+
+def _read_arrow_ipc(source) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    # Paths are memory-mapped: numeric columns without nulls convert without copying the file
+    buf = pa.memory_map(str(source), "r") if isinstance(source, (str, Path)) else pa.BufferReader(source.read())
+    try:
+        table = ipc.open_file(buf).read_all()
+    except pa.ArrowInvalid:
+        buf.seek(0)
+        table = ipc.open_stream(buf).read_all()
+    return table.to_pandas()
+
+
+def read_table(source, name: str | None = None) -> pd.DataFrame:
+    """
+    Read daily aggregates from a path or a file-like object (e.g. a Streamlit upload).
+    The format is taken from the file suffix: CSV, Parquet, or Arrow IPC / Feather.
+    Columnar formats keep their stored dtypes, so load_and_validate can skip coercion.
+    """
+    name = name or getattr(source, "name", None) or str(source)
+    suffix = _suffix(name)
+
+    if suffix == ".csv":
+        return pd.read_csv(source)
+    if suffix == ".parquet":
+        return pd.read_parquet(source)
+    return _read_arrow_ipc(source)
+
+
+def write_table(df: pd.DataFrame, path: str | Path) -> None:
+    """
+    Write a frame as CSV, Parquet or Arrow IPC depending on the suffix.
+    """
+    suffix = _suffix(str(path))
+    if suffix == ".csv":
+        df.to_csv(path, index=False)
+    elif suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(path)
+
+
+@dataclass
+class StreamedFeatures:
+    """
+    Result of stream_csv_features: per-user incremental feature states plus
+    row-level validation errors (first `max_errors` kept, all counted).
+    """
+    states: dict = field(default_factory=dict)
+    rows_read: int = 0
+    rows_used: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    max_errors: int = 1000
+
+    def _error(self, line: int, user, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "user_id": user, "error": message})
+
+    def features(self) -> dict:
+        """
+        {user_id: compute_features-style dict}; users with < 10 days are omitted.
+        """
+        return {u: s.features() for u, s in self.states.items() if len(s) >= 10}
+
+
+def stream_csv_features(
+    source,
+    user_col: str = "user_id",
+    chunksize: int = 100_000,
+    max_errors: int = 1000,
+) -> StreamedFeatures:
+    """
+    Validate and coerce a (possibly multi-user, multi-year) CSV in chunks and
+    fold each row into a bounded per-user IncrementalFeatures state.
+
+    Only the last-7 window and baseline value counts are kept per user, so
+    peak memory depends on `chunksize` and the number of users, not on file
+    length. Rows must be in date order per user. Row-level problems are
+    reported instead of failing the whole file:
+      - unparseable date, or date not after the user's previous row: row skipped
+      - non-numeric metric value: value treated as missing (as load_and_validate does)
+    Without a `user_col` column the file is treated as one user with id "".
+    """
+    result = StreamedFeatures(max_errors=max_errors)
+    reader = pd.read_csv(source, chunksize=chunksize, dtype=str, keep_default_na=True)
+
+    for chunk in reader:
+        if result.rows_read == 0:
+            missing = [c for c in ["date"] + NUM_COLS if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing columns: {missing}")
+        result.rows_read += len(chunk)
+        lines = (chunk.index + 2).tolist()  # 1-based, after the header line
+
+        users = chunk[user_col].fillna("").tolist() if user_col in chunk.columns else [""] * len(chunk)
+        dates = pd.to_datetime(chunk["date"], errors="coerce")
+        cols = {}
+        for c in NUM_COLS:
+            raw = chunk[c]
+            num = pd.to_numeric(raw, errors="coerce")
+            for i in np.flatnonzero((num.isna() & raw.notna()).to_numpy()):
+                result._error(lines[i], users[i], f"Non-numeric {c} value {raw.iloc[i]!r}; treated as missing.")
+            cols[c] = num.to_numpy(dtype=float).tolist()  # Python floats, as in _coerce_row
+        notes = chunk["notes"].fillna("").tolist() if "notes" in chunk.columns else [""] * len(chunk)
+
+        date_list = dates.tolist()
+        for i, (line, user, date) in enumerate(zip(lines, users, date_list)):
+            if pd.isna(date):
+                result._error(line, user, f"Unparseable date {chunk['date'].iloc[i]!r}; row skipped.")
+                continue
+            state = result.states.get(user)
+            if state is None:
+                state = result.states[user] = IncrementalFeatures(counted=True)
+            last = state.last_date
+            if last is not None and date <= last:
+                result._error(line, user, f"Date {date.date()} is not after previous row ({last.date()}); row skipped.")
+                continue
+            rec = {"date": date, "notes": str(notes[i])}
+            for c in NUM_COLS:
+                rec[c] = cols[c][i]
+            state._append_record(rec)
+            result.rows_used += 1
+
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Intraday (minute-level) records -> daily schema
+# ---------------------------------------------------------------------------
+
+INTRADAY_REQUIRED = ["timestamp", "heart_rate", "steps", "worn"]
+INTRADAY_OPTIONAL = ["asleep", "in_bed", "hrv_ms"]
+# Sleep is credited to the day the night ends on: 23:00-07:00 counts for the next date
+SLEEP_DAY_OFFSET = pd.Timedelta(hours=6)
+MIN_SLEEP_HR_MINUTES = 60
+# A day is kept only if the user's records span its whole sleep window and
+# calendar day, give or take this much (see aggregate_intraday)
+EDGE_TOLERANCE = pd.Timedelta(hours=1)
+
+_DAY_SUMS = ["steps_sum", "steps_n", "worn_min", "still_hr_sum", "still_hr_n"]
+_SLEEP_SUMS = ["sleep_min", "in_bed_min", "sleep_hr_sum", "sleep_hr_n", "hrv_sum", "hrv_n"]
+
+
+def iter_table_chunks(source, chunksize: int = 1_000_000, columns=None):
+    """
+    Yield DataFrame chunks of at most ~`chunksize` rows from a CSV, Parquet or
+    Arrow IPC file (Arrow is memory-mapped), or pass through an iterable of frames.
+    """
+    if isinstance(source, pd.DataFrame):
+        yield source
+        return
+    if not isinstance(source, (str, Path)) and not hasattr(source, "read"):
+        yield from source
+        return
+
+    suffix = _suffix(getattr(source, "name", None) or str(source))
+    if suffix == ".csv":
+        yield from pd.read_csv(source, chunksize=chunksize, usecols=lambda c: columns is None or c in columns)
+    elif suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(source)
+        cols = None if columns is None else [c for c in pf.schema_arrow.names if c in columns]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=cols):
+            yield batch.to_pandas()
+    else:
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        buf = pa.memory_map(str(source), "r") if isinstance(source, (str, Path)) else pa.BufferReader(source.read())
+        try:
+            reader = ipc.open_file(buf)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            buf.seek(0)
+            batches = iter(ipc.open_stream(buf))
+        for batch in batches:
+            if columns is not None:
+                batch = batch.select([c for c in batch.schema.names if c in columns])
+            for start in range(0, batch.num_rows, chunksize):
+                yield batch.slice(start, chunksize).to_pandas()
+
+
+def _flag(chunk: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in chunk.columns:
+        return np.zeros(len(chunk), dtype=bool)
+    return pd.to_numeric(chunk[col], errors="coerce").fillna(0).to_numpy() > 0
+
+
+def _intraday_partials(chunk: pd.DataFrame, user_col: str, tz: str | None) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, int]:
+    # Per-chunk sums/counts keyed by (user, day); all mergeable across chunks
+    ts = pd.to_datetime(chunk["timestamp"], errors="coerce")
+    if isinstance(ts.dtype, pd.DatetimeTZDtype):
+        ts = (ts.dt.tz_convert(tz) if tz else ts).dt.tz_localize(None)
+    ok = ts.notna().to_numpy()
+    bad = int((~ok).sum())
+    chunk, ts = chunk[ok], ts[ok]
+
+    # Integer group keys (factorized users, day numbers) keep the groupby cheap
+    if user_col in chunk.columns:
+        codes, uniques = pd.factorize(chunk[user_col])
+        names = np.asarray(uniques.astype(str), dtype=object)
+    else:
+        codes, names = np.zeros(len(chunk), dtype=np.int64), np.array([""], dtype=object)
+    hr = pd.to_numeric(chunk["heart_rate"], errors="coerce").to_numpy(dtype=float)
+    steps = pd.to_numeric(chunk["steps"], errors="coerce").to_numpy(dtype=float)
+    hrv = (
+        pd.to_numeric(chunk["hrv_ms"], errors="coerce").to_numpy(dtype=float)
+        if "hrv_ms" in chunk.columns else np.full(len(chunk), np.nan)
+    )
+    worn = _flag(chunk, "worn")
+    asleep = _flag(chunk, "asleep")
+    in_bed = _flag(chunk, "in_bed") | asleep
+    has_hr = ~np.isnan(hr)
+    still = worn & has_hr & ~asleep & (np.nan_to_num(steps) == 0)
+    sleep_hr = asleep & has_hr
+    sleep_hrv = asleep & ~np.isnan(hrv)
+
+    day = ts.to_numpy().astype("datetime64[D]").view(np.int64)
+    sleep_day = (ts + SLEEP_DAY_OFFSET).to_numpy().astype("datetime64[D]").view(np.int64)
+
+    day_parts = pd.DataFrame({
+        "user": codes,
+        "day": day,
+        "steps_sum": np.nan_to_num(steps),
+        "steps_n": ~np.isnan(steps),
+        "worn_min": worn,
+        "still_hr_sum": np.where(still, hr, 0.0),
+        "still_hr_n": still,
+    }).groupby(["user", "day"], sort=False).sum()
+
+    m = in_bed  # only in-bed/asleep minutes contribute to the sleep partials
+    sleep_parts = pd.DataFrame({
+        "user": codes[m],
+        "day": sleep_day[m],
+        "sleep_min": asleep[m],
+        "in_bed_min": in_bed[m],
+        "sleep_hr_sum": np.where(sleep_hr, hr, 0.0)[m],
+        "sleep_hr_n": sleep_hr[m],
+        "hrv_sum": np.where(sleep_hrv, hrv, 0.0)[m],
+        "hrv_n": sleep_hrv[m],
+    }).groupby(["user", "day"], sort=False).sum()
+
+    t = ts.to_numpy().astype("datetime64[ns]").view(np.int64)
+    spans = pd.DataFrame({"user": codes, "first": t, "last": t}).groupby("user", sort=False).agg({"first": "min", "last": "max"})
+    spans.index = pd.Index(names[spans.index.to_numpy()], name="user")
+    return _name_users(day_parts, names), _name_users(sleep_parts, names), spans, bad
+
+
+def _name_users(parts: pd.DataFrame, names: np.ndarray) -> pd.DataFrame:
+    # Swap chunk-local user codes for user ids (on the small aggregated frame)
+    parts.index = pd.MultiIndex.from_arrays(
+        [names[parts.index.get_level_values("user").to_numpy()], parts.index.get_level_values("day")],
+        names=["user", "day"],
+    )
+    return parts
+
+
+def _merge_partials(parts: list[pd.DataFrame], columns: list[str]) -> pd.DataFrame:
+    if not parts:
+        empty = pd.MultiIndex.from_arrays([np.array([], dtype=object), np.array([], dtype=np.int64)], names=["user", "day"])
+        return pd.DataFrame({c: np.array([], dtype=float) for c in columns}, index=empty)
+    return pd.concat(parts).groupby(level=["user", "day"], sort=False).sum()
+
+
+def aggregate_intraday(
+    source,
+    user_col: str = "user_id",
+    chunksize: int = 1_000_000,
+    tz: str | None = None,
+    max_partial_rows: int = 2_000_000,
+) -> pd.DataFrame:
+    """
+    Aggregate minute-level records into the daily schema load_and_validate expects.
+
+    Input columns: timestamp, heart_rate (bpm), steps (per minute), worn (0/1);
+    optional asleep (0/1), in_bed (0/1), hrv_ms and a user column. Records are
+    read in chunks and reduced to per-(user, day) sums, so memory grows with
+    the number of user-days, not rows; order within the file does not matter.
+
+    Daily values:
+      steps             sum of minute steps
+      wear_time_hours   worn minutes / 60
+      sleep_hours       asleep minutes / 60 (NaN without sleep records)
+      sleep_efficiency  asleep / in-bed minutes
+      resting_hr        mean HR while asleep (>= MIN_SLEEP_HR_MINUTES), else mean
+                        HR of worn, awake minutes without steps
+      hrv_proxy         mean hrv_ms while asleep (NaN without an hrv_ms column)
+    Sleep is credited to the day the night ends on (SLEEP_DAY_OFFSET).
+    Days at the edges of a user's records are dropped unless the records cover
+    the whole calendar day and, with sleep columns, the night before it (from
+    SLEEP_DAY_OFFSET before midnight); otherwise the first day would hold half
+    a night and a phantom day after the last would hold only the final
+    evening's sleep. Rows with unparseable timestamps are dropped; the counts
+    are in df.attrs["dropped_rows"] and df.attrs["dropped_days"].
+    """
+    wanted = set(INTRADAY_REQUIRED + INTRADAY_OPTIONAL + [user_col])
+    day_parts, sleep_parts, span_parts = [], [], []
+    day_rows = sleep_rows = dropped = 0
+    seen_columns = has_users = has_sleep = False
+
+    for chunk in iter_table_chunks(source, chunksize=chunksize, columns=wanted):
+        if not seen_columns:
+            missing = [c for c in INTRADAY_REQUIRED if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing intraday columns: {missing}")
+            seen_columns, has_users = True, user_col in chunk.columns
+            has_sleep = "asleep" in chunk.columns or "in_bed" in chunk.columns
+        d, s, span, bad = _intraday_partials(chunk, user_col, tz)
+        dropped += bad
+        day_parts.append(d)
+        sleep_parts.append(s)
+        span_parts.append(span)
+        day_rows += len(d)
+        sleep_rows += len(s)
+        # Compact the partial sums so memory stays proportional to user-days
+        if day_rows + sleep_rows > max_partial_rows:
+            day_parts = [_merge_partials(day_parts, _DAY_SUMS)]
+            sleep_parts = [_merge_partials(sleep_parts, _SLEEP_SUMS)]
+            day_rows, sleep_rows = len(day_parts[0]), len(sleep_parts[0])
+            span_parts = [pd.concat(span_parts).groupby(level="user").agg({"first": "min", "last": "max"})]
+
+    if not seen_columns:
+        raise ValueError("No intraday records found.")
+
+    acc = _merge_partials(day_parts, _DAY_SUMS).join(_merge_partials(sleep_parts, _SLEEP_SUMS), how="outer")
+    acc = acc.fillna(0.0).sort_index()
+
+    # Edge days: keep a day only if the records span [day start - sleep offset, day end]
+    spans = pd.concat(span_parts).groupby(level="user").agg({"first": "min", "last": "max"})
+    users = acc.index.get_level_values("user")
+    day_start = acc.index.get_level_values("day").to_numpy() * 86_400_000_000_000
+    lead = (SLEEP_DAY_OFFSET if has_sleep else pd.Timedelta(0)) - EDGE_TOLERANCE
+    complete = (
+        (spans["first"].reindex(users).to_numpy() <= day_start - lead.value)
+        & (spans["last"].reindex(users).to_numpy() >= day_start + (pd.Timedelta(days=1) - EDGE_TOLERANCE).value)
+    )
+    dropped_days = int((~complete).sum())
+    acc = acc[complete]
+
+    def ratio(num: str, den: str, min_den: float = 1) -> np.ndarray:
+        n, d = acc[num].to_numpy(dtype=float), acc[den].to_numpy(dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(d >= min_den, n / d, np.nan)
+
+    sleep_min = acc["sleep_min"].to_numpy(dtype=float)
+    resting = np.where(
+        acc["sleep_hr_n"].to_numpy() >= MIN_SLEEP_HR_MINUTES,
+        ratio("sleep_hr_sum", "sleep_hr_n"),
+        ratio("still_hr_sum", "still_hr_n"),
+    )
+    daily = pd.DataFrame({
+        "date": pd.to_datetime(acc.index.get_level_values("day").to_numpy(), unit="D"),
+        "steps": np.where(acc["steps_n"].to_numpy() > 0, acc["steps_sum"].to_numpy(dtype=float), np.nan),
+        "resting_hr": np.round(resting, 1),
+        "sleep_hours": np.round(np.where(sleep_min > 0, sleep_min / 60.0, np.nan), 2),
+        "sleep_efficiency": np.round(ratio("sleep_min", "in_bed_min"), 3),
+        "hrv_proxy": np.round(ratio("hrv_sum", "hrv_n"), 1),
+        "wear_time_hours": np.round(acc["worn_min"].to_numpy(dtype=float) / 60.0, 2),
+        "notes": "",
+    })
+    if has_users:
+        daily.insert(0, user_col, acc.index.get_level_values("user").to_numpy())
+    daily.attrs["dropped_rows"] = dropped
+    daily.attrs["dropped_days"] = dropped_days
+    return daily
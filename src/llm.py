@@ -1,26 +1,366 @@
 from __future__ import annotations
 
+import contextvars
 import os
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import httpx
+import openai
 from openai import OpenAI
 
+from src import tracing
+from src.cache import get_response_cache, response_key
+
+
+@dataclass
+class ClientConfig:
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    timeout: float = 60.0
+    max_retries: int = 3
+    base_url: str | None = None
+
+    @classmethod
+    def from_env(cls) -> "ClientConfig":
+        env = os.environ.get
+        return cls(
+            max_connections=int(env("LLM_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(env("LLM_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            keepalive_expiry=float(env("LLM_KEEPALIVE_SECONDS", cls.keepalive_expiry)),
+            connect_timeout=float(env("LLM_CONNECT_TIMEOUT_SECONDS", cls.connect_timeout)),
+            timeout=float(env("LLM_TIMEOUT_SECONDS", cls.timeout)),
+            max_retries=int(env("LLM_MAX_RETRIES", cls.max_retries)),
+            base_url=env("OPENAI_BASE_URL") or None,
+        )
+
+
+# Per-call latency metrics (most recent last)
+CALL_METRICS: deque = deque(maxlen=200)
+_current_call: contextvars.ContextVar[dict | None] = contextvars.ContextVar("llm_current_call", default=None)
+
+_CLIENT: OpenAI | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _trace(event: str, info: dict) -> None:
+    # httpcore trace callback: only fires for new connections, so reused
+    # keep-alive connections report connect_ms == 0.
+    rec = _current_call.get()
+    if rec is None:
+        return
+    now = time.perf_counter()
+    if event.endswith("connect_tcp.started"):
+        rec["_connect_start"] = now
+    elif event.endswith(("connect_tcp.complete", "start_tls.complete")) and "_connect_start" in rec:
+        rec["connect_ms"] = (now - rec["_connect_start"]) * 1000.0
+
+
+def _on_request(request) -> None:
+    rec = _current_call.get()
+    if rec is None:
+        return
+    rec["attempts"] += 1
+    rec["_request_start"] = time.perf_counter()
+    request.extensions["trace"] = _trace
+
+
+def _on_response(response) -> None:
+    # Called once response headers arrive, before the body is read
+    rec = _current_call.get()
+    if rec is not None and "_request_start" in rec:
+        rec["ttfb_ms"] = (time.perf_counter() - rec["_request_start"]) * 1000.0
+
+
+def get_client(cfg: ClientConfig | None = None) -> OpenAI:
+    """
+    Process-wide OpenAI client with a pooled, keep-alive HTTP connection pool.
+    Configured once from ClientConfig.from_env() unless `cfg` is given.
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            cfg = cfg or ClientConfig.from_env()
+            limits = httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry,
+            )
+            timeout = openai.Timeout(cfg.timeout, connect=cfg.connect_timeout)
+            http_client = openai.DefaultHttpxClient(
+                limits=limits,
+                timeout=timeout,
+                event_hooks={"request": [_on_request], "response": [_on_response]},
+            )
+            _CLIENT = OpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                base_url=cfg.base_url,
+                timeout=timeout,
+                max_retries=cfg.max_retries,  # SDK retries with exponential backoff
+                http_client=http_client,
+            )
+        return _CLIENT
+
+
+def reset_client() -> None:
+    """
+    Close the shared client; the next call rebuilds it (e.g. after config changes).
+    """
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+        _CLIENT = None
+
 
 def _client() -> OpenAI:
     # Streamlit Cloud uses st.secrets; locally environment variable works.
     # We won't import streamlit here to keep it simple.
-    return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return get_client()
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: at most `per_minute` acquisitions per minute,
+    with bursts up to `burst`.
+    """
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def recent_call_metrics(n: int = 20) -> list[dict]:
+    """
+    Latency metrics of the last `n` generate_text / stream_text calls:
+    connect_ms, ttfb_ms, total_ms, attempts, cached (+ ttft_ms for streams),
+    prompt_chars and, for uncached calls, input/output/cached token usage.
+    """
+    return list(CALL_METRICS)[-n:]
 
 
-def generate_text(prompt: str, system: str, model: str = "gpt-4.1-mini") -> str:
+def prompt_cache_stats(n: int = 50) -> dict:
     """
-    Minimal call using OpenAI Responses API via the official SDK.
+    Provider-side prompt caching over the last `n` calls that reached the API:
+    calls, input_tokens, cached_tokens (as reported in usage) and cached_ratio.
     """
-    client = _client()
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    # SDK returns output items; simplest is output_text convenience:
-    return resp.output_text
+    calls = [r for r in recent_call_metrics(n) if r.get("input_tokens") is not None]
+    input_tokens = sum(r["input_tokens"] for r in calls)
+    cached_tokens = sum(r.get("cached_tokens") or 0 for r in calls)
+    return {
+        "calls": len(calls),
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "cached_ratio": cached_tokens / input_tokens if input_tokens else 0.0,
+    }
+
+
+def _new_record(model: str, prompt: str, system: str) -> dict:
+    return {
+        "model": model,
+        "cached": False,
+        "connect_ms": 0.0,
+        "ttfb_ms": None,
+        "total_ms": 0.0,
+        "attempts": 0,
+        "prompt_chars": len(prompt) + len(system),
+    }
+
+
+def _record_usage(rec: dict, usage) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    rec["input_tokens"] = getattr(usage, "input_tokens", None)
+    rec["output_tokens"] = getattr(usage, "output_tokens", None)
+    rec["cached_tokens"] = getattr(details, "cached_tokens", None) or 0
+
+
+def _finish_record(rec: dict, t0: float, name: str) -> None:
+    rec["total_ms"] = (time.perf_counter() - t0) * 1000.0
+    for k in [k for k in rec if k.startswith("_")]:
+        del rec[k]
+    CALL_METRICS.append(rec)
+    if tracing.enabled():
+        tracing.record(name, rec["total_ms"], **{k: v for k, v in rec.items() if k != "total_ms"})
+        tracing.count("llm_calls", model=rec["model"], cached=str(rec["cached"]).lower())
+        for k in ["input_tokens", "output_tokens", "cached_tokens"]:
+            if rec.get(k):
+                tracing.count(f"llm_{k}", rec[k], model=rec["model"])
+
+
+def _input(prompt: str, system: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def generate_text(prompt: str, system: str, model: str = "gpt-4.1-mini", use_cache: bool = True) -> str:
+    """
+    Minimal call using OpenAI Responses API via the shared pooled client.
+    With use_cache=False the cache lookup is skipped (fresh generation),
+    but the new response still replaces the cached one.
+    """
+    rec = _new_record(model, prompt, system)
+    t0 = time.perf_counter()
+    try:
+        cache = get_response_cache()
+        key = response_key(model, system, prompt)
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                rec["cached"] = True
+                return cached
+
+        token = _current_call.set(rec)
+        try:
+            resp = _client().responses.create(model=model, input=_input(prompt, system))
+        finally:
+            _current_call.reset(token)
+        _record_usage(rec, getattr(resp, "usage", None))
+        # SDK returns output items; simplest is output_text convenience:
+        text = resp.output_text
+        # Failed, incomplete or empty responses are returned but never cached
+        if getattr(resp, "status", "completed") == "completed" and text:
+            cache.set(key, text)
+        return text
+    finally:
+        _finish_record(rec, t0, "llm.generate_text")
+
+
+def stream_text(prompt: str, system: str, model: str = "gpt-4.1-mini", use_cache: bool = True) -> Iterator[str]:
+    """
+    Streaming variant of generate_text: yields text deltas as they arrive.
+    The assembled text is cached only if the stream ends with
+    response.completed and non-empty text; a cache hit yields the stored
+    text in one piece. Records ttft_ms (time to first token).
+    """
+    rec = _new_record(model, prompt, system)
+    rec["ttft_ms"] = None
+    t0 = time.perf_counter()
+    try:
+        cache = get_response_cache()
+        key = response_key(model, system, prompt)
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                rec["cached"] = True
+                rec["ttft_ms"] = (time.perf_counter() - t0) * 1000.0
+                yield cached
+                return
+
+        token = _current_call.set(rec)
+        try:
+            stream = _client().responses.create(model=model, input=_input(prompt, system), stream=True)
+        finally:
+            _current_call.reset(token)
+
+        parts = []
+        completed = False
+        with stream:
+            for event in stream:
+                if event.type == "response.output_text.delta" and event.delta:
+                    if rec["ttft_ms"] is None:
+                        rec["ttft_ms"] = (time.perf_counter() - t0) * 1000.0
+                    parts.append(event.delta)
+                    yield event.delta
+                elif event.type == "response.completed":
+                    completed = True
+                    _record_usage(rec, getattr(event.response, "usage", None))
+        text = "".join(parts)
+        if completed and text:
+            cache.set(key, text)
+    finally:
+        _finish_record(rec, t0, "llm.stream_text")
+
+
+def generate_many(
+    specs: list[dict],
+    max_concurrency: int = 4,
+    use_cache: bool = True,
+    rate_limiter: RateLimiter | None = None,
+) -> list[dict]:
+    """
+    Run several generate_text calls concurrently (bounded thread pool).
+    Each spec is {"prompt", "system", optional "model"}. Returns one
+    {"text", "error"} dict per spec, in order; a failing request sets
+    "error" and leaves the other results intact.
+    """
+    def run(spec: dict) -> dict:
+        try:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            text = generate_text(
+                spec["prompt"],
+                spec["system"],
+                model=spec.get("model", "gpt-4.1-mini"),
+                use_cache=use_cache,
+            )
+            return {"text": text, "error": None}
+        except Exception as e:
+            return {"text": None, "error": str(e) or type(e).__name__}
+
+    if not specs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(specs)))) as pool:
+        return list(pool.map(run, specs))
+
+
+def stream_many(specs: list[dict], max_concurrency: int = 4, use_cache: bool = True) -> Iterator[tuple[int, str | None, str | None]]:
+    """
+    Concurrent stream_text over several specs (same format as generate_many).
+    Yields (spec_index, delta, error) tuples in arrival order, so a single
+    thread (e.g. a Streamlit script) can render all outputs progressively.
+    A failed spec yields one tuple with `error` set; others keep streaming.
+    """
+    events: queue.Queue = queue.Queue()
+    done = object()
+
+    def run(i: int, spec: dict) -> None:
+        try:
+            for delta in stream_text(
+                spec["prompt"],
+                spec["system"],
+                model=spec.get("model", "gpt-4.1-mini"),
+                use_cache=use_cache,
+            ):
+                events.put((i, delta, None))
+        except Exception as e:
+            events.put((i, None, str(e) or type(e).__name__))
+        finally:
+            events.put(done)
+
+    if not specs:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(specs)))) as pool:
+        for i, spec in enumerate(specs):
+            pool.submit(run, i, spec)
+        remaining = len(specs)
+        while remaining:
+            item = events.get()
+            if item is done:
+                remaining -= 1
+            else:
+                yield item
@@ -1,5 +1,10 @@
 from __future__ import annotations
+import functools
 import json
+import os
+import re
+
+from src.tracing import traced
 
 
 SYSTEM_BASE = """You are a careful health data assistant.
@@ -14,14 +19,167 @@ Safety rules:
 - Always include a short "Data confidence" note grounded in coverage.
 """
 
+# "compact": minified JSON, each fact once; "json": indented JSON as sent originally
+PROMPT_ENCODINGS = ("compact", "json")
+PROMPT_ENCODING = os.environ.get("PROMPT_ENCODING", "compact")
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 4000))
+# Part of the budget kept for the task instruction and user text after the context block
+TASK_TOKEN_RESERVE = 600
+
+# Feature detail dropped, in this order, while a prompt is over its token budget.
+# Each step removes optional context or values derivable from what remains.
+BUDGET_STEPS = ["horizons", "delta_pct", "flag_rationale", "last7_notes"]
+SHARED_FLAGS = "see features.flags"
+
 
 def _json_block(obj: dict) -> str:
     return json.dumps(obj, indent=2, ensure_ascii=False)
 
 
-def build_user_summary_prompt(features: dict, escalation: dict, user_context: str | None) -> str:
-    ctx = user_context.strip() if user_context else ""
-    return f"""
+def _minify(obj: dict) -> str:
+    # Sorted keys: the same facts always serialize to the same bytes
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, sort_keys=True)
+
+
+@functools.lru_cache(maxsize=1)
+def _tokenizer():
+    # Optional: exact counts with tiktoken when it is installed and its
+    # encoding files are available; otherwise the regex estimate below.
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+# Roughly how BPE tokenizers split English and JSON: a word with its leading
+# space, up to 3 digits, a whitespace run, or 1-3 punctuation characters.
+_TOKEN_RE = re.compile(r" ?[A-Za-z]+| ?\d{1,3}|\s+|[^\sA-Za-z\d]{1,3}")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count of `text`: exact with tiktoken if available, else a local
+    estimate (long words count as several tokens).
+    """
+    enc = _tokenizer()
+    if enc is not None:
+        return len(enc.encode(text))
+    return sum(1 + len(piece) // 9 for piece in _TOKEN_RE.findall(text))
+
+
+def _prompt_attrs(prompt: str, *args, **kwargs) -> dict:
+    return {"chars": len(prompt), "tokens": estimate_tokens(prompt)}
+
+
+def _reduce_features(features: dict, drop: int) -> dict:
+    steps = BUDGET_STEPS[:drop]
+    out = dict(features)
+    if "horizons" in steps:
+        out.pop("horizons", None)
+    if "delta_pct" in steps:
+        out["trends"] = {m: {k: v for k, v in t.items() if k != "delta_pct"} for m, t in out["trends"].items()}
+    if "flag_rationale" in steps:
+        out["flags"] = [{k: v for k, v in f.items() if k != "rationale"} for f in out["flags"]]
+    if "last7_notes" in steps:
+        out.pop("last7_notes", None)
+    return out
+
+
+def encode_context(features: dict, escalation: dict, encoding: str | None = None, drop: int = 0) -> tuple[str, str]:
+    """
+    (escalation_text, features_text) as embedded in prompts.
+    "json" is indented JSON. "compact" is minified, key-sorted JSON that states
+    every fact once: escalation's copy of the flags becomes a reference to features.flags.
+    drop > 0 removes the first `drop` BUDGET_STEPS from the features.
+    """
+    encoding = encoding or PROMPT_ENCODING
+    if encoding not in PROMPT_ENCODINGS:
+        raise ValueError(f"Unknown prompt encoding {encoding!r}; expected one of {PROMPT_ENCODINGS}.")
+    if drop:
+        features = _reduce_features(features, drop)
+    if encoding == "json":
+        return _json_block(escalation), _json_block(features)
+    if "flags" in escalation and escalation["flags"] == features.get("flags"):
+        escalation = {**escalation, "flags": SHARED_FLAGS}
+    return _minify(escalation), _minify(features)
+
+
+def decode_context(escalation_text: str, features_text: str) -> tuple[dict, dict]:
+    """
+    Inverse of encode_context (either encoding, drop=0): (features, escalation).
+    """
+    features = json.loads(features_text)
+    escalation = json.loads(escalation_text)
+    if escalation.get("flags") == SHARED_FLAGS:
+        escalation["flags"] = features.get("flags", [])
+    return features, escalation
+
+
+def context_block(features: dict, escalation: dict, encoding: str | None = None, token_budget: int | None = None) -> str:
+    """
+    Leading block shared by every prompt for a dataset. It depends only on
+    (features, escalation, encoding, budget), so all task prompts for the same
+    data start with identical bytes and provider-side prefix caching can reuse it.
+    Detail is dropped (BUDGET_STEPS) until it fits the budget minus TASK_TOKEN_RESERVE.
+    """
+    budget = (PROMPT_TOKEN_BUDGET if token_budget is None else token_budget) - TASK_TOKEN_RESERVE
+    for drop in range(len(BUDGET_STEPS) + 1):
+        esc, feat = encode_context(features, escalation, encoding, drop)
+        block = f"Escalation (rule-based, do not override): {esc}\nFeatures: {feat}\n"
+        n = estimate_tokens(block)
+        if n <= budget:
+            return block
+    raise ValueError(f"Context needs ~{n} tokens even with reduced detail; {budget} are available.")
+
+
+def compose_prompt(block: str, task: str, token_budget: int | None = None) -> str:
+    """
+    Shared context block first, task-specific instruction last.
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    prompt = f"{block}\nTask:\n{task.strip()}"
+    n = estimate_tokens(prompt)
+    if n > budget:
+        raise ValueError(f"Prompt needs ~{n} tokens; the budget is {budget}.")
+    return prompt
+
+
+TRUNCATED_MARK = " [...]"
+
+
+def _compose_fitted(block: str, make_task, text: str, token_budget: int | None = None) -> str:
+    """
+    compose_prompt(block, make_task(text)), with the user-typed `text` cut at a
+    word boundary (marked TRUNCATED_MARK) if the prompt would exceed the budget.
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    prompt = f"{block}\nTask:\n{make_task(text).strip()}"
+    if not text or estimate_tokens(prompt) <= budget:
+        return compose_prompt(block, make_task(text), token_budget)
+    words = text.split()
+    lo, hi = 0, len(words)  # longest prefix of words that fits
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        cut = " ".join(words[:mid]) + TRUNCATED_MARK
+        if estimate_tokens(f"{block}\nTask:\n{make_task(cut).strip()}") <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return compose_prompt(block, make_task(" ".join(words[:lo]) + TRUNCATED_MARK if lo else ""), token_budget)
+
+
+@traced(attrs=_prompt_attrs)
+def build_user_summary_prompt(
+    features: dict,
+    escalation: dict,
+    user_context: str | None,
+    encoding: str | None = None,
+    token_budget: int | None = None,
+) -> str:
+    def task(ctx: str) -> str:
+        return f"""
 Generate a friendly weekly summary for a non-expert user.
 
 Include:
@@ -32,16 +190,22 @@ Include:
 5) If escalation is medium/high: suggest monitoring and consider clinician contact if symptoms or worsening.
 
 User context (optional, may be empty): "{ctx}"
+"""
 
-Escalation (rule-based, do not override): {_json_block(escalation)}
-
-Features: {_json_block(features)}
-""".strip()
+    ctx = user_context.strip() if user_context else ""
+    return _compose_fitted(context_block(features, escalation, encoding, token_budget), task, ctx, token_budget)
 
 
-def build_clinician_note_prompt(features: dict, escalation: dict, user_context: str | None) -> str:
-    ctx = user_context.strip() if user_context else ""
-    return f"""
+@traced(attrs=_prompt_attrs)
+def build_clinician_note_prompt(
+    features: dict,
+    escalation: dict,
+    user_context: str | None,
+    encoding: str | None = None,
+    token_budget: int | None = None,
+) -> str:
+    def task(ctx: str) -> str:
+        return f"""
 Write a concise clinician-facing summary (max ~180 words), structured like:
 
 - Time window:
@@ -52,40 +216,106 @@ Write a concise clinician-facing summary (max ~180 words), structured like:
 - Suggested follow-up (conservative; do not diagnose; do not prescribe):
 
 Patient context: "{ctx}"
+"""
 
-Escalation (rule-based, do not override): {_json_block(escalation)}
-
-Features: {_json_block(features)}
-""".strip()
+    ctx = user_context.strip() if user_context else ""
+    return _compose_fitted(context_block(features, escalation, encoding, token_budget), task, ctx, token_budget)
 
 
-def build_clarifying_question_prompt(features: dict, escalation: dict) -> str:
-    return f"""
+@traced(attrs=_prompt_attrs)
+def build_clarifying_question_prompt(
+    features: dict,
+    escalation: dict,
+    encoding: str | None = None,
+    token_budget: int | None = None,
+) -> str:
+    task = """
 You may ask AT MOST ONE clarifying question to improve interpretation.
 Choose the single best question that can reduce uncertainty.
 
 Ask a short question (one sentence), multiple choice if helpful.
 If data coverage is low, prioritize questions about device wear/adherence or context.
 
-Escalation: {_json_block(escalation)}
-Features: {_json_block(features)}
-
 Return only the question text.
-""".strip()
+"""
+    return compose_prompt(context_block(features, escalation, encoding, token_budget), task, token_budget)
 
 
-def build_update_summary_prompt(features: dict, escalation: dict, question: str, answer: str) -> str:
-    return f"""
+@traced(attrs=_prompt_attrs)
+def build_update_summary_prompt(
+    features: dict,
+    escalation: dict,
+    question: str,
+    answer: str,
+    encoding: str | None = None,
+    token_budget: int | None = None,
+) -> str:
+    def task(a: str) -> str:
+        return f"""
 Update the user summary given the user's answer to a clarifying question.
 Be consistent with the earlier constraints: no diagnosis, no medication advice, uncertainty-aware.
 
 Clarifying Q: "{question}"
-User A: "{answer}"
-
-Escalation (rule-based, do not override): {_json_block(escalation)}
-Features: {_json_block(features)}
+User A: "{a}"
 
 Output:
 - Updated summary (same format as before but slightly shorter)
 - One line: "How the answer changed interpretation"
+"""
+
+    return _compose_fitted(context_block(features, escalation, encoding, token_budget), task, answer or "", token_budget)
+
+
+CHAT_INSTRUCTIONS = (
+    "You are a helpful assistant for a wearable-data prototype. "
+    "Do not provide diagnosis or treatment. "
+    "Explain patterns, uncertainty, and next steps that involve human review."
+)
+NO_CONTEXT_BLOCK = "No wearable context available.\n"
+
+
+def _format_turns(turns: list[dict]) -> str:
+    return "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in turns)
+
+
+@traced(attrs=_prompt_attrs)
+def build_chat_prompt(
+    block: str | None,
+    summary: str,
+    turns: list[dict],
+    question: str,
+    token_budget: int | None = None,
+) -> str:
+    """
+    One chat turn: the shared context block first (see context_block), then
+    the running conversation summary, recent turns verbatim and the question.
+    The oldest verbatim turns are left out if needed to fit the budget.
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    head = f"{block or NO_CONTEXT_BLOCK}\nTask:\n{CHAT_INSTRUCTIONS}"
+    if summary:
+        head += f"\n\nConversation so far (summary): {summary}"
+    tail = f"\n\nUser question: {question}"
+    for start in range(len(turns) + 1):
+        recent = f"\n\nRecent turns:\n{_format_turns(turns[start:])}" if start < len(turns) else ""
+        prompt = head + recent + tail
+        n = estimate_tokens(prompt)
+        if n <= budget:
+            return prompt
+    raise ValueError(f"Chat prompt needs ~{n} tokens without history; the budget is {budget}.")
+
+
+@traced(attrs=_prompt_attrs)
+def build_chat_summary_prompt(summary: str, turns: list[dict]) -> str:
+    return f"""
+Update the running summary of a conversation between a user and a wearable-data assistant.
+Keep what the user reported (symptoms, context, routines), what they asked, and the key points
+of the answers. Do not add interpretation. Max ~120 words.
+
+Previous summary (may be empty): "{summary}"
+
+New turns:
+{_format_turns(turns)}
+
+Return only the updated summary.
 """.strip()
@@ -1,6 +1,13 @@
 from __future__ import annotations
 
+import numpy as np
+import pandas as pd
 
+from src.features import feature_timeseries
+from src.tracing import traced
+
+
+@traced(attrs=lambda out, features: {"level": out["level"], "flags": len(out["flags"])})
 def determine_escalation(features: dict) -> dict:
     """
     Conservative, rule-based escalation (NOT LLM).
@@ -58,3 +65,153 @@ def determine_escalation(features: dict) -> dict:
         "rationale": rationale,
         "flags": flags,
     }
+
+
+# ---------------------------------------------------------------------------
+# Table-driven escalation over many users
+# ---------------------------------------------------------------------------
+# Same logic as determine_escalation, written as ordered (value, predicate)
+# tables over columns. Predicates take a dict of equal-length arrays; the
+# first matching row wins and the last row is the default.
+
+CONFIDENCE_RULES = [
+    ("low", lambda c: (c["days_present"] < 6) | (c["wear_ok_days"] < 4)),
+    ("medium", lambda c: c["missing_sleep_days"] >= 2),
+    ("high", None),
+]
+
+ESCALATION_RULES = [
+    (
+        "high",
+        "Sustained RHR elevation plus substantial sleep reduction with usable coverage.",
+        lambda c: c["high_RHR_ELEVATED"] & c["high_SLEEP_REDUCED"] & (c["confidence"] != "low"),
+    ),
+    (
+        "high",
+        "Multiple high-severity flags with usable coverage.",
+        lambda c: (c["n_high"] >= 2) & (c["confidence"] != "low"),
+    ),
+    (
+        "high",
+        "Combination of high and multiple moderate flags with good coverage.",
+        lambda c: (c["n_high"] >= 1) & (c["n_moderate"] >= 2) & (c["confidence"] == "high"),
+    ),
+    (
+        "medium",
+        "Multiple moderate changes detected over the last 7 days.",
+        lambda c: (c["n_moderate"] >= 2) & (c["confidence"] != "low"),
+    ),
+    (
+        "medium",
+        "Potentially important change detected, but data coverage is limited.",
+        lambda c: (c["n_high"] == 1) & (c["confidence"] == "low"),
+    ),
+    (
+        "low",
+        "No strong sustained changes detected, or changes are within normal variation.",
+        None,
+    ),
+]
+
+
+def _first_match(predicates: list, cols: dict, n: int) -> np.ndarray:
+    # Index of the first predicate that holds per row; last index is the default
+    idx = np.full(n, len(predicates) - 1)
+    undecided = np.ones(n, dtype=bool)
+    for i, pred in enumerate(predicates[:-1]):
+        hit = undecided & np.asarray(pred(cols), dtype=bool)
+        idx[hit] = i
+        undecided &= ~hit
+    return idx
+
+
+def escalation_columns(cols: dict) -> dict:
+    """
+    Evaluate confidence and escalation for N users at once.
+    `cols` holds arrays: days_present, wear_ok_days, missing_sleep_days,
+    n_high, n_moderate, high_RHR_ELEVATED, high_SLEEP_REDUCED.
+    Returns arrays: confidence, level, rationale.
+    """
+    cols = {k: np.asarray(v) for k, v in cols.items()}
+    n = len(cols["days_present"])
+
+    conf_idx = _first_match([p for _, p in CONFIDENCE_RULES], cols, n)
+    confidence = np.asarray([v for v, _ in CONFIDENCE_RULES], dtype=object)[conf_idx]
+
+    esc_idx = _first_match([p for _, _, p in ESCALATION_RULES], {**cols, "confidence": confidence}, n)
+    level = np.asarray([v for v, _, _ in ESCALATION_RULES], dtype=object)[esc_idx]
+    rationale = np.asarray([r for _, r, _ in ESCALATION_RULES], dtype=object)[esc_idx]
+    return {"confidence": confidence, "level": level, "rationale": rationale}
+
+
+def escalation_from_table(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Escalation for a features.cohort_feature_table (one row per user).
+    Returns a frame with level, confidence and rationale columns.
+    """
+    if table.empty:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in ["level", "confidence", "rationale"]}, index=table.index)
+    sev = table[[c for c in table.columns if c.startswith("flag_")]].to_numpy(dtype=object)
+
+    def is_high(flag_type: str) -> np.ndarray:
+        col = f"flag_{flag_type}"
+        return table[col].to_numpy(dtype=object) == "high" if col in table else np.zeros(len(table), dtype=bool)
+
+    cols = {
+        "days_present": table["days_present"].to_numpy(),
+        "wear_ok_days": table["wear_ok_days"].to_numpy(),
+        "missing_sleep_days": table["missing_sleep_days"].to_numpy(),
+        "n_high": (sev == "high").sum(axis=1),
+        "n_moderate": (sev == "moderate").sum(axis=1),
+        "high_RHR_ELEVATED": is_high("RHR_ELEVATED"),
+        "high_SLEEP_REDUCED": is_high("SLEEP_REDUCED"),
+    }
+    out = escalation_columns(cols)
+    return pd.DataFrame(
+        {"level": out["level"], "confidence": out["confidence"], "rationale": out["rationale"]},
+        index=table.index,
+    )
+
+
+def determine_escalation_many(features_list: list[dict]) -> list[dict]:
+    """
+    determine_escalation for a list of feature dicts, evaluated column-wise.
+    Returns the same dicts determine_escalation would.
+    """
+    n = len(features_list)
+    cols = {k: np.zeros(n, dtype=int) for k in ["days_present", "wear_ok_days", "missing_sleep_days", "n_high", "n_moderate"]}
+    cols["high_RHR_ELEVATED"] = np.zeros(n, dtype=bool)
+    cols["high_SLEEP_REDUCED"] = np.zeros(n, dtype=bool)
+    for i, f in enumerate(features_list):
+        cov = f["coverage"]
+        cols["days_present"][i] = cov["days_present"]
+        cols["wear_ok_days"][i] = cov["wear_ok_days"]
+        cols["missing_sleep_days"][i] = cov["missing_sleep_days"]
+        for flag in f["flags"]:
+            if flag["severity"] == "high":
+                cols["n_high"][i] += 1
+                if flag["type"] in ("RHR_ELEVATED", "SLEEP_REDUCED"):
+                    cols[f"high_{flag['type']}"][i] = True
+            elif flag["severity"] == "moderate":
+                cols["n_moderate"][i] += 1
+
+    out = escalation_columns(cols)
+    return [
+        {"level": level, "confidence": conf, "rationale": [rationale], "flags": f["flags"]}
+        for f, level, conf, rationale in zip(features_list, out["level"], out["confidence"], out["rationale"])
+    ]
+
+
+LEVEL_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+
+def escalation_timeseries(df: pd.DataFrame, rules=None) -> pd.DataFrame:
+    """
+    Backtest: features, flags and escalation as of every date (from day 10 on).
+    Same per-date result as compute_features + determine_escalation on that
+    prefix, computed in one pass (see features.feature_timeseries).
+    """
+    table = feature_timeseries(df, rules=rules)
+    if table.empty:
+        return table
+    return table.join(escalation_from_table(table))
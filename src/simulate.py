@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from datetime import date, timedelta
 import numpy as np
@@ -89,3 +90,143 @@ def generate_simulated_user(cfg: SimConfig) -> pd.DataFrame:
         }
     )
     return df
+
+
+PROFILES = ["normal", "flu_like", "stressed", "missing_wear"]
+_PROFILE_NOTES = {
+    "flu_like": "simulated: flu-like week",
+    "stressed": "simulated: stress-like week",
+    "missing_wear": "simulated: low adherence / missing data",
+}
+
+
+def generate_simulated_cohort(
+    n_users: int,
+    days: int = 30,
+    profile_mix: dict | str = "normal",
+    seed: int = 7,
+) -> pd.DataFrame:
+    """
+    Many simulated users at once, as one long-format frame with a `user_id` column.
+
+    All baselines and noise are drawn as (n_users, days) arrays in the same
+    order generate_simulated_user draws them, so n_users=1 reproduces
+    generate_simulated_user(SimConfig(days, seed, profile)) exactly.
+    profile_mix is a profile name or {profile: weight}; profiles are assigned
+    from a separate stream derived from `seed`, so the assignment does not
+    shift the data draws.
+    """
+    if isinstance(profile_mix, str):
+        profile_mix = {profile_mix: 1.0}
+    unknown = [p for p in profile_mix if p not in PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown profiles: {unknown}")
+
+    names = list(profile_mix)
+    weights = np.asarray([profile_mix[p] for p in names], dtype=float)
+    assign_rng = np.random.default_rng([seed, 1])
+    profiles = np.asarray(names)[assign_rng.choice(len(names), size=n_users, p=weights / weights.sum())]
+
+    rng = np.random.default_rng(seed)
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    dates = pd.date_range(start=start, end=end, freq="D")
+    n = len(dates)
+    shape = (n_users, n)
+
+    # Baselines (one per user)
+    steps_base = rng.integers(6500, 9500, size=n_users)[:, None]
+    rhr_base = rng.integers(52, 66, size=n_users)[:, None]
+    sleep_base = rng.uniform(6.7, 7.9, size=n_users)[:, None]
+    eff_base = rng.uniform(0.84, 0.93, size=n_users)[:, None]
+    hrv_base = rng.uniform(35, 70, size=n_users)[:, None]
+    wear_base = rng.uniform(14, 22, size=n_users)[:, None]
+
+    steps = steps_base + rng.normal(0, 1200, size=shape)
+    rhr = rhr_base + rng.normal(0, 2.3, size=shape)
+    sleep = sleep_base + rng.normal(0, 0.55, size=shape)
+    eff = eff_base + rng.normal(0, 0.04, size=shape)
+    hrv = hrv_base + rng.normal(0, 6.0, size=shape)
+    wear = wear_base + rng.normal(0, 2.0, size=shape)
+
+    # Apply profiles in last 7 days, one vectorized block per profile
+    last7 = slice(max(0, n - 7), n)
+    k7 = n - last7.start
+    for profile in ["flu_like", "stressed", "missing_wear"]:
+        rows = np.flatnonzero(profiles == profile)
+        if len(rows) == 0:
+            continue
+        block = (rows[:, None], np.arange(last7.start, n)[None, :])
+        size = (len(rows), k7)
+        if profile == "flu_like":
+            steps[block] -= rng.uniform(1800, 3800, size=size)
+            rhr[block] += rng.uniform(4, 9, size=size)
+            sleep[block] -= rng.uniform(0.4, 1.2, size=size)
+            hrv[block] -= rng.uniform(4, 10, size=size)
+        elif profile == "stressed":
+            sleep[block] -= rng.uniform(0.5, 1.4, size=size)
+            eff[block] -= rng.uniform(0.05, 0.10, size=size)
+            rhr[block] += rng.uniform(2, 5, size=size)
+            steps[block] += rng.uniform(-600, 600, size=size)
+        else:
+            wear[block] -= rng.uniform(6, 12, size=size)
+            # Per-user draw keeps rng.choice's exact sequence (only these users loop)
+            last7_idx = np.arange(last7.start, n)
+            for r in rows:
+                missing_days = rng.choice(last7_idx, size=min(3, k7), replace=False)
+                sleep[r, missing_days] = np.nan
+                eff[r, missing_days] = np.nan
+
+    notes = np.full(shape, "", dtype=object)
+    if n:
+        notes[:, last7.start] = [_PROFILE_NOTES.get(p, "") for p in profiles]
+
+    # Clip to plausible ranges
+    steps = _clip(steps, 0, 25000)
+    rhr = _clip(rhr, 40, 110)
+    sleep = _clip(sleep, 0, 12)
+    eff = _clip(eff, 0.5, 0.99)
+    hrv = _clip(hrv, 10, 130)
+    wear = _clip(wear, 0, 24)
+
+    width = len(str(max(n_users - 1, 0)))
+    user_ids = np.char.add("sim_", np.char.zfill(np.arange(n_users).astype(str), width))
+    df = pd.DataFrame(
+        {
+            "user_id": np.repeat(user_ids, n),
+            "date": np.tile(dates.date.astype(str), n_users),
+            "steps": np.round(steps).astype(int).ravel(),
+            "resting_hr": np.round(rhr, 1).ravel(),
+            "sleep_hours": np.round(sleep, 2).ravel(),
+            "sleep_efficiency": np.round(eff, 2).ravel(),
+            "hrv_proxy": np.round(hrv, 1).ravel(),
+            "wear_time_hours": np.round(wear, 1).ravel(),
+            "notes": notes.ravel(),
+        }
+    )
+    return df
+
+
+def write_simulated_cohort_shards(
+    out_dir: str,
+    n_users: int,
+    days: int = 30,
+    profile_mix: dict | str = "normal",
+    seed: int = 7,
+    users_per_shard: int = 10_000,
+) -> list[str]:
+    """
+    Generate a large cohort as Parquet shards to keep memory bounded.
+    Shard i uses seed [seed, i], so shards are reproducible independently.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i, start in enumerate(range(0, n_users, users_per_shard)):
+        k = min(users_per_shard, n_users - start)
+        shard_seed = int(np.random.SeedSequence([seed, i]).generate_state(1)[0])
+        df = generate_simulated_cohort(k, days=days, profile_mix=profile_mix, seed=shard_seed)
+        df["user_id"] = [f"sim_{i:04d}_{u[4:]}" for u in df["user_id"]]
+        path = os.path.join(out_dir, f"cohort_{i:04d}.parquet")
+        df.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
@@ -1,15 +1,238 @@
 from __future__ import annotations
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 
+from src.cache import dataset_fingerprint, get_memo_cache
+from src.features import compute_features
+from src.rules import determine_escalation, escalation_timeseries
+
+
+DEFAULT_STORE_PATH = os.path.join(".cache", "store.sqlite")
+
+# Derived artifacts and the source files whose code they depend on
+ARTIFACT_SOURCES = {
+    "features": ["features.py"],
+    "escalation": ["features.py", "rules.py"],
+    "escalation_ts": ["features.py", "rules.py"],
+    "agent_outputs": ["features.py", "rules.py", "prompts.py"],
+}
+# Artifacts restored with their dataset (escalation_ts is only memoized
+# in-process; agent_outputs is stored per input variant, see agent_outputs_variant)
+STORED_ARTIFACTS = ["features", "escalation"]
+_VERSIONS: dict[str, str] = {}
+
+
+def artifact_version(kind: str) -> str:
+    """
+    Code/rules version of an artifact kind: hash of the source files it depends on.
+    Editing thresholds, rules or prompts changes the version, so stored
+    artifacts computed by older code are no longer returned.
+    """
+    if kind not in _VERSIONS:
+        h = hashlib.sha256()
+        for name in ARTIFACT_SOURCES[kind]:
+            h.update((Path(__file__).parent / name).read_bytes())
+        _VERSIONS[kind] = h.hexdigest()[:16]
+    return _VERSIONS[kind]
+
+
+class StorageBackend(ABC):
+    """
+    Persistent store for datasets and derived artifacts (JSON-serializable
+    values), keyed by dataset hash + artifact kind + version.
+    """
+
+    @abstractmethod
+    def put_dataset(self, key: str, df: pd.DataFrame) -> None:
+        ...
+
+    @abstractmethod
+    def get_dataset(self, key: str) -> pd.DataFrame | None:
+        ...
+
+    @abstractmethod
+    def put_artifact(self, key: str, kind: str, version: str, value) -> None:
+        ...
+
+    @abstractmethod
+    def get_artifact(self, key: str, kind: str, version: str):
+        """
+        The stored value, or None if missing or stored under another version.
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class MemoryStorage(StorageBackend):
+    """
+    In-process backend (no persistence); keeps the `max_datasets` most recent.
+    """
+
+    def __init__(self, max_datasets: int = 20):
+        self.max_datasets = max_datasets
+        self._datasets: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._artifacts: dict[tuple[str, str], tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def put_dataset(self, key: str, df: pd.DataFrame) -> None:
+        with self._lock:
+            self._datasets[key] = df.copy()
+            self._datasets.move_to_end(key)
+            while len(self._datasets) > self.max_datasets:
+                old, _ = self._datasets.popitem(last=False)
+                self._artifacts = {k: v for k, v in self._artifacts.items() if k[0] != old}
+
+    def get_dataset(self, key: str) -> pd.DataFrame | None:
+        with self._lock:
+            df = self._datasets.get(key)
+            if df is None:
+                return None
+            self._datasets.move_to_end(key)
+            return df.copy()
+
+    def put_artifact(self, key: str, kind: str, version: str, value) -> None:
+        with self._lock:
+            self._artifacts[(key, kind)] = (version, json.dumps(value, ensure_ascii=False))
+
+    def get_artifact(self, key: str, kind: str, version: str):
+        with self._lock:
+            hit = self._artifacts.get((key, kind))
+        if hit is None or hit[0] != version:
+            return None
+        return json.loads(hit[1])
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._datasets.pop(key, None)
+            self._artifacts = {k: v for k, v in self._artifacts.items() if k[0] != key}
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Local SQLite backend. Datasets are stored as Parquet blobs, artifacts as
+    JSON; one row per (dataset, kind) so a newer version replaces the old one.
+    Least-recently-used datasets beyond `max_datasets` are evicted with their artifacts.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_datasets: int = 50):
+        self.path = path
+        self.max_datasets = max_datasets
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS datasets ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL, rows INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " key TEXT NOT NULL, kind TEXT NOT NULL, version TEXT NOT NULL,"
+            " value TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (key, kind))"
+        )
+        self._db.commit()
+
+    def put_dataset(self, key: str, df: pd.DataFrame) -> None:
+        buf = io.BytesIO()
+        df.to_parquet(buf, index=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO datasets (key, data, rows, created_at, last_access) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET last_access = excluded.last_access",
+                (key, buf.getvalue(), len(df), now, now),
+            )
+            stale = self._db.execute(
+                "SELECT key FROM datasets ORDER BY last_access DESC LIMIT -1 OFFSET ?", (self.max_datasets,)
+            ).fetchall()
+            for (old,) in stale:
+                self._delete(old)
+            self._db.commit()
+
+    def get_dataset(self, key: str) -> pd.DataFrame | None:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM datasets WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE datasets SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return pd.read_parquet(io.BytesIO(row[0]))
+
+    def put_artifact(self, key: str, kind: str, version: str, value) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO artifacts (key, kind, version, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, version, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+    def get_artifact(self, key: str, kind: str, version: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, value FROM artifacts WHERE key = ? AND kind = ?", (key, kind)
+            ).fetchone()
+        if row is None or row[0] != version:
+            return None
+        return json.loads(row[1])
+
+    def _delete(self, key: str) -> None:
+        self._db.execute("DELETE FROM datasets WHERE key = ?", (key,))
+        self._db.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._delete(key)
+            self._db.commit()
+
+
+_STORE: StorageBackend | None = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> StorageBackend:
+    """
+    Process-wide storage backend. STORE_PATH overrides the SQLite file
+    location (set it to an empty string for an in-memory store).
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            path = os.environ.get("STORE_PATH", DEFAULT_STORE_PATH)
+            _STORE = SQLiteStorage(path) if path else MemoryStorage()
+        return _STORE
+
+
+def _load_artifacts(key: str) -> None:
+    # Restore whatever is stored for this dataset under the current code version
+    store = get_store()
+    for kind in STORED_ARTIFACTS:
+        st.session_state[kind] = store.get_artifact(key, kind, artifact_version(kind))
+
 
 def init_state() -> None:
     if "df" not in st.session_state:
         st.session_state.df = None
+    if "dataset_hash" not in st.session_state:
+        st.session_state.dataset_hash = None
     if "features" not in st.session_state:
         st.session_state.features = None
     if "escalation" not in st.session_state:
         st.session_state.escalation = None
+    if "escalation_ts" not in st.session_state:
+        st.session_state.escalation_ts = None
     if "clarifying_q" not in st.session_state:
         st.session_state.clarifying_q = None
     if "clarifying_a" not in st.session_state:
@@ -17,12 +240,116 @@ def init_state() -> None:
     if "agent_outputs" not in st.session_state:
         st.session_state.agent_outputs = None
 
+    # The dataset hash lives in the URL (?ds=...) so a browser refresh or a
+    # new session can pick up the stored dataset and its artifacts.
+    key = st.session_state.dataset_hash
+    if key is None and st.query_params.get("ds"):
+        df = get_store().get_dataset(st.query_params["ds"])
+        if df is not None:
+            key = st.query_params["ds"]
+            st.session_state.df = df
+            st.session_state.dataset_hash = key
+            _load_artifacts(key)
+    if key is not None and st.query_params.get("ds") != key:
+        st.query_params["ds"] = key
+
 
 def set_df(df: pd.DataFrame) -> None:
+    key = dataset_fingerprint(df)
+    if key == st.session_state.get("dataset_hash"):
+        return  # same content: keep everything already computed
+
     st.session_state.df = df
-    # Invalidate downstream cached artifacts
-    st.session_state.features = None
-    st.session_state.escalation = None
+    st.session_state.dataset_hash = key
+    get_store().put_dataset(key, df)
+    st.query_params["ds"] = key
+
+    # Downstream artifacts: reuse stored ones that match the current code version
+    _load_artifacts(key)
+    st.session_state.agent_outputs = None
+    st.session_state.escalation_ts = None
     st.session_state.clarifying_q = None
     st.session_state.clarifying_a = None
-    st.session_state.agent_outputs = None
+
+
+def agent_outputs_variant(model: str, user_context: str | None, question: str | None = None, answer: str | None = None) -> str:
+    """
+    Store variant of agent_outputs: a hash of every input besides the dataset.
+    Generated text embeds the user's typed context and answers, so it is only
+    returned to someone who generates from the same dataset and the same inputs.
+    """
+    payload = json.dumps([model, user_context or "", question or "", answer or ""], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _store_kind(kind: str, variant: str | None) -> str:
+    return f"{kind}:{variant}" if variant else kind
+
+
+def save_artifact(kind: str, value, variant: str | None = None) -> None:
+    """
+    Store a derived artifact for the current dataset and keep it in session state.
+    `variant` separates artifacts that also depend on user inputs.
+    """
+    st.session_state[kind] = value
+    key = st.session_state.get("dataset_hash")
+    if key is not None and value is not None:
+        get_store().put_artifact(key, _store_kind(kind, variant), artifact_version(kind), value)
+
+
+def load_artifact(kind: str, variant: str | None = None):
+    """
+    Stored artifact for the current dataset and code version, or None.
+    """
+    key = st.session_state.get("dataset_hash")
+    if key is None:
+        return None
+    return get_store().get_artifact(key, _store_kind(kind, variant), artifact_version(kind))
+
+
+def current_dataset_key() -> str:
+    """
+    Fingerprint of the session's dataset (cached in session state by set_df).
+    """
+    return st.session_state.get("dataset_hash") or dataset_fingerprint(st.session_state.df)
+
+
+def _memo_key(kind: str) -> tuple:
+    return (kind, current_dataset_key(), artifact_version(kind))
+
+
+def ensure_features() -> dict:
+    """
+    Features for the current dataset: session state, else the store (restored
+    by set_df), else the process-wide memo, else compute_features.
+    Raises ValueError like compute_features for unusable data.
+    """
+    if st.session_state.get("features") is None:
+        df = st.session_state.df
+        save_artifact("features", get_memo_cache().get_or_compute(_memo_key("features"), lambda: compute_features(df)))
+    return st.session_state.features
+
+
+def ensure_escalation() -> dict:
+    """
+    Rule-based escalation for the current dataset (same lookup order as ensure_features).
+    """
+    if st.session_state.get("escalation") is None:
+        features = ensure_features()
+        save_artifact(
+            "escalation",
+            get_memo_cache().get_or_compute(_memo_key("escalation"), lambda: determine_escalation(features)),
+        )
+    return st.session_state.escalation
+
+
+def ensure_escalation_ts() -> pd.DataFrame:
+    """
+    Per-day escalation backtest for the current dataset (session state or memo).
+    """
+    if st.session_state.get("escalation_ts") is None:
+        df = st.session_state.df
+        st.session_state.escalation_ts = get_memo_cache().get_or_compute(
+            _memo_key("escalation_ts"), lambda: escalation_timeseries(df)
+        )
+    return st.session_state.escalation_ts
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _stub_text(model: str, prompt: str) -> str:
+    words = prompt.split()
+    return f"[stub {model}] " + " ".join(words[:24])
+
+
+def _response_body(model: str, text: str, input_tokens: int, cached_tokens: int = 0) -> dict:
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens": len(text.split()),
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + len(text.split()),
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # keep test output quiet
+        pass
+
+    def do_POST(self):
+        server: StubLLMServer = self.server.stub  # type: ignore[attr-defined]
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server._record(payload)
+
+        if server.fail_next > 0:
+            server.fail_next -= 1
+            self._send_json(500, {"error": {"message": "stub failure", "type": "server_error"}})
+            return
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        model = payload.get("model", "stub")
+        messages = payload.get("input", [])
+        prompt = "\n".join(str(m.get("content", "")) for m in messages if isinstance(m, dict))
+        tokens = prompt.split()
+        text = _stub_text(model, messages[-1].get("content", "") if messages else "")
+        body = _response_body(model, text, len(tokens), server._cached_prefix(tokens))
+        if payload.get("stream"):
+            self._send_stream(body, text, server.token_delay)
+        else:
+            self._send_json(200, body)
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body: dict, text: str, token_delay: float):
+        # Server-sent events over chunked transfer encoding, one delta per word
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload: dict):
+            data = f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+        seq = 0
+        event({"type": "response.created", "sequence_number": seq, "response": {**body, "status": "in_progress", "output": []}})
+        item_id = body["output"][0]["id"]
+        words = text.split(" ")
+        for i, w in enumerate(words):
+            seq += 1
+            if token_delay:
+                time.sleep(token_delay)
+            event({
+                "type": "response.output_text.delta",
+                "sequence_number": seq,
+                "item_id": item_id,
+                "output_index": 0,
+                "content_index": 0,
+                "delta": w if i == len(words) - 1 else w + " ",
+                "logprobs": [],
+            })
+        event({"type": "response.completed", "sequence_number": seq + 1, "response": body})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class StubLLMServer:
+    """
+    Local stand-in for the OpenAI Responses API (POST /v1/responses).
+    Deterministic replies (JSON or SSE when "stream" is set), optional
+    latency and injected 500s; no network.
+
+    Prompt caching is emulated like the provider's: usage reports as cached
+    the longest prefix (whitespace tokens) shared with an earlier request,
+    once it reaches `cache_min_tokens`, in steps of `cache_block`.
+
+        with StubLLMServer(delay=0.05) as stub:
+            os.environ["OPENAI_BASE_URL"] = stub.base_url
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        delay: float = 0.0,
+        token_delay: float = 0.0,
+        cache_min_tokens: int = 1024,
+        cache_block: int = 128,
+    ):
+        self.delay = delay
+        self.token_delay = token_delay
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_block = cache_block
+        self.fail_next = 0
+        self.requests: list[dict] = []
+        self._prompts: deque = deque(maxlen=256)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self  # type: ignore[attr-defined]
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _record(self, payload: dict) -> None:
+        with self._lock:
+            self.requests.append(payload)
+
+    def _cached_prefix(self, tokens: list[str]) -> int:
+        with self._lock:
+            best = 0
+            for prev in self._prompts:
+                n = 0
+                for a, b in zip(prev, tokens):
+                    if a != b:
+                        break
+                    n += 1
+                best = max(best, n)
+            self._prompts.append(tokens)
+        if best < self.cache_min_tokens:
+            return 0
+        return best // self.cache_block * self.cache_block
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
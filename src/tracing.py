@@ -0,0 +1,304 @@
+"""
+Lightweight spans and counters for the pipeline.
+
+Off by default; TRACE_ENABLED=1 (or enable()) turns it on. While disabled,
+span() returns a shared no-op object and count() returns immediately, so
+instrumented code pays a single flag check.
+
+    with span("compute_features", rows=len(df)) as sp:
+        ...
+        sp.set(flags=3)
+
+Finished root spans are kept as traces (the last TRACE_MAX_TRACES, default
+200) together with their child spans. TRACE_JSONL_PATH appends each trace
+to a JSONL file; prometheus_text() renders counters and span durations, and
+TRACE_METRICS_PORT serves both at /metrics and /traces (see start_metrics_server).
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_enabled = os.environ.get("TRACE_ENABLED", "").lower() in ("1", "true", "yes")
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+_lock = threading.Lock()
+
+TRACES: deque = deque(maxlen=int(os.environ.get("TRACE_MAX_TRACES", 200)))
+_pending: dict[str, list[dict]] = {}  # trace_id -> finished child spans
+_counters: dict[tuple, float] = {}  # (name, sorted labels) -> value
+_durations: dict[str, list[float]] = {}  # span name -> [count, sum_ms]
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    """
+    Turn tracing on or off for the whole process.
+    """
+    global _enabled
+    _enabled = on
+
+
+def reset() -> None:
+    """
+    Drop all recorded traces, counters and durations.
+    """
+    with _lock:
+        TRACES.clear()
+        _pending.clear()
+        _counters.clear()
+        _durations.clear()
+
+
+class _NoopSpan:
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    One timed operation. Use through span(); attributes are plain JSON values.
+    """
+
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "_t0", "_token")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.start = time.time()
+        self._token = _current.set(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration_ms = (time.perf_counter() - self._t0) * 1000.0
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _finish(self.name, self.trace_id, self.span_id, self.parent_id, self.start, duration_ms, self.attrs)
+
+
+def span(name: str, **attrs):
+    """
+    Context manager timing a block as a span (child of the current span, if any).
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def record(name: str, duration_ms: float, **attrs) -> None:
+    """
+    Record an already-measured operation (e.g. a generator that yielded across
+    the caller's code) as a child of the current span.
+    """
+    if not _enabled:
+        return
+    parent = _current.get()
+    _finish(
+        name,
+        parent.trace_id if parent else uuid.uuid4().hex[:16],
+        uuid.uuid4().hex[:16],
+        parent.span_id if parent else None,
+        time.time() - duration_ms / 1000.0,
+        duration_ms,
+        attrs,
+    )
+
+
+def _finish(name: str, trace_id: str, span_id: str, parent_id: str | None, start: float, duration_ms: float, attrs: dict) -> None:
+    rec = {
+        "name": name,
+        "trace_id": trace_id,
+        "span_id": span_id,
+        "parent_id": parent_id,
+        "start": round(start, 6),
+        "duration_ms": round(duration_ms, 3),
+        "attrs": attrs,
+    }
+    trace = None
+    with _lock:
+        d = _durations.setdefault(name, [0, 0.0])
+        d[0] += 1
+        d[1] += duration_ms
+        if parent_id is not None:
+            _pending.setdefault(trace_id, []).append(rec)
+            return
+        # Root span: children always finish first
+        trace = {
+            "trace_id": trace_id,
+            "name": name,
+            "start": rec["start"],
+            "duration_ms": rec["duration_ms"],
+            "spans": _pending.pop(trace_id, []) + [rec],
+        }
+        TRACES.append(trace)
+    path = os.environ.get("TRACE_JSONL_PATH")
+    if path:
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(trace, ensure_ascii=False, default=str) + "\n")
+
+
+def traced(name: str | None = None, attrs=None):
+    """
+    Decorator running the function inside a span. `attrs(result, *args, **kwargs)`
+    returns extra attributes (input sizes, token counts); it is only called
+    while tracing is enabled.
+    """
+    def deco(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}) as sp:
+                out = fn(*args, **kwargs)
+                if attrs is not None:
+                    sp.attrs.update(attrs(out, *args, **kwargs))
+                return out
+
+        return wrapper
+
+    return deco
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """
+    Add `value` to a counter (labels become Prometheus labels).
+    """
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def recent_traces(n: int = 20) -> list[dict]:
+    with _lock:
+        return list(TRACES)[-n:]
+
+
+def counters() -> dict[str, float]:
+    """
+    Counters as {"name{label=value,...}": value}.
+    """
+    with _lock:
+        items = list(_counters.items())
+    return {name + _labels(labels): value for (name, labels), value in sorted(items)}
+
+
+def export_jsonl(path: str) -> int:
+    """
+    Write the retained traces to `path`, one JSON object per line; returns the count.
+    """
+    traces = recent_traces(len(TRACES) or 1)
+    with open(path, "w", encoding="utf-8") as fh:
+        for t in traces:
+            fh.write(json.dumps(t, ensure_ascii=False, default=str) + "\n")
+    return len(traces)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+
+def prometheus_text(prefix: str = "wearable") -> str:
+    """
+    Counters and per-span duration totals in the Prometheus text format.
+    """
+    with _lock:
+        counter_items = sorted(_counters.items())
+        duration_items = sorted((k, list(v)) for k, v in _durations.items())
+    lines = []
+    seen = set()
+    for (name, labels), value in counter_items:
+        metric = f"{prefix}_{name}_total"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value:g}")
+    if duration_items:
+        metric = f"{prefix}_span_duration_ms"
+        lines.append(f"# TYPE {metric} summary")
+        for name, (n, total) in duration_items:
+            lines.append(f'{metric}_count{{span="{name}"}} {n:g}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {total:.3f}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body, ctype = prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/traces"):
+            body = "".join(json.dumps(t, default=str) + "\n" for t in recent_traces(len(TRACES) or 1))
+            ctype = "application/x-ndjson"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+_SERVER: ThreadingHTTPServer | None = None
+
+
+def start_metrics_server(port: int | None = None, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """
+    Serve /metrics (Prometheus text) and /traces (JSONL) on a local port, once
+    per process. Without `port`, uses TRACE_METRICS_PORT and does nothing if unset.
+    """
+    global _SERVER
+    with _lock:
+        if _SERVER is not None:
+            return _SERVER
+        if port is None:
+            if not os.environ.get("TRACE_METRICS_PORT"):
+                return None
+            port = int(os.environ["TRACE_METRICS_PORT"])
+        _SERVER = ThreadingHTTPServer((host, port), _MetricsHandler)
+        _SERVER.daemon_threads = True
+        threading.Thread(target=_SERVER.serve_forever, daemon=True).start()
+        return _SERVER
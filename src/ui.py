@@ -1,6 +1,11 @@
 # src/ui.py
+import json
+
 import streamlit as st
 
+from src import tracing
+from src.cache import get_response_cache
+
 def _chip(label: str, value: str, ok: bool | None = None) -> None:
     """
     Small helper to render a compact 'status chip' without relying on new Streamlit components.
@@ -24,10 +29,15 @@ def ensure_model_state() -> None:
     if "selected_model" not in st.session_state:
         st.session_state.selected_model = "gpt-4.1-mini"
 
+def ensure_cache_state() -> None:
+    if "use_llm_cache" not in st.session_state:
+        st.session_state.use_llm_cache = True
+
 # 2️⃣ Sidebar controls SECOND
 def render_sidebar_controls() -> None:
     ensure_demo_mode_state()
     ensure_model_state()
+    ensure_cache_state()
 
     with st.sidebar:
         st.markdown("### Prototype Controls")
@@ -49,10 +59,60 @@ def render_sidebar_controls() -> None:
             help="Selected once for the session; used by agent summary and chat.",
         )
 
+        st.session_state.use_llm_cache = st.toggle(
+            "Reuse cached LLM responses",
+            value=st.session_state.use_llm_cache,
+            help="Identical prompts return the stored response. Turn off to force fresh generations.",
+        )
+        if not st.session_state.demo_mode:
+            stats = get_response_cache().stats
+            st.caption(
+                f"LLM cache: {stats['memory_hits'] + stats['disk_hits']} hits / {stats['misses']} misses"
+            )
+            render_trace_panel()
+
         st.markdown("---")
         st.markdown("[ℹ️ About / Framework](./About_Framework)")
 
 
+def _span_attrs(attrs: dict) -> str:
+    return ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in attrs.items() if v is not None)
+
+
+def render_trace_panel(n: int = 10) -> None:
+    """
+    Debug panel (non-demo mode): the last `n` traces and counters.
+    Recording is process-wide, so it is switched by TRACE_ENABLED, not from a session.
+    """
+    with st.expander("Pipeline traces (debug)"):
+        if not tracing.enabled():
+            st.caption("Tracing is off. Set TRACE_ENABLED=1 to record traces.")
+            return
+        tracing.start_metrics_server()  # only if TRACE_METRICS_PORT is set
+
+        traces = tracing.recent_traces(n)
+        if not traces:
+            st.caption("No traces recorded yet.")
+            return
+        for t in reversed(traces):
+            lines = [
+                f"{'↳ ' if s['parent_id'] else ''}{s['name']}: {s['duration_ms']:.1f} ms"
+                + (f" ({_span_attrs(s['attrs'])})" if s["attrs"] else "")
+                for s in t["spans"]
+            ]
+            st.caption("  \n".join(lines))
+        counts = tracing.counters()
+        if counts:
+            st.caption("  \n".join(f"{k}: {v:g}" for k, v in counts.items()))
+        st.download_button(
+            "Download traces (JSONL)",
+            "".join(json.dumps(t, default=str) + "\n" for t in traces),
+            file_name="traces.jsonl",
+            mime="application/x-ndjson",
+        )
+        st.download_button("Download metrics (Prometheus)", tracing.prometheus_text(), file_name="metrics.prom", mime="text/plain")
+
+
 # 3️⃣ Header LAST
 def render_header(page_title: str) -> None:
     render_sidebar_controls()
@@ -82,6 +142,7 @@ def render_header(page_title: str) -> None:
     Render a consistent header + status chips.
     Call this at the top of each page after init_state().
     """
+    tracing.count("page_runs", page=page_title)
     render_sidebar_controls()
 
     st.title(page_title)